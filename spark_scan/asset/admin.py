@@ -1,4 +1,10 @@
 from django.contrib import admin
 from .models import Asset 
 
-admin.site.register(Asset)
\ No newline at end of file
+
+@admin.register(Asset)
+class AssetAdmin(admin.ModelAdmin):
+    
+    def save_model(self, request, obj, form, change):
+        # The counters are shifted by complaints, never written from the form
+        obj.save(update_fields=Asset.fields_without_counters() if change else None)
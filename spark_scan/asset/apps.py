@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AssetConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'asset'
+
+    def ready(self):
+        # Register map cache invalidation handlers
+        from . import signals  # noqa: F401
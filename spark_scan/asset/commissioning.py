@@ -0,0 +1,185 @@
+"""
+Batch commissioning for field crews that sync several records at once.
+
+Each record carries a client-chosen idempotency key. Records are
+validated with CommissioningForm's rules, the accepted ones are written
+with one bulk_update per batch, and every applied record leaves a
+CommissioningReceipt so a retry of the same key returns the stored result
+instead of commissioning again. QR images of the commissioned assets are
+rendered once the batch has committed, outside its transaction.
+"""
+from django.db import IntegrityError, transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from spark_scan import live
+from . import lifecycle, map_cache, qr, sync, vector_tiles
+from .forms import CommissioningForm, RebindableFormMixin
+from .models import Asset, AssetTransition, CommissioningReceipt
+
+BATCH_MAX_RECORDS = 500
+
+# Columns written by a commissioning record
+COMMISSIONING_FIELDS = CommissioningForm.Meta.fields + ['status', 'geohash', 'updated_at']
+
+
+class CommissioningRecordForm(RebindableFormMixin, CommissioningForm):
+    """CommissioningForm for one record of a batch"""
+
+
+def _rejected(record, errors, asset=None):
+    return {
+        'idempotency_key': record.get('idempotency_key'),
+        'asset_id': asset.pk if asset else record.get('asset_id'),
+        'status': 'rejected',
+        'errors': errors,
+    }
+
+
+def _asset_id(record):
+    try:
+        return int(record.get('asset_id'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _load_assets(records):
+    """Assets referenced by asset_id or asset_number, two queries at most"""
+    ids = {_asset_id(record) for record in records} - {None}
+    numbers = {
+        str(record['asset_number']) for record in records
+        if _asset_id(record) is None and record.get('asset_number')
+    }
+    by_id = Asset.objects.in_bulk(ids) if ids else {}
+    by_number = Asset.objects.in_bulk(numbers, field_name='asset_number') if numbers else {}
+    return by_id, by_number
+
+
+def _validate(records, root):
+    """
+    Split records into results (replays and rejections, by position) and
+    the (position, asset, result) triples to apply.
+    """
+    results = [None] * len(records)
+    keys = [record.get('idempotency_key') if isinstance(record, dict) else None for record in records]
+    receipts = CommissioningReceipt.objects.in_bulk([key for key in keys if isinstance(key, str)], field_name='key')
+    by_id, by_number = _load_assets([record for record in records if isinstance(record, dict)])
+
+    accepted = []
+    seen_keys, seen_assets = set(), set()
+    form = CommissioningRecordForm()
+    for position, record in enumerate(records):
+        if not isinstance(record, dict):
+            results[position] = _rejected({}, {'__all__': ['Record must be an object.']})
+            continue
+
+        key = record.get('idempotency_key')
+        if not isinstance(key, str) or not key or len(key) > 100:
+            results[position] = _rejected(record, {'idempotency_key': ['A key of 1 to 100 characters is required.']})
+            continue
+        if key in seen_keys:
+            results[position] = _rejected(record, {'idempotency_key': ['Key used twice in this batch.']})
+            continue
+        seen_keys.add(key)
+
+        asset_id = _asset_id(record)
+        asset = by_id.get(asset_id) if asset_id is not None else by_number.get(str(record.get('asset_number')))
+
+        # Already applied: same answer as the first time
+        if key in receipts:
+            receipt = receipts[key]
+            if asset is not None and receipt.asset_id != asset.pk:
+                results[position] = _rejected(record, {'idempotency_key': ['Key already used for another asset.']}, asset)
+            else:
+                results[position] = {**receipt.result, 'replayed': True}
+            continue
+
+        if asset is None:
+            results[position] = _rejected(record, {'asset_id': ['Asset not found.']})
+            continue
+        if asset.pk in seen_assets:
+            results[position] = _rejected(record, {'asset_id': ['Asset commissioned twice in this batch.']}, asset)
+            continue
+        if asset.status != 'PROVISIONED':
+            results[position] = _rejected(record, {'asset_id': ['Asset is not in PROVISIONED status.']}, asset)
+            continue
+
+        form.rebind(record, instance=asset)
+        if not form.is_valid():
+            errors = {name: list(messages) for name, messages in form.errors.items()}
+            results[position] = _rejected(record, errors, asset)
+            continue
+
+        seen_assets.add(asset.pk)
+        url = qr.complaint_url(asset, root)
+        accepted.append((position, asset, {
+            'idempotency_key': key,
+            'asset_id': asset.pk,
+            'asset_number': asset.asset_number,
+            'status': 'commissioned',
+            'qr_code': reverse('asset:qr_image', kwargs={'digest': qr.digest(url)}),
+        }))
+    return results, accepted
+
+
+def _after_commit(assets, root):
+    """What the Asset post_save signals would do (bulk_update skips them), then the QR images"""
+    map_cache.bump_version()
+    # Provisioned assets are not on the tiles, only where they are now
+    vector_tiles.invalidate_points((asset.latitude, asset.longitude) for asset in assets)
+    for asset in assets:
+        live.publish('asset.commissioned', asset_id=asset.pk, asset_number=asset.asset_number)
+    qr.ensure_qr_codes(assets, root)
+
+
+def commission_batch(records, root):
+    """
+    Apply a batch of commissioning records (dicts with idempotency_key,
+    asset_id or asset_number and the CommissioningForm fields). Returns one
+    result per record, in order. root is the site URL for the QR codes.
+    """
+    if len(records) > BATCH_MAX_RECORDS:
+        raise ValueError(f'At most {BATCH_MAX_RECORDS} records per batch.')
+
+    results, accepted = _validate(records, root)
+    assets = [asset for _, asset, _ in accepted]
+    now = timezone.now()
+    for asset in assets:
+        asset.status = 'COMMISSIONED'
+        asset.updated_at = now
+        asset.update_geohash()
+
+    if accepted:
+        try:
+            with transaction.atomic():
+                # Assets commissioned by someone else since they were loaded
+                taken = set(
+                    Asset.objects.filter(pk__in=[asset.pk for asset in assets]).exclude(
+                        status='PROVISIONED'
+                    ).values_list('pk', flat=True)
+                )
+                for position, asset, result in accepted:
+                    if asset.pk in taken:
+                        results[position] = _rejected(result, {'asset_id': ['Asset is not in PROVISIONED status.']}, asset)
+                accepted = [entry for entry in accepted if entry[1].pk not in taken]
+                assets = [asset for _, asset, _ in accepted]
+
+                Asset.objects.bulk_update(assets, COMMISSIONING_FIELDS, batch_size=100)
+                CommissioningReceipt.objects.bulk_create([
+                    CommissioningReceipt(key=result['idempotency_key'], asset=asset, result=result)
+                    for _, asset, result in accepted
+                ])
+                sync.record_changes(asset.pk for asset in assets)
+                lifecycle.record_transitions(
+                    (asset.pk for asset in assets), 'PROVISIONED', 'COMMISSIONED', AssetTransition.COMMISSION, now
+                )
+                transaction.on_commit(lambda: _after_commit(assets, root))
+        except IntegrityError:
+            # A key was stored by a concurrent request with the same batch
+            for position, asset, result in accepted:
+                results[position] = _rejected(result, {'idempotency_key': ['Key is being applied by another request, retry.']}, asset)
+            return results
+
+        for position, asset, result in accepted:
+            results[position] = result
+    return results
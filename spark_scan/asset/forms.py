@@ -1,7 +1,42 @@
 from django import forms
 from .models import Asset
 
-class ProvisioningForm(forms.ModelForm):
+
+class CounterSafeFormMixin:
+    """
+    Saves an edited asset without its complaint counters, which complaints
+    submitted while the form was open may have changed.
+    """
+    
+    def save(self, commit=True):
+        instance = super().save(commit=False)
+        if commit:
+            instance.save(update_fields=None if instance._state.adding else Asset.fields_without_counters())
+            self._save_m2m()
+        return instance
+
+
+class RebindableFormMixin:
+    """
+    Validate many records with one form instance: building a form
+    deep-copies every field, which dominates bulk imports/updates.
+
+    Used by the file importer (importer.ImportRowForm, one form per chunk
+    of new assets) and the commissioning batch API
+    (commissioning.CommissioningRecordForm, bound to each existing asset).
+    """
+
+    def rebind(self, data, instance=None):
+        """Bind the next record, with the errors and instance of the last one dropped"""
+        self.data = data
+        self.is_bound = True
+        self._errors = None
+        self._bound_fields_cache = {}
+        self.instance = instance if instance is not None else self._meta.model()
+        return self
+
+
+class ProvisioningForm(CounterSafeFormMixin, forms.ModelForm):
     """Form for provisioning assets (planning phase)"""
     
     provisioning_date = forms.DateField(
@@ -47,7 +82,7 @@ class ProvisioningForm(forms.ModelForm):
         }
 
 
-class CommissioningForm(forms.ModelForm):
+class CommissioningForm(CounterSafeFormMixin, forms.ModelForm):
     """Form for commissioning assets (installation phase)"""
     
     commissioning_date = forms.DateField(
@@ -63,7 +98,6 @@ class CommissioningForm(forms.ModelForm):
             'latitude',
             'longitude',
             'actual_cost',
-            'qr_code',
         ]
         widgets = {
             'commissioned_by': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Your name'}),
@@ -71,7 +105,6 @@ class CommissioningForm(forms.ModelForm):
             'latitude': forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'e.g., 8.8932', 'step': '0.000001'}),
             'longitude': forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'e.g., 76.6141', 'step': '0.000001'}),
             'actual_cost': forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'e.g., 25000.00'}),
-            'qr_code': forms.FileInput(attrs={'class': 'form-control'}),
         }
         labels = {
             'commissioning_date': 'Commissioning Date',
@@ -80,14 +113,10 @@ class CommissioningForm(forms.ModelForm):
             'latitude': 'Latitude',
             'longitude': 'Longitude',
             'actual_cost': 'Actual Cost (₹)',
-            'qr_code': 'QR Code Image',
         }
     
     def save(self, commit=True):
-        instance = super().save(commit=False)
         # Automatically change status to COMMISSIONED
-        instance.status = 'COMMISSIONED'
-        if commit:
-            instance.save()
-        return instance
+        self.instance.status = 'COMMISSIONED'
+        return super().save(commit)
     
@@ -0,0 +1,153 @@
+"""
+Geohash spatial key for assets and the proximity queries built on it.
+
+Assets store a geohash of their coordinates in an indexed column. A
+geohash prefix is a rectangular cell, so "all assets in a cell" is an
+index range scan (prefix <= geohash < prefix + '{') that works on
+plain SQLite without any spatial extension.
+"""
+import math
+
+from django.db.models import Q
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+
+# Sorts after every geohash character, closes a prefix range
+_RANGE_END = '{'
+
+# Upper bound of cells used to cover a bounding box
+MAX_COVER_CELLS = 32
+
+EARTH_RADIUS_M = 6371000.0
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Geohash of a point"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    latitude, longitude = float(latitude), float(longitude)
+
+    chars = []
+    bits, bit_count, even = 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lng_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(lat_height, lng_width) in degrees of a geohash cell"""
+    lng_bits = math.ceil(precision * 5 / 2)
+    lat_bits = math.floor(precision * 5 / 2)
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lng_bits)
+
+
+def cover_bbox(bbox, max_cells=MAX_COVER_CELLS):
+    """
+    Geohash prefixes whose cells cover a (south, west, north, east) box,
+    using the finest precision that needs at most max_cells cells.
+    """
+    south, west, north, east = bbox
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_step, lng_step = cell_size(precision)
+        rows = int(north // lat_step) - int(south // lat_step) + 1
+        cols = int(east // lng_step) - int(west // lng_step) + 1
+        if rows * cols <= max_cells:
+            break
+
+    prefixes = set()
+    lat = south
+    while True:
+        lng = west
+        while True:
+            prefixes.add(encode(min(lat, 90.0), min(lng, 180.0), precision))
+            if lng >= east:
+                break
+            lng = min(lng + lng_step, east)
+        if lat >= north:
+            break
+        lat = min(lat + lat_step, north)
+    return sorted(prefixes)
+
+
+def prefix_filter(prefixes):
+    """Q object matching assets whose geohash starts with any prefix (index ranges)"""
+    query = Q()
+    for prefix in prefixes:
+        query |= Q(geohash__gte=prefix, geohash__lt=prefix + _RANGE_END)
+    return query
+
+
+def filter_bbox(queryset, bbox):
+    """Assets of queryset inside a (south, west, north, east) box"""
+    south, west, north, east = bbox
+    return queryset.filter(prefix_filter(cover_bbox(bbox))).filter(
+        latitude__gte=south,
+        latitude__lte=north,
+        longitude__gte=west,
+        longitude__lte=east,
+    )
+
+
+def distance_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance in metres (haversine)"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (float(lat1), float(lng1), float(lat2), float(lng2)))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def radius_bbox(latitude, longitude, radius_m):
+    """Bounding box (south, west, north, east) around a circle"""
+    latitude, longitude = float(latitude), float(longitude)
+    lat_delta = math.degrees(radius_m / EARTH_RADIUS_M)
+    lng_delta = lat_delta / max(math.cos(math.radians(latitude)), 1e-6)
+    return (
+        max(latitude - lat_delta, -90.0),
+        max(longitude - lng_delta, -180.0),
+        min(latitude + lat_delta, 90.0),
+        min(longitude + lng_delta, 180.0),
+    )
+
+
+def within_radius(queryset, latitude, longitude, radius_m):
+    """
+    Assets of queryset within radius_m metres of a point.
+
+    Returns a list of (asset, distance_m) tuples ordered by distance.
+    """
+    candidates = filter_bbox(queryset, radius_bbox(latitude, longitude, radius_m))
+    results = []
+    for asset in candidates:
+        distance = distance_m(latitude, longitude, asset.latitude, asset.longitude)
+        if distance <= radius_m:
+            results.append((asset, distance))
+    results.sort(key=lambda item: item[1])
+    return results
+
+
+def nearest(queryset, latitude, longitude, k=5, max_radius_m=50000):
+    """
+    The k assets of queryset nearest to a point, as (asset, distance_m) tuples.
+
+    The search radius starts small and doubles until k assets are found,
+    each step is an indexed radius query over a few geohash cells.
+    """
+    radius = 100.0
+    while True:
+        found = within_radius(queryset, latitude, longitude, radius)
+        if len(found) >= k or radius >= max_radius_m:
+            return found[:k]
+        radius = min(radius * 2, max_radius_m)
@@ -0,0 +1,224 @@
+"""
+Bulk provisioning from CSV/XLSX files.
+
+Rows are read one at a time and handled in chunks of IMPORT_CHUNK_SIZE:
+each row is validated by ImportRowForm (ProvisioningForm's rules), the
+asset numbers of a chunk are checked against the database in one query,
+and the valid rows are inserted with bulk_create in the chunk's own
+transaction. Only the current chunk and the first IMPORT_SHOWN_ERRORS
+row errors are held in memory, whatever the file size; every error is
+written to the error report (a file) as its chunk is done.
+"""
+import csv
+import io
+from dataclasses import dataclass, field
+
+from django.db import IntegrityError, transaction
+
+from . import lifecycle, map_cache, sync
+from .forms import ProvisioningForm, RebindableFormMixin
+from .models import Asset, AssetTransition
+
+IMPORT_CHUNK_SIZE = 500
+
+IMPORT_FORMATS = ['csv', 'xlsx']
+
+# Columns of an import file (header row), in the template's order
+IMPORT_COLUMNS = ProvisioningForm.Meta.fields
+
+# Error reports of uploads (default storage)
+REPORT_DIRECTORY = 'import_reports'
+
+# Row errors kept on the ImportResult for display, the report has them all
+IMPORT_SHOWN_ERRORS = 200
+
+
+class ImportRowForm(RebindableFormMixin, ProvisioningForm):
+    """ProvisioningForm for file rows; uniqueness is checked per chunk instead"""
+
+    def validate_unique(self):
+        pass
+
+
+@dataclass
+class RowError:
+    row: int
+    asset_number: str
+    field: str
+    message: str
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    rows: int = 0
+    error_count: int = 0
+    # The first max_errors errors, in row order
+    errors: list = field(default_factory=list)
+    max_errors: int = IMPORT_SHOWN_ERRORS
+    # csv writer of the error report (see error_report), if any
+    report: object = field(default=None, repr=False)
+
+    def add_chunk(self, created, errors):
+        """Count the chunk's assets; count, keep (up to max_errors) and report its errors"""
+        self.created += created
+        errors.sort(key=lambda error: error.row)
+        self.error_count += len(errors)
+        self.errors.extend(errors[:max(self.max_errors - len(self.errors), 0)])
+        if self.report is not None:
+            self.report.writerows(
+                [error.row, error.asset_number, error.field, error.message] for error in errors
+            )
+
+
+def _header(name):
+    return str(name or '').strip().lower().replace(' ', '_')
+
+
+def read_csv(fileobj):
+    """Yield row dicts from a binary CSV file (UTF-8, optional BOM)"""
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    try:
+        reader = csv.reader(text)
+        header = [_header(name) for name in next(reader, [])]
+        for values in reader:
+            if any(value.strip() for value in values):
+                yield dict(zip(header, values))
+    finally:
+        text.detach()
+
+
+def read_xlsx(fileobj):
+    """Yield row dicts from the first sheet of an XLSX workbook (needs openpyxl)"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError('XLSX import needs the openpyxl package, upload a CSV file instead.')
+
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [_header(name) for name in next(rows, ())]
+        for values in rows:
+            if any(value not in (None, '') for value in values):
+                yield {
+                    name: '' if value is None else value
+                    for name, value in zip(header, values)
+                }
+    finally:
+        workbook.close()
+
+
+def read_rows(fileobj, file_format):
+    if file_format not in IMPORT_FORMATS:
+        raise ValueError(f'format must be one of {", ".join(IMPORT_FORMATS)}.')
+    return read_csv(fileobj) if file_format == 'csv' else read_xlsx(fileobj)
+
+
+def format_from_name(filename):
+    return 'xlsx' if filename.lower().endswith('.xlsx') else 'csv'
+
+
+def _form_data(row):
+    data = {}
+    for name in IMPORT_COLUMNS:
+        value = row.get(name, '')
+        if hasattr(value, 'date') and name == 'provisioning_date':
+            # Excel dates come as datetimes
+            value = value.date()
+        data[name] = value.strip() if isinstance(value, str) else value
+    return data
+
+
+def _import_chunk(chunk, dry_run):
+    """
+    Validate and insert one chunk of (row number, row dict).
+    Returns the number of assets created (or valid) and the row errors.
+    """
+    errors = []
+    valid = []
+    seen = set()
+    form = ImportRowForm()
+    for row_number, row in chunk:
+        form.rebind(_form_data(row))
+        if not form.is_valid():
+            asset_number = str(row.get('asset_number', '')).strip()
+            for name, messages in form.errors.items():
+                for message in messages:
+                    errors.append(RowError(row_number, asset_number, name, message))
+            continue
+        asset_number = form.cleaned_data['asset_number']
+        if asset_number in seen:
+            errors.append(RowError(row_number, asset_number, 'asset_number', 'Duplicate asset number in this file.'))
+            continue
+        seen.add(asset_number)
+        valid.append((row_number, form.save(commit=False)))
+
+    # One query for the whole chunk instead of one per row
+    existing = set(Asset.objects.filter(asset_number__in=seen).values_list('asset_number', flat=True))
+    pending = []
+    for row_number, asset in valid:
+        if asset.asset_number in existing:
+            errors.append(RowError(
+                row_number, asset.asset_number, 'asset_number', 'Asset with this Asset Number already exists.'
+            ))
+        else:
+            asset.update_geohash()
+            pending.append((row_number, asset))
+
+    if dry_run or not pending:
+        return len(pending), errors
+
+    # bulk_create skips save() and the post_save signals: feed the
+    # change log, the status history and the map cache version directly
+    try:
+        with transaction.atomic():
+            created = Asset.objects.bulk_create([asset for _, asset in pending])
+            sync.record_changes(asset.pk for asset in created)
+            lifecycle.record_transitions(
+                (asset.pk for asset in created), None, 'PROVISIONED', AssetTransition.PROVISION
+            )
+            transaction.on_commit(map_cache.bump_version)
+    except IntegrityError:
+        # An asset number was taken after the check, the chunk was rolled back
+        for row_number, asset in pending:
+            errors.append(RowError(
+                row_number, asset.asset_number, 'asset_number',
+                'Not imported: an asset number of this chunk was created concurrently, import the row again.'
+            ))
+        return 0, errors
+    return len(created), errors
+
+
+def import_assets(rows, chunk_size=IMPORT_CHUNK_SIZE, dry_run=False, progress=None, report=None,
+                  max_errors=IMPORT_SHOWN_ERRORS):
+    """
+    Provision assets from row dicts (see read_rows). Returns an
+    ImportResult; rows with errors are skipped, the others are created
+    (or only validated with dry_run). All row errors are written to the
+    text file object ``report`` (CSV) as they are found, the result keeps
+    the first ``max_errors``.
+    """
+    result = ImportResult(max_errors=max_errors, report=error_report(report) if report is not None else None)
+    chunk = []
+    # Row 1 is the header
+    for row_number, row in enumerate(rows, start=2):
+        chunk.append((row_number, row))
+        result.rows += 1
+        if len(chunk) == chunk_size:
+            result.add_chunk(*_import_chunk(chunk, dry_run))
+            chunk = []
+            if progress:
+                progress(result)
+    if chunk:
+        result.add_chunk(*_import_chunk(chunk, dry_run))
+        if progress:
+            progress(result)
+    return result
+
+
+def error_report(fileobj):
+    """csv writer of the rejected rows to a text file object, header written"""
+    writer = csv.writer(fileobj)
+    writer.writerow(['row', 'asset_number', 'field', 'message'])
+    return writer
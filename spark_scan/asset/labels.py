@@ -0,0 +1,256 @@
+"""
+Bulk QR sticker sheets for field teams.
+
+Labels are rendered (asset.qr_render.render_label) and written, in asset
+order, either as a ZIP of PNGs or as an A4 PDF with LABEL_COLUMNS x
+LABEL_ROWS stickers per page. Both are written as the labels come in, one
+sheet in memory at a time, so a download can be streamed while rendering.
+Large batches go through the generate_qr_labels command, which renders in
+a process pool; web requests render in their own process.
+"""
+import os
+import re
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from PIL import Image
+
+from . import listing, qr
+from .models import Asset
+from .qr_render import LABEL_SIZE, render_label
+
+LABEL_FORMATS = ['pdf', 'zip']
+
+# A4 at 200 dpi
+PAGE_SIZE = (1654, 2339)
+PAGE_RESOLUTION = 200
+LABEL_COLUMNS = 3
+LABEL_ROWS = 4
+
+# Below this many labels starting worker processes costs more than it saves
+POOL_MIN_LABELS = 50
+
+# Labels handed to a worker at a time
+POOL_CHUNK_SIZE = 25
+
+
+def select_assets(asset_group='', status='', id_from=None, id_to=None, asset_type='', search=''):
+    """Assets of a label batch: the asset list filters (see listing.filter_assets) plus an id range"""
+    assets = listing.filter_assets(
+        Asset.objects.all(), asset_type=asset_type, status=status, asset_group=asset_group, search=search,
+    )
+    if id_from is not None:
+        assets = assets.filter(pk__gte=id_from)
+    if id_to is not None:
+        assets = assets.filter(pk__lte=id_to)
+    return assets.order_by('pk')
+
+
+def _jobs(assets, root):
+    return [
+        (qr.complaint_url(asset, root), asset.asset_number)
+        for asset in assets.only('pk', 'asset_number').iterator(chunk_size=2000)
+    ]
+
+
+def render_labels(assets, root, workers=None):
+    """
+    Yield (asset_number, label PNG bytes) in asset order. workers=1 renders
+    in this process (web requests), otherwise a process pool is started for
+    batches of POOL_MIN_LABELS or more.
+    """
+    jobs = _jobs(assets, root)
+    if workers == 1 or len(jobs) < POOL_MIN_LABELS:
+        for job in jobs:
+            yield job[1], render_label(job)
+        return
+
+    workers = workers or getattr(settings, 'LABEL_RENDER_WORKERS', None) or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for job, png in zip(jobs, pool.map(render_label, jobs, chunksize=POOL_CHUNK_SIZE)):
+            yield job[1], png
+
+
+def _filename(asset_number, used):
+    name = re.sub(r'[^A-Za-z0-9._-]+', '_', asset_number) or 'asset'
+    candidate, suffix = name, 1
+    while candidate in used:
+        suffix += 1
+        candidate = f'{name}_{suffix}'
+    used.add(candidate)
+    return f'{candidate}.png'
+
+
+def write_zip(labels, fileobj, progress=None):
+    """Write labels as PNG files into a ZIP (fileobj need not be seekable)"""
+    used = set()
+    done = 0
+    with zipfile.ZipFile(fileobj, 'w', compression=zipfile.ZIP_STORED) as archive:
+        # PNGs are compressed already
+        for asset_number, png in labels:
+            archive.writestr(_filename(asset_number, used), png)
+            done += 1
+            if progress:
+                progress(done)
+    return done
+
+
+class PdfSheets:
+    """
+    Writes bilevel page images into a PDF one at a time (Pillow's PDF writer
+    needs every page in memory). Each page is a single Flate compressed
+    image; the page tree and cross-reference table follow the last page, so
+    fileobj need not be seekable.
+    """
+    CATALOG, PAGES = 1, 2
+
+    def __init__(self, fileobj, resolution=PAGE_RESOLUTION):
+        self._file = fileobj
+        self._resolution = resolution
+        self._position = 0
+        self._offsets = {}
+        self._kids = []
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _write(self, data):
+        self._file.write(data)
+        self._position += len(data)
+
+    def _object(self, body, stream=None, number=None):
+        number = number or len(self._offsets) + 3
+        self._offsets[number] = self._position
+        self._write(f'{number} 0 obj\n'.encode())
+        if stream is None:
+            self._write(body.encode() + b'\n')
+        else:
+            self._write(f'{body[:-2]} /Length {len(stream)} >>\nstream\n'.encode())
+            self._write(stream + b'\nendstream\n')
+        self._write(b'endobj\n')
+        return number
+
+    def add(self, page):
+        """Append a mode '1' page image (PDF and Pillow both read 1 bits as white)"""
+        width, height = page.size
+        points = (width * 72 / self._resolution, height * 72 / self._resolution)
+        image = self._object(
+            f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} '
+            f'/ColorSpace /DeviceGray /BitsPerComponent 1 /Filter /FlateDecode >>',
+            zlib.compress(page.tobytes()),
+        )
+        contents = self._object('<< >>', f'q {points[0]:.2f} 0 0 {points[1]:.2f} 0 0 cm /Im0 Do Q'.encode())
+        self._kids.append(self._object(
+            f'<< /Type /Page /Parent {self.PAGES} 0 R /MediaBox [0 0 {points[0]:.2f} {points[1]:.2f}] '
+            f'/Resources << /XObject << /Im0 {image} 0 R >> >> /Contents {contents} 0 R >>'
+        ))
+
+    def close(self):
+        kids = ' '.join(f'{kid} 0 R' for kid in self._kids)
+        self._object(f'<< /Type /Pages /Kids [{kids}] /Count {len(self._kids)} >>', number=self.PAGES)
+        self._object(f'<< /Type /Catalog /Pages {self.PAGES} 0 R >>', number=self.CATALOG)
+
+        xref = self._position
+        size = max(self._offsets) + 1
+        entries = ''.join(f'{self._offsets[number]:010d} 00000 n \n' for number in range(1, size))
+        self._write(
+            f'xref\n0 {size}\n0000000000 65535 f \n{entries}'
+            f'trailer\n<< /Size {size} /Root {self.CATALOG} 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+        )
+
+
+def _sheets(labels, progress=None):
+    """Yield full A4 sticker sheets (mode '1' images), at least one"""
+    cell_width = PAGE_SIZE[0] // LABEL_COLUMNS
+    cell_height = PAGE_SIZE[1] // LABEL_ROWS
+    per_page = LABEL_COLUMNS * LABEL_ROWS
+
+    page = None
+    done = 0
+    for _, png in labels:
+        slot = done % per_page
+        if slot == 0:
+            if page is not None:
+                yield page
+            page = Image.new('1', PAGE_SIZE, 1)
+        column, row = slot % LABEL_COLUMNS, slot // LABEL_COLUMNS
+        page.paste(Image.open(BytesIO(png)), (
+            column * cell_width + (cell_width - LABEL_SIZE[0]) // 2,
+            row * cell_height + (cell_height - LABEL_SIZE[1]) // 2,
+        ))
+        done += 1
+        if progress:
+            progress(done)
+    yield page if page is not None else Image.new('1', PAGE_SIZE, 1)
+
+
+def write_pdf(labels, fileobj, progress=None):
+    """Write labels as A4 sticker sheets into a PDF (fileobj need not be seekable)"""
+    done = 0
+
+    def count(value):
+        nonlocal done
+        done = value
+        if progress:
+            progress(value)
+
+    document = PdfSheets(fileobj)
+    for page in _sheets(labels, count):
+        document.add(page)
+    document.close()
+    return done
+
+
+def write_labels(label_format, labels, fileobj, progress=None):
+    if label_format not in LABEL_FORMATS:
+        raise ValueError(f'format must be one of {", ".join(LABEL_FORMATS)}.')
+    writer = write_pdf if label_format == 'pdf' else write_zip
+    return writer(labels, fileobj, progress=progress)
+
+
+class StreamBuffer:
+    """Write-only file object whose content is drained in chunks (for streaming responses)"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(labels):
+    """Generator of ZIP bytes, produced while the labels are rendered"""
+    buffer = StreamBuffer()
+    used = set()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for asset_number, png in labels:
+            archive.writestr(_filename(asset_number, used), png)
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def stream_pdf(labels):
+    """Generator of PDF bytes, one sticker sheet at a time"""
+    buffer = StreamBuffer()
+    document = PdfSheets(buffer)
+    for page in _sheets(labels):
+        document.add(page)
+        yield buffer.drain()
+    document.close()
+    yield buffer.drain()
+
+
+def stream_labels(label_format, labels):
+    if label_format not in LABEL_FORMATS:
+        raise ValueError(f'format must be one of {", ".join(LABEL_FORMATS)}.')
+    return stream_pdf(labels) if label_format == 'pdf' else stream_zip(labels)
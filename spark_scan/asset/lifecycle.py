@@ -0,0 +1,110 @@
+"""
+Asset status history.
+
+Every status change appends an AssetTransition row and closes the asset's
+previous stint (left_at and duration), so:
+
+- the status of an asset at a moment is the last row entered before it,
+- the number of assets in a status at a moment counts the stints of that
+  status open at the moment,
+- the time an asset spent in a status sums stored durations,
+
+all answered from the transition indexes instead of scanning assets.
+Rows are never deleted; the only update is closing a stint once.
+"""
+from datetime import timedelta
+
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Q, Sum, Value
+from django.utils import timezone
+
+from .models import AssetTransition
+
+
+def _close_stints(asset_ids, moment):
+    """End the open stints of asset_ids at moment"""
+    AssetTransition.objects.filter(asset_id__in=asset_ids, left_at__isnull=True).update(
+        left_at=moment,
+        duration=ExpressionWrapper(Value(moment) - F('entered_at'), output_field=DurationField()),
+    )
+
+
+def record_transition(asset_id, from_status, to_status, source, moment=None):
+    """Append one transition; to_status None records a deletion"""
+    moment = moment or timezone.now()
+    _close_stints([asset_id], moment)
+    return AssetTransition.objects.create(
+        asset_id=asset_id, from_status=from_status, to_status=to_status, source=source, entered_at=moment
+    )
+
+
+def record_transitions(asset_ids, from_status, to_status, source, moment=None):
+    """record_transition for many assets at once (bulk writes that skip the signals)"""
+    asset_ids = list(asset_ids)
+    moment = moment or timezone.now()
+    _close_stints(asset_ids, moment)
+    AssetTransition.objects.bulk_create([
+        AssetTransition(asset_id=asset_id, from_status=from_status, to_status=to_status, source=source, entered_at=moment)
+        for asset_id in asset_ids
+    ])
+
+
+def source_for(from_status, to_status):
+    """Which kind of write a status change comes from"""
+    if from_status is None:
+        return AssetTransition.PROVISION
+    if to_status is None:
+        return AssetTransition.DELETE
+    if from_status == 'PROVISIONED' and to_status == 'COMMISSIONED':
+        return AssetTransition.COMMISSION
+    return AssetTransition.EDIT
+
+
+def history(asset_id):
+    """Transitions of one asset, oldest first"""
+    return AssetTransition.objects.filter(asset_id=asset_id).order_by('entered_at', 'id')
+
+
+def status_at(asset_id, moment):
+    """Status of an asset at moment (None before it existed or after deletion)"""
+    row = AssetTransition.objects.filter(asset_id=asset_id, entered_at__lte=moment).order_by(
+        '-entered_at', '-id'
+    ).values_list('to_status', flat=True)[:1]
+    return row[0] if row else None
+
+
+def _open_at(moment):
+    return Q(entered_at__lte=moment) & (Q(left_at__isnull=True) | Q(left_at__gt=moment))
+
+
+def count_at(status, moment):
+    """Number of assets in status at moment"""
+    return AssetTransition.objects.filter(_open_at(moment), to_status=status).count()
+
+
+def counts_at(moment):
+    """{status: number of assets} at moment"""
+    rows = AssetTransition.objects.filter(_open_at(moment), to_status__isnull=False).values(
+        'to_status'
+    ).annotate(assets=Count('id')).order_by()
+    return {row['to_status']: row['assets'] for row in rows}
+
+
+def time_in_status(asset_id, status, now=None):
+    """Total time an asset has spent in status, including a stint still open"""
+    now = now or timezone.now()
+    stints = AssetTransition.objects.filter(asset_id=asset_id, to_status=status)
+    total = stints.filter(left_at__isnull=False).aggregate(total=Sum('duration'))['total'] or timedelta(0)
+    current = stints.filter(left_at__isnull=True).values_list('entered_at', flat=True).first()
+    if current is not None:
+        total += now - current
+    return total
+
+
+def average_duration(status, left_from=None, left_to=None):
+    """Average length of the finished stints in status, optionally of those that ended in [left_from, left_to)"""
+    stints = AssetTransition.objects.filter(to_status=status, left_at__isnull=False)
+    if left_from is not None:
+        stints = stints.filter(left_at__gte=left_from)
+    if left_to is not None:
+        stints = stints.filter(left_at__lt=left_to)
+    return stints.aggregate(average=Avg('duration'))['average']
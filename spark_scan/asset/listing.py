@@ -0,0 +1,163 @@
+"""
+Filtering, sorting and keyset pagination for the asset list.
+
+Pages are addressed by a cursor holding the sort key of the last (or
+first) row shown instead of an offset, so every page is one index range
+scan of PAGE_SIZE rows however many assets exist.
+"""
+import base64
+import json
+import math
+from datetime import date, datetime
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.db.models.functions import Upper
+
+from .models import Asset, ASSET_TYPE_CHOICES, ASSET_GROUP_CHOICES, STATUS_CHOICES
+
+PAGE_SIZE = 50
+
+# ?sort= value -> model field. Sort fields must be non-null, the id breaks ties.
+SORT_FIELDS = {
+    'created': 'created_at',
+    'number': 'asset_number',
+    'provisioned': 'provisioning_date',
+}
+
+DEFAULT_SORT = '-created'
+
+# Export column -> model field
+ASSET_EXPORT_COLUMNS = {
+    name: name for name in [
+        'id', 'asset_number', 'asset_type', 'asset_group', 'status',
+        'provisioning_date', 'provisioned_by', 'planned_location',
+        'commissioning_date', 'commissioned_by', 'actual_location', 'latitude', 'longitude',
+        'dmm', 'secondary_connection', 'ct_ratio', 'pt_ratio', 'actual_cost',
+        'open_complaints', 'total_complaints', 'created_at', 'updated_at',
+    ]
+}
+
+
+def filter_assets(queryset, asset_type='', status='', asset_group='', search=''):
+    """Apply the list filters; search is an asset number prefix, in any case"""
+    if asset_type:
+        queryset = queryset.filter(asset_type=asset_type)
+    if status:
+        queryset = queryset.filter(status=status)
+    if asset_group:
+        queryset = queryset.filter(asset_group=asset_group)
+    if search:
+        # Range on UPPER(asset_number) instead of LIKE, so the expression
+        # index asset_number_upper_idx is used
+        term = search.upper()
+        queryset = queryset.alias(asset_number_upper=Upper('asset_number')).filter(
+            asset_number_upper__gte=term, asset_number_upper__lt=term + '\U0010ffff'
+        )
+    return queryset
+
+
+def filters_from_request(params):
+    """Valid filter values from request.GET (unknown choices are ignored)"""
+    def choice(name, choices):
+        value = params.get(name, '')
+        return value if value in dict(choices) else ''
+
+    return {
+        'asset_type': choice('type', ASSET_TYPE_CHOICES),
+        'status': choice('status', STATUS_CHOICES),
+        'asset_group': choice('group', ASSET_GROUP_CHOICES),
+        'search': params.get('search', '').strip(),
+    }
+
+
+def parse_sort(value):
+    """(sort param, field, descending), falling back to DEFAULT_SORT"""
+    if not value or value.lstrip('-') not in SORT_FIELDS:
+        value = DEFAULT_SORT
+    return value, SORT_FIELDS[value.lstrip('-')], value.startswith('-')
+
+
+def _encode_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(asset, field):
+    payload = json.dumps([_encode_value(getattr(asset, field)), asset.pk])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, field, model=Asset):
+    """(sort value, id) from a cursor, None when it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, pk = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        try:
+            value = model._meta.get_field(field).to_python(value)
+        except FieldDoesNotExist:
+            # An annotation (e.g. the complaint search rank), a JSON number
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+                return None
+        return value, int(pk)
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+def _after(field, descending, value, pk):
+    """Rows after (value, pk) in the page order"""
+    op = 'lt' if descending else 'gt'
+    return Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'pk__{op}': pk})
+
+
+def keyset_page(queryset, field, descending, after=None, before=None, page_size=PAGE_SIZE):
+    """
+    One page of queryset ordered by (field, pk), starting after cursor
+    ``after`` or ending before cursor ``before``. Also used by the
+    complaint list.
+
+    Returns (rows, next_cursor, previous_cursor); a cursor is None when
+    there is nothing more in that direction.
+    """
+    order = [f'-{field}', '-pk'] if descending else [field, 'pk']
+    reverse_order = [field, 'pk'] if descending else [f'-{field}', '-pk']
+
+    after_key = decode_cursor(after, field, queryset.model) if after else None
+    before_key = decode_cursor(before, field, queryset.model) if before else None
+
+    if before_key and not after_key:
+        # Walk backwards from the cursor, then restore the page order
+        rows = list(
+            queryset.filter(_after(field, not descending, *before_key)).order_by(*reverse_order)[:page_size + 1]
+        )
+        has_more_before = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        has_more_after = True
+    else:
+        if after_key:
+            queryset = queryset.filter(_after(field, descending, *after_key))
+        rows = list(queryset.order_by(*order)[:page_size + 1])
+        has_more_after = len(rows) > page_size
+        rows = rows[:page_size]
+        has_more_before = after_key is not None
+
+    next_cursor = encode_cursor(rows[-1], field) if rows and has_more_after else None
+    previous_cursor = encode_cursor(rows[0], field) if rows and has_more_before else None
+    return rows, next_cursor, previous_cursor
+
+
+def paginate(queryset, sort=DEFAULT_SORT, after=None, before=None, page_size=PAGE_SIZE):
+    """
+    One page of queryset in sort order (see keyset_page).
+
+    Returns {'assets', 'next_cursor', 'previous_cursor', 'sort'}.
+    """
+    sort, field, descending = parse_sort(sort)
+    assets, next_cursor, previous_cursor = keyset_page(queryset, field, descending, after, before, page_size)
+    return {
+        'assets': assets,
+        'next_cursor': next_cursor,
+        'previous_cursor': previous_cursor,
+        'sort': sort,
+    }
@@ -0,0 +1,38 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from asset import listing
+from asset.models import Asset, ASSET_GROUP_CHOICES, ASSET_TYPE_CHOICES, STATUS_CHOICES
+from spark_scan import exports
+
+
+class Command(BaseCommand):
+    help = 'Stream assets as CSV or NDJSON (same filters as the asset list)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(exports.EXPORT_FORMATS), default='csv')
+        parser.add_argument('--type', choices=[value for value, _ in ASSET_TYPE_CHOICES], default='')
+        parser.add_argument('--status', choices=[value for value, _ in STATUS_CHOICES], default='')
+        parser.add_argument('--group', choices=[value for value, _ in ASSET_GROUP_CHOICES], default='')
+        parser.add_argument('--search', default='', help='Asset number prefix')
+        parser.add_argument('--output', help='File to write (default: stdout)')
+
+    def handle(self, *args, **options):
+        assets = listing.filter_assets(
+            Asset.objects.all(),
+            asset_type=options['type'],
+            status=options['status'],
+            asset_group=options['group'],
+            search=options['search'],
+        ).order_by('pk')
+
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in exports.stream(listing.ASSET_EXPORT_COLUMNS, assets, options['format']):
+                output.write(chunk)
+        finally:
+            if options['output']:
+                output.close()
+            else:
+                output.flush()
@@ -0,0 +1,67 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from asset import labels
+from asset.models import ASSET_GROUP_CHOICES, ASSET_TYPE_CHOICES, STATUS_CHOICES
+
+
+class Command(BaseCommand):
+    help = 'Render QR sticker sheets (PDF) or a ZIP of QR labels for a set of assets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=labels.LABEL_FORMATS, default='pdf')
+        parser.add_argument('--group', choices=[value for value, _ in ASSET_GROUP_CHOICES], default='')
+        parser.add_argument('--status', choices=[value for value, _ in STATUS_CHOICES], default='')
+        parser.add_argument('--type', choices=[value for value, _ in ASSET_TYPE_CHOICES], default='')
+        parser.add_argument('--search', default='', help='Asset number prefix, as in the asset list search')
+        parser.add_argument('--from-id', type=int, help='Lowest asset id to include')
+        parser.add_argument('--to-id', type=int, help='Highest asset id to include')
+        parser.add_argument('--base-url', help='Site root for the complaint URLs (default: QR_BASE_URL)')
+        parser.add_argument('--workers', type=int, help='Rendering processes (default: LABEL_RENDER_WORKERS or one per CPU)')
+        parser.add_argument('--output', help='Output file (default: MEDIA_ROOT/labels/qr-labels-<timestamp>.<format>)')
+
+    def handle(self, *args, **options):
+        root = (options['base_url'] or '').rstrip('/') or getattr(settings, 'QR_BASE_URL', '').rstrip('/')
+        if not root:
+            raise CommandError('Pass --base-url or set QR_BASE_URL, the labels need absolute complaint URLs.')
+
+        assets = labels.select_assets(
+            asset_group=options['group'],
+            status=options['status'],
+            asset_type=options['type'],
+            search=options['search'],
+            id_from=options['from_id'],
+            id_to=options['to_id'],
+        )
+        total = assets.count()
+        if not total:
+            raise CommandError('No assets match the given filters.')
+
+        output = options['output'] or os.path.join(
+            settings.MEDIA_ROOT, 'labels',
+            f'qr-labels-{timezone.now():%Y%m%d-%H%M%S}.{options["format"]}',
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
+        started = time.monotonic()
+        step = max(1, total // 20)
+
+        def progress(done):
+            if done % step == 0 or done == total:
+                self.stdout.write(f'  {done}/{total} labels ({done * 100 // total}%)')
+
+        with open(output, 'wb') as fileobj:
+            labels.write_labels(
+                options['format'],
+                labels.render_labels(assets, root, workers=options['workers']),
+                fileobj,
+                progress=progress,
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {total} label(s) to {output} in {time.monotonic() - started:.1f}s.'
+        ))
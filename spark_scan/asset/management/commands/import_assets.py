@@ -0,0 +1,54 @@
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand, CommandError
+
+from asset import importer
+
+# Errors printed without --errors
+SHOWN_ERRORS = 20
+
+
+class Command(BaseCommand):
+    help = 'Provision assets from a CSV or XLSX file (header row with the ProvisioningForm field names)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or XLSX file to import')
+        parser.add_argument('--format', choices=importer.IMPORT_FORMATS, help='File format (default: from the extension)')
+        parser.add_argument('--chunk-size', type=int, default=importer.IMPORT_CHUNK_SIZE, help='Rows validated and inserted per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only validate the rows, create nothing')
+        parser.add_argument('--errors', help='Write the per-row error report (CSV) to this file')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or importer.format_from_name(options['path'])
+
+        def progress(result):
+            self.stdout.write(f'  {result.rows} row(s) read, {result.created} ok, {result.error_count} error(s)')
+
+        try:
+            with open(options['path'], 'rb') as fileobj, ExitStack() as stack:
+                # Errors are written to the report as each chunk is done
+                report = None
+                if options['errors']:
+                    report = stack.enter_context(open(options['errors'], 'w', newline='', encoding='utf-8'))
+                result = importer.import_assets(
+                    importer.read_rows(fileobj, file_format),
+                    chunk_size=options['chunk_size'],
+                    dry_run=options['dry_run'],
+                    progress=progress,
+                    report=report,
+                    max_errors=SHOWN_ERRORS,
+                )
+        except (OSError, ValueError, UnicodeDecodeError) as e:
+            raise CommandError(f'Could not import {options["path"]}: {e}')
+
+        if options['errors']:
+            self.stdout.write(f'Error report written to {options["errors"]}.')
+        elif result.error_count:
+            for error in result.errors:
+                self.stdout.write(f'  row {error.row} ({error.asset_number or "-"}): {error.field}: {error.message}')
+            if result.error_count > len(result.errors):
+                self.stdout.write(f'  ... {result.error_count - len(result.errors)} more, use --errors for the full report')
+
+        verb = 'would be provisioned' if options['dry_run'] else 'provisioned'
+        message = f'{result.created} of {result.rows} asset(s) {verb}, {result.error_count} error(s).'
+        self.stdout.write(self.style.WARNING(message) if result.error_count else self.style.SUCCESS(message))
@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from asset import sync
+
+
+class Command(BaseCommand):
+    help = 'Delete old rows of the map delta-sync change feed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=sync.SYNC_RETENTION.days,
+            help='Keep changes from the last N days (default: %(default)s)',
+        )
+
+    def handle(self, *args, **options):
+        deleted = sync.prune(timedelta(days=options['days']))
+        self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} change row(s).'))
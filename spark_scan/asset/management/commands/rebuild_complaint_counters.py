@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from asset.models import Asset
+from citizen_portal.models import Complaint, OPEN_STATUSES
+
+
+def _complaint_count(**filters):
+    counts = Complaint.objects.filter(asset=OuterRef('pk'), **filters).values('asset').annotate(
+        total=Count('pk')
+    ).values('total')
+    return Coalesce(Subquery(counts), 0)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild (or with --verify only check) the per-asset complaint counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Report assets whose counters disagree with the complaints table without fixing them',
+        )
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            self.verify()
+        else:
+            self.rebuild()
+
+    def rebuild(self):
+        with transaction.atomic():
+            updated = Asset.objects.update(
+                open_complaints=_complaint_count(status__in=OPEN_STATUSES),
+                total_complaints=_complaint_count(),
+            )
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt complaint counters for {updated} asset(s).'))
+
+    def verify(self):
+        mismatched = Asset.objects.annotate(
+            actual_open=_complaint_count(status__in=OPEN_STATUSES),
+            actual_total=_complaint_count(),
+        ).exclude(
+            Q(open_complaints=F('actual_open')) & Q(total_complaints=F('actual_total'))
+        ).values_list('asset_number', 'open_complaints', 'actual_open', 'total_complaints', 'actual_total')
+
+        count = 0
+        for asset_number, stored_open, actual_open, stored_total, actual_total in mismatched.iterator():
+            count += 1
+            self.stdout.write(
+                f'{asset_number}: open {stored_open} (actual {actual_open}), '
+                f'total {stored_total} (actual {actual_total})'
+            )
+
+        if count:
+            raise CommandError(f'{count} asset(s) have stale complaint counters, run without --verify to fix.')
+        self.stdout.write(self.style.SUCCESS('All complaint counters are consistent.'))
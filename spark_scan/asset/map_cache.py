@@ -0,0 +1,61 @@
+"""
+Shared cache for the map payloads of the dashboard and public maps.
+
+Everything is cached under a data version that Asset/Complaint save and
+delete signals bump (see asset.signals). A bump makes all old entries
+unreachable, so nothing has to be deleted explicitly, and the version
+doubles as ETag/Last-Modified source for conditional requests.
+"""
+import hashlib
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+
+MAP_DATA_VERSION_KEY = 'map_data_version'
+
+# Entries of superseded versions simply age out
+MAP_CACHE_TIMEOUT = 60 * 60
+
+_MISSING = object()
+
+
+def get_version(key=MAP_DATA_VERSION_KEY):
+    """(token, modified timestamp) of the current map data version (or of another versioned key)"""
+    version = cache.get(key)
+    if version is None:
+        # First use or evicted: start a fresh version (never reuses old entries)
+        cache.add(key, (uuid.uuid4().hex, time.time()), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version():
+    """Invalidate every cached map payload"""
+    cache.set(MAP_DATA_VERSION_KEY, (uuid.uuid4().hex, time.time()), None)
+
+
+def cached(name, builder, *key_parts):
+    """Return the cached value for name/key_parts at the current version, building it on a miss"""
+    token, _ = get_version()
+    digest = hashlib.md5(repr(key_parts).encode('utf-8')).hexdigest()
+    cache_key = f'map:{token}:{name}:{digest}'
+
+    value = cache.get(cache_key, _MISSING)
+    if value is _MISSING:
+        value = builder()
+        cache.set(cache_key, value, MAP_CACHE_TIMEOUT)
+    return value
+
+
+def etag(*key_parts):
+    """ETag for a response that only depends on the map data and key_parts"""
+    token, _ = get_version()
+    return hashlib.md5(repr((token,) + key_parts).encode('utf-8')).hexdigest()
+
+
+def last_modified():
+    """Time of the last map data change"""
+    _, modified = get_version()
+    return datetime.fromtimestamp(modified, tz=timezone.utc)
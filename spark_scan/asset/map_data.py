@@ -0,0 +1,361 @@
+import math
+
+from django.db.models import Avg, Count, FloatField, IntegerField, Max, Min, Sum, Value
+from django.db.models.functions import Cast, Floor
+
+from citizen_portal import rollups
+from .models import Asset, STATUS_CHOICES
+from . import map_cache
+
+# Up to this zoom level the maps get grid clusters instead of single assets
+CLUSTER_MAX_ZOOM = 14
+
+# Grid cells per 256px map tile (a cell is roughly 64px on screen)
+CLUSTER_CELLS_PER_TILE = 4
+
+# Most single assets in one payload: a larger viewport (e.g. a whole
+# country at a high zoom) gets the clusters of CLUSTER_MAX_ZOOM instead
+MAP_MAX_ASSETS = 2000
+
+# Payload formats of the map data endpoints
+MAP_FORMATS = ['geojson', 'columnar']
+
+# Columnar coordinates are integers in millionths of a degree (the
+# precision of Asset.latitude/longitude), relative to the bbox corner
+COORD_SCALE = 1000000
+
+# Bit flags of the columnar ``flags`` column
+FLAG_TRANSFORMER = 1
+FLAG_HAS_COMPLAINTS = 2
+
+
+def parse_bbox(value):
+    """
+    Parse a Leaflet ``toBBoxString()`` value ("west,south,east,north").
+
+    Returns a (south, west, north, east) tuple of floats clamped to valid
+    coordinates, or raises ValueError when the value is missing or malformed.
+    """
+    if not value:
+        raise ValueError('bbox parameter is required (west,south,east,north).')
+
+    parts = value.split(',')
+    if len(parts) != 4:
+        raise ValueError('bbox must have exactly four comma separated values.')
+
+    west, south, east, north = (float(part) for part in parts)
+    # float() also takes "nan" and "inf", which no range filter excludes
+    if not all(math.isfinite(value) for value in (west, south, east, north)):
+        raise ValueError('bbox values must be finite numbers.')
+
+    if south > north or west > east:
+        raise ValueError('bbox must be ordered west,south,east,north.')
+
+    # Zoomed-out Leaflet viewports can extend past the valid range
+    south, north = max(south, -90.0), min(north, 90.0)
+    west, east = max(west, -180.0), min(east, 180.0)
+
+    return south, west, north, east
+
+
+def commissioned_assets():
+    """Commissioned assets that have GPS coordinates (map candidates)"""
+    return Asset.objects.filter(
+        status='COMMISSIONED',
+        latitude__isnull=False,
+        longitude__isnull=False
+    )
+
+
+def assets_in_bbox(bbox):
+    """
+    Commissioned assets inside the (south, west, north, east) box.
+
+    The range filter on latitude/longitude is served by the
+    ``asset_status_lat_lng_idx`` index instead of a full table scan, and
+    complaint counts come from the counters on Asset (no join).
+    """
+    south, west, north, east = bbox
+    return commissioned_assets().filter(
+        latitude__gte=south,
+        latitude__lte=north,
+        longitude__gte=west,
+        longitude__lte=east,
+    )
+
+
+def asset_feature(asset, public=False):
+    """GeoJSON Feature for one asset"""
+    properties = {
+        'id': asset.id,
+        'asset_type': asset.asset_type,
+        'asset_number': asset.asset_number,
+        'location': asset.actual_location or asset.planned_location or 'Unknown',
+        'has_complaints': asset.open_complaints > 0,
+        'open_complaints': asset.open_complaints,
+    }
+
+    # Internal dashboard gets the full details, public map the minimum
+    if not public:
+        properties.update({
+            'status': asset.get_status_display(),
+            'commissioning_date': asset.commissioning_date.strftime('%Y-%m-%d') if asset.commissioning_date else 'N/A',
+            'actual_cost': str(asset.actual_cost) if asset.actual_cost else 'N/A',
+            'total_complaints': asset.total_complaints,
+        })
+
+    return {
+        'type': 'Feature',
+        'geometry': {
+            'type': 'Point',
+            'coordinates': [float(asset.longitude), float(asset.latitude)],
+        },
+        'properties': properties,
+    }
+
+
+def feature_collection(bbox, public=False):
+    """GeoJSON FeatureCollection of the commissioned assets inside bbox"""
+    return {
+        'type': 'FeatureCollection',
+        'features': [asset_feature(asset, public=public) for asset in assets_in_bbox(bbox)],
+    }
+
+
+def parse_zoom(value):
+    """Parse the Leaflet zoom level, None when not given"""
+    if value in (None, ''):
+        return None
+    zoom = int(value)
+    if not 0 <= zoom <= 22:
+        raise ValueError('zoom must be between 0 and 22.')
+    return zoom
+
+
+def cluster_cell_size(zoom):
+    """Grid cell size in degrees for a zoom level"""
+    return 360.0 / (2 ** zoom) / CLUSTER_CELLS_PER_TILE
+
+
+def build_cluster_grid(zoom):
+    """
+    Aggregate all mappable assets into grid cells for one zoom level.
+
+    Grouping happens in the database (GROUP BY cell), so the result has
+    one row per occupied cell: count, centroid and open complaint total.
+    """
+    cell = cluster_cell_size(zoom)
+
+    cells = commissioned_assets().annotate(
+        cell_x=Cast(Floor(Cast('longitude', FloatField()) / Value(cell)), IntegerField()),
+        cell_y=Cast(Floor(Cast('latitude', FloatField()) / Value(cell)), IntegerField()),
+    ).values('cell_x', 'cell_y').annotate(
+        count=Count('id'),
+        lat=Avg('latitude'),
+        lng=Avg('longitude'),
+        cell_open_complaints=Sum('open_complaints'),
+    ).order_by()
+
+    return [
+        (row['cell_x'], row['cell_y'], row['count'], float(row['lat']), float(row['lng']), row['cell_open_complaints'])
+        for row in cells
+    ]
+
+
+def cluster_grid(zoom):
+    """Cluster grid for a zoom level, built once per map data version"""
+    return map_cache.cached('cluster_grid', lambda: build_cluster_grid(zoom), zoom)
+
+
+def cluster_feature(cell_x, cell_y, count, lat, lng, open_complaints):
+    """GeoJSON Feature for one grid cluster"""
+    return {
+        'type': 'Feature',
+        'geometry': {
+            'type': 'Point',
+            'coordinates': [lng, lat],
+        },
+        'properties': {
+            'cluster': True,
+            'cell': f'{cell_x}:{cell_y}',
+            'count': count,
+            'open_complaints': open_complaints,
+            'has_complaints': open_complaints > 0,
+        },
+    }
+
+
+def cluster_collection(bbox, zoom):
+    """GeoJSON FeatureCollection of the grid clusters inside bbox"""
+    south, west, north, east = bbox
+    cell = cluster_cell_size(zoom)
+
+    # Keep whole cells that overlap the viewport
+    min_x, max_x = int(west // cell), int(east // cell)
+    min_y, max_y = int(south // cell), int(north // cell)
+
+    return {
+        'type': 'FeatureCollection',
+        'clustered': True,
+        'features': [
+            cluster_feature(*row) for row in cluster_grid(zoom)
+            if min_x <= row[0] <= max_x and min_y <= row[1] <= max_y
+        ],
+    }
+
+
+def parse_format(value):
+    if value in (None, ''):
+        return 'geojson'
+    if value not in MAP_FORMATS:
+        raise ValueError(f'format must be one of {", ".join(MAP_FORMATS)}.')
+    return value
+
+
+class StringTable:
+    """Index of repeated strings (locations, dates) for columnar payloads"""
+
+    def __init__(self):
+        self.strings = []
+        self._index = {}
+
+    def add(self, value):
+        if value not in self._index:
+            self._index[value] = len(self.strings)
+            self.strings.append(value)
+        return self._index[value]
+
+
+def _quantize(value, origin):
+    return int(round((float(value) - origin) * COORD_SCALE))
+
+
+def columnar_assets(bbox, public=False):
+    """
+    Assets inside bbox as parallel arrays instead of one dict per asset.
+
+    Rows are read with values_list().iterator(), no model instances are
+    built. Coordinates are integer offsets from (lat0, lng0), repeated
+    strings are indexes into ``strings`` (decoded by the map templates).
+    """
+    south, west, _, _ = bbox
+    strings = StringTable()
+    columns = {
+        'ids': [], 'numbers': [], 'lat': [], 'lng': [], 'flags': [],
+        'open': [], 'location': [],
+    }
+    if not public:
+        columns.update({'status': [], 'total': [], 'date': [], 'cost': []})
+        status_labels = dict(STATUS_CHOICES)
+
+    rows = assets_in_bbox(bbox).order_by().values_list(
+        'id', 'asset_number', 'asset_type', 'status', 'latitude', 'longitude',
+        'actual_location', 'planned_location', 'open_complaints',
+        'total_complaints', 'commissioning_date', 'actual_cost',
+    )
+    for (asset_id, number, asset_type, status, lat, lng, actual_location, planned_location,
+         open_complaints, total_complaints, commissioning_date, actual_cost) in rows.iterator(chunk_size=2000):
+        flags = FLAG_TRANSFORMER if asset_type == 'TRANSFORMER' else 0
+        if open_complaints > 0:
+            flags |= FLAG_HAS_COMPLAINTS
+
+        columns['ids'].append(asset_id)
+        columns['numbers'].append(number)
+        columns['lat'].append(_quantize(lat, south))
+        columns['lng'].append(_quantize(lng, west))
+        columns['flags'].append(flags)
+        columns['open'].append(open_complaints)
+        columns['location'].append(strings.add(actual_location or planned_location or 'Unknown'))
+
+        if not public:
+            columns['status'].append(strings.add(status_labels.get(status, status)))
+            columns['total'].append(total_complaints)
+            columns['date'].append(strings.add(commissioning_date.strftime('%Y-%m-%d') if commissioning_date else 'N/A'))
+            columns['cost'].append(strings.add(str(actual_cost) if actual_cost else 'N/A'))
+
+    return {
+        'format': 'columnar',
+        'scale': COORD_SCALE,
+        'lat0': south,
+        'lng0': west,
+        'strings': strings.strings,
+        **columns,
+    }
+
+
+def columnar_clusters(bbox, zoom):
+    """Grid clusters inside bbox as parallel arrays"""
+    collection = cluster_collection(bbox, zoom)
+    columns = {'lat': [], 'lng': [], 'count': [], 'open': []}
+    for feature in collection['features']:
+        lng, lat = feature['geometry']['coordinates']
+        columns['lat'].append(round(lat, 6))
+        columns['lng'].append(round(lng, 6))
+        columns['count'].append(feature['properties']['count'])
+        columns['open'].append(feature['properties']['open_complaints'])
+    return {'format': 'columnar', 'clustered': True, **columns}
+
+
+def build_map_data(bbox, zoom=None, public=False, payload_format='geojson'):
+    """
+    Map payload for a viewport: grid clusters while zoomed out,
+    individual assets once zoom passes CLUSTER_MAX_ZOOM (and the
+    viewport holds at most MAP_MAX_ASSETS of them).
+    """
+    clustered = zoom is not None and zoom <= CLUSTER_MAX_ZOOM
+    if not clustered and assets_in_bbox(bbox).order_by()[MAP_MAX_ASSETS:MAP_MAX_ASSETS + 1].exists():
+        zoom, clustered = CLUSTER_MAX_ZOOM, True
+    if payload_format == 'columnar':
+        return columnar_clusters(bbox, zoom) if clustered else columnar_assets(bbox, public=public)
+    if clustered:
+        return cluster_collection(bbox, zoom)
+    return feature_collection(bbox, public=public)
+
+
+def map_data(bbox, zoom=None, public=False, payload_format='geojson'):
+    """
+    Viewport payload. Not cached per viewport: nearly every pan is a new
+    bbox, so such entries are almost never hit again. The clusters are
+    cut from the grid cached per zoom level, and the single assets come
+    from one range query on the bbox index.
+    """
+    return build_map_data(bbox, zoom, public, payload_format)
+
+
+def status_totals():
+    """All-time complaints per status, cached per map data version"""
+    return map_cache.cached('status_totals', rollups.status_totals)
+
+
+def complaint_stats():
+    """Opened / active / closed complaint totals for the map charts"""
+    totals = status_totals()
+    return {
+        'opened_count': totals['SUBMITTED'],
+        'active_count': totals['INSPECTING'] + totals['REPAIRING'],
+        'closed_count': totals['COMPLETED'],
+    }
+
+
+def map_bounds():
+    """Cached extent of all mappable assets, see build_map_bounds"""
+    return map_cache.cached('bounds', build_map_bounds)
+
+
+def build_map_bounds():
+    """
+    Extent of all mappable assets as [[south, west], [north, east]],
+    used to fit the initial viewport. Returns None when nothing is mapped.
+    """
+    extent = commissioned_assets().aggregate(
+        south=Min('latitude'),
+        north=Max('latitude'),
+        west=Min('longitude'),
+        east=Max('longitude'),
+    )
+    if extent['south'] is None:
+        return None
+    return [
+        [float(extent['south']), float(extent['west'])],
+        [float(extent['north']), float(extent['east'])],
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('asset', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(fields=['status', 'latitude', 'longitude'], name='asset_status_lat_lng_idx'),
+        ),
+    ]
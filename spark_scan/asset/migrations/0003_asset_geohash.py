@@ -0,0 +1,53 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:37
+
+from django.db import migrations, models
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def encode(latitude, longitude, precision=9):
+    """Geohash of a point, as asset.geo computed it at this migration"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    latitude, longitude = float(latitude), float(longitude)
+
+    chars = []
+    bits, bit_count, even = 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lng_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+def backfill_geohash(apps, schema_editor):
+    Asset = apps.get_model('asset', 'Asset')
+    located = Asset.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    for asset in located.only('id', 'latitude', 'longitude').iterator():
+        Asset.objects.filter(pk=asset.pk).update(geohash=encode(asset.latitude, asset.longitude))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('asset', '0002_asset_map_bbox_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='asset',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12, null=True),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
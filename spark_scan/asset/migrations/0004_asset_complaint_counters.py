@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:37
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Asset = apps.get_model('asset', 'Asset')
+    Complaint = apps.get_model('citizen_portal', 'Complaint')
+
+    def complaint_count(**filters):
+        counts = Complaint.objects.filter(asset=OuterRef('pk'), **filters).values('asset').annotate(
+            total=Count('pk')
+        ).values('total')
+        return Coalesce(Subquery(counts), 0)
+
+    Asset.objects.update(
+        open_complaints=complaint_count(status__in=['SUBMITTED', 'INSPECTING', 'REPAIRING']),
+        total_complaints=complaint_count(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('asset', '0003_asset_geohash'),
+        ('citizen_portal', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='asset',
+            name='open_complaints',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='asset',
+            name='total_complaints',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
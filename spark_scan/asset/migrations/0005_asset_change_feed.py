@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('asset', '0004_asset_complaint_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssetChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('asset_id', models.BigIntegerField()),
+                ('kind', models.CharField(choices=[('UPSERT', 'Upsert'), ('DELETE', 'Delete')], default='UPSERT', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('asset', '0005_asset_change_feed'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(fields=['created_at', 'id'], name='asset_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='asset_status_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(fields=['provisioning_date', 'id'], name='asset_provisioned_id_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('asset', '0006_asset_list_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommissioningReceipt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('result', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='commissioning_receipts', to='asset.asset')),
+            ],
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:57
+
+from django.db import migrations, models
+
+
+def backfill_transitions(apps, schema_editor):
+    """
+    Seed the history of existing assets from what they store: provisioned at
+    created_at and, if their status moved on since, in it from updated_at.
+    """
+    Asset = apps.get_model('asset', 'Asset')
+    AssetTransition = apps.get_model('asset', 'AssetTransition')
+    rows = []
+    for asset_id, status, created_at, updated_at in Asset.objects.values_list(
+        'id', 'status', 'created_at', 'updated_at'
+    ).iterator():
+        if status == 'PROVISIONED':
+            rows.append(AssetTransition(
+                asset_id=asset_id, to_status=status, source='BACKFILL', entered_at=created_at
+            ))
+        else:
+            rows.append(AssetTransition(
+                asset_id=asset_id, to_status='PROVISIONED', source='BACKFILL', entered_at=created_at,
+                left_at=updated_at, duration=updated_at - created_at,
+            ))
+            rows.append(AssetTransition(
+                asset_id=asset_id, from_status='PROVISIONED', to_status=status, source='BACKFILL',
+                entered_at=updated_at,
+            ))
+        if len(rows) >= 1000:
+            AssetTransition.objects.bulk_create(rows)
+            rows = []
+    AssetTransition.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('asset', '0007_commissioning_receipt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssetTransition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('asset_id', models.BigIntegerField()),
+                ('from_status', models.CharField(blank=True, choices=[('PROVISIONED', 'Provisioned'), ('COMMISSIONED', 'Commissioned'), ('INACTIVE', 'Inactive'), ('UNDER_MAINTENANCE', 'Under Maintenance'), ('FAULTY', 'Faulty')], max_length=20, null=True)),
+                ('to_status', models.CharField(blank=True, choices=[('PROVISIONED', 'Provisioned'), ('COMMISSIONED', 'Commissioned'), ('INACTIVE', 'Inactive'), ('UNDER_MAINTENANCE', 'Under Maintenance'), ('FAULTY', 'Faulty')], max_length=20, null=True)),
+                ('source', models.CharField(choices=[('PROVISION', 'Provisioning'), ('COMMISSION', 'Commissioning'), ('EDIT', 'Edit'), ('DELETE', 'Delete'), ('BACKFILL', 'Backfill (estimated from the asset timestamps)')], max_length=20)),
+                ('entered_at', models.DateTimeField()),
+                ('left_at', models.DateTimeField(blank=True, null=True)),
+                ('duration', models.DurationField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['entered_at', 'id'],
+                'indexes': [models.Index(fields=['asset_id', 'entered_at'], name='transition_asset_entered_idx'), models.Index(fields=['to_status', 'entered_at', 'left_at'], name='transition_status_entered_idx'), models.Index(fields=['to_status', 'left_at', 'duration'], name='transition_status_left_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_transitions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('asset', '0008_asset_transition_log'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(fields=['status', 'asset_type', 'created_at', 'id'], name='asset_status_type_created_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:56
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('asset', '0009_asset_status_type_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(django.db.models.functions.text.Upper('asset_number'), name='asset_number_upper_idx'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Upper
 
 # --- CHOICES ---
 ASSET_TYPE_CHOICES = [
@@ -55,6 +56,9 @@ class Asset(models.Model):
     actual_location = models.TextField(null=True, blank=True, help_text="Actual installed location")
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+
+    # Spatial key derived from latitude/longitude (see asset.geo)
+    geohash = models.CharField(max_length=12, null=True, blank=True, db_index=True, editable=False)
     
     # Technical Specifications
     dmm = models.CharField(max_length=20, choices=DMM_CHOICES)
@@ -66,20 +70,152 @@ class Asset(models.Model):
     # QR Code (generated during commissioning)
     qr_code = models.ImageField(upload_to='qr_codes/', null=True, blank=True)
     
+    # Complaint counters, maintained by Complaint.save / delete
+    open_complaints = models.PositiveIntegerField(default=0, editable=False)
+    total_complaints = models.PositiveIntegerField(default=0, editable=False)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Map viewport queries: commissioned assets inside a lat/lng box
+            models.Index(fields=['status', 'latitude', 'longitude'], name='asset_status_lat_lng_idx'),
+            # Asset list keyset pagination (see asset.listing)
+            models.Index(fields=['created_at', 'id'], name='asset_created_id_idx'),
+            models.Index(fields=['status', 'created_at', 'id'], name='asset_status_created_id_idx'),
+            models.Index(fields=['provisioning_date', 'id'], name='asset_provisioned_id_idx'),
+            # Asset list filtered by status and type
+            models.Index(fields=['status', 'asset_type', 'created_at', 'id'], name='asset_status_type_created_idx'),
+            # Case-insensitive asset number prefix search (see asset.listing)
+            models.Index(Upper('asset_number'), name='asset_number_upper_idx'),
+        ]
     
     def __str__(self):
         return f"{self.get_asset_type_display()} - {self.asset_number}"
     
+    # Only written by adjust_complaint_counters: saving a (possibly stale)
+    # instance over them would undo complaints counted meanwhile
+    COUNTER_FIELDS = ('open_complaints', 'total_complaints')
+    
+    def save(self, *args, **kwargs):
+        self.update_geohash()
+        super().save(*args, **kwargs)
+    
+    @classmethod
+    def fields_without_counters(cls):
+        """update_fields for saving an edited asset without its complaint counters"""
+        return [
+            field.name for field in cls._meta.concrete_fields
+            if not field.primary_key and field.name not in cls.COUNTER_FIELDS
+        ]
+    
+    def update_geohash(self):
+        """Recompute the spatial key from the current coordinates"""
+        from .geo import encode
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = encode(self.latitude, self.longitude)
+        else:
+            self.geohash = None
+    
+    @staticmethod
+    def adjust_complaint_counters(asset_id, open_delta=0, total_delta=0):
+        """Atomically shift the complaint counters of one asset"""
+        if open_delta or total_delta:
+            Asset.objects.filter(pk=asset_id).update(
+                open_complaints=models.F('open_complaints') + open_delta,
+                total_complaints=models.F('total_complaints') + total_delta,
+            )
+    
     def is_commissioned(self):
         """Check if asset is commissioned"""
         return self.status == 'COMMISSIONED'
     
     def has_open_issues(self):
         """Check if asset has any open issues"""
-        return self.issues.filter(status__in=['OPEN', 'IN_PROGRESS']).exists()
\ No newline at end of file
+        return self.issues.filter(status__in=['OPEN', 'IN_PROGRESS']).exists()
+
+
+class AssetChange(models.Model):
+    """
+    Append-only change feed for map delta sync. The primary key is the
+    sync token: clients ask for everything after the last id they saw.
+    """
+    UPSERT = 'UPSERT'
+    DELETE = 'DELETE'
+    KIND_CHOICES = [
+        (UPSERT, 'Upsert'),
+        (DELETE, 'Delete'),
+    ]
+    
+    # Plain id (no FK) so tombstones outlive the deleted asset
+    asset_id = models.BigIntegerField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=UPSERT)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"#{self.pk} {self.kind} asset {self.asset_id}"
+
+
+class AssetTransition(models.Model):
+    """
+    Append-only status history (see asset.lifecycle). Each row is a stint:
+    the asset entered to_status at entered_at and left it at left_at, with
+    duration stored when the stint is closed. to_status is empty for the
+    row recording a deletion.
+    """
+    PROVISION = 'PROVISION'
+    COMMISSION = 'COMMISSION'
+    EDIT = 'EDIT'
+    DELETE = 'DELETE'
+    BACKFILL = 'BACKFILL'
+    SOURCE_CHOICES = [
+        (PROVISION, 'Provisioning'),
+        (COMMISSION, 'Commissioning'),
+        (EDIT, 'Edit'),
+        (DELETE, 'Delete'),
+        (BACKFILL, 'Backfill (estimated from the asset timestamps)'),
+    ]
+    
+    # Plain id (no FK) so the history outlives the deleted asset
+    asset_id = models.BigIntegerField()
+    from_status = models.CharField(max_length=20, choices=STATUS_CHOICES, null=True, blank=True)
+    to_status = models.CharField(max_length=20, choices=STATUS_CHOICES, null=True, blank=True)
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    entered_at = models.DateTimeField()
+    left_at = models.DateTimeField(null=True, blank=True)
+    duration = models.DurationField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['entered_at', 'id']
+        indexes = [
+            # History and current stint of one asset
+            models.Index(fields=['asset_id', 'entered_at'], name='transition_asset_entered_idx'),
+            # Point-in-time counts: stints of a status open at a moment
+            models.Index(fields=['to_status', 'entered_at', 'left_at'], name='transition_status_entered_idx'),
+            # Time-in-state of stints that ended in a period
+            models.Index(fields=['to_status', 'left_at', 'duration'], name='transition_status_left_idx'),
+        ]
+    
+    def __str__(self):
+        return f"asset {self.asset_id}: {self.from_status or '-'} -> {self.to_status or 'deleted'}"
+
+
+class CommissioningReceipt(models.Model):
+    """
+    Result of an applied batch commissioning record, keyed by the client's
+    idempotency key: a retried record gets the stored result back instead
+    of being applied twice.
+    """
+    key = models.CharField(max_length=100, unique=True)
+    asset = models.ForeignKey(Asset, on_delete=models.CASCADE, related_name='commissioning_receipts')
+    result = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.key} -> asset {self.asset_id}"
@@ -0,0 +1,86 @@
+"""
+QR codes of the complaint URLs printed on assets.
+
+A PNG is rendered once per complaint URL and stored content-addressed
+(qr_codes/<sha256 of the URL>.png) in the default storage; Asset.qr_code
+points at it. A new image is only rendered when the URL changes, i.e. a
+different asset or a different site base URL.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.urls import reverse
+
+from .models import Asset
+from .qr_render import render_png
+
+QR_DIRECTORY = 'qr_codes'
+
+# Part of the digest, bump when qr_render.render_png changes
+QR_RENDER_VERSION = 1
+
+# Served QR images never change (their name is their content)
+QR_CACHE_SECONDS = 365 * 24 * 60 * 60
+
+
+def base_url(request=None):
+    """Site root used in complaint URLs: QR_BASE_URL, else the request's host"""
+    configured = getattr(settings, 'QR_BASE_URL', '')
+    if configured:
+        return configured.rstrip('/')
+    if request is None:
+        raise ValueError('QR_BASE_URL is not set and there is no request to take the host from.')
+    return request.build_absolute_uri('/').rstrip('/')
+
+
+def complaint_url(asset, root):
+    return root + reverse('citizen_portal:report_step1', kwargs={'asset_id': asset.id})
+
+
+def digest(url):
+    return hashlib.sha256(f'{QR_RENDER_VERSION}:{url}'.encode('utf-8')).hexdigest()
+
+
+def storage_name(url):
+    return f'{QR_DIRECTORY}/{digest(url)}.png'
+
+
+def _store(url):
+    """Stored image name of url, rendering it only if no image exists yet"""
+    name = storage_name(url)
+    if not default_storage.exists(name):
+        saved = default_storage.save(name, ContentFile(render_png(url)))
+        if saved != name:
+            # Rendered concurrently, keep the first copy
+            default_storage.delete(saved)
+    return name
+
+
+def ensure_qr_code(asset, root):
+    """
+    Make asset.qr_code the stored image of its current complaint URL,
+    rendering it only if no image for that URL exists yet. Returns the
+    complaint URL.
+    """
+    url = complaint_url(asset, root)
+    name = _store(url)
+
+    if asset.qr_code.name != name:
+        asset.qr_code.name = name
+        # Plain update: a new QR image is not a map change
+        Asset.objects.filter(pk=asset.pk).update(qr_code=name)
+    return url
+
+
+def ensure_qr_codes(assets, root):
+    """ensure_qr_code for many assets, with one UPDATE for those that changed"""
+    changed = []
+    for asset in assets:
+        name = _store(complaint_url(asset, root))
+        if asset.qr_code.name != name:
+            asset.qr_code.name = name
+            changed.append(asset)
+    if changed:
+        Asset.objects.bulk_update(changed, ['qr_code'], batch_size=500)
@@ -0,0 +1,70 @@
+"""
+QR and label rendering. No Django imports, so process pool workers
+(asset.labels) can import it under any multiprocessing start method.
+"""
+from io import BytesIO
+
+import qrcode
+from PIL import Image, ImageDraw, ImageFont
+
+# One sticker: QR code with the asset number underneath (200 dpi)
+LABEL_SIZE = (440, 520)
+LABEL_QR_SIZE = 420
+LABEL_FONT_SIZE = 30
+
+
+def make_qr(url, box_size=10, border=4, fit_size=None):
+    """
+    QR code image of url. With fit_size the modules are scaled to the
+    largest whole pixel size that fits in fit_size pixels.
+    """
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+    if fit_size:
+        qr.box_size = max(1, fit_size // (qr.modules_count + 2 * border))
+    return qr.make_image(fill_color="black", back_color="white").get_image()
+
+
+def render_png(url):
+    """PNG bytes of the QR code of url"""
+    buffer = BytesIO()
+    make_qr(url).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def _font():
+    try:
+        return ImageFont.load_default(size=LABEL_FONT_SIZE)
+    except TypeError:
+        # Pillow without FreeType: fixed size bitmap font
+        return ImageFont.load_default()
+
+
+def render_label(job):
+    """
+    PNG bytes of one bilevel sticker for job = (url, caption). A
+    module-level function of one argument, for ProcessPoolExecutor.map.
+    """
+    url, caption = job
+    label = Image.new('1', LABEL_SIZE, 1)
+
+    code = make_qr(url, border=2, fit_size=LABEL_QR_SIZE).convert('1')
+    offset = (LABEL_QR_SIZE - code.size[0]) // 2
+    label.paste(code, ((LABEL_SIZE[0] - code.size[0]) // 2, offset))
+
+    draw = ImageDraw.Draw(label)
+    font = _font()
+    left, top, right, bottom = draw.textbbox((0, 0), caption, font=font)
+    x = (LABEL_SIZE[0] - (right - left)) // 2
+    y = LABEL_QR_SIZE + (LABEL_SIZE[1] - LABEL_QR_SIZE - (bottom - top)) // 2 - top
+    draw.text((x, y), caption, fill=0, font=font)
+
+    buffer = BytesIO()
+    label.save(buffer, format='PNG', optimize=False)
+    return buffer.getvalue()
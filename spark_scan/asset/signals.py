@@ -0,0 +1,99 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from spark_scan import live
+from .models import Asset, AssetChange, AssetTransition
+from . import lifecycle, map_cache, sync, vector_tiles
+
+
+def _invalidate_tiles(*points):
+    # Once committed, so a tile rebuilt meanwhile can't be stored as current
+    transaction.on_commit(lambda: vector_tiles.invalidate_points(points))
+
+
+@receiver(pre_save, sender=Asset)
+def remember_previous_state(sender, instance, **kwargs):
+    """
+    Keep the stored status to detect commissioning and transitions, the
+    stored type/group to move the asset's complaint rollups, and the stored
+    position to refresh the tiles the asset leaves.
+    """
+    instance._previous_status = None
+    instance._previous_dimensions = None
+    instance._previous_position = None
+    if instance.pk:
+        previous = Asset.objects.filter(pk=instance.pk).values_list(
+            'status', 'asset_type', 'asset_group', 'latitude', 'longitude'
+        ).first()
+        if previous:
+            instance._previous_status = previous[0]
+            instance._previous_dimensions = previous[1:3]
+            instance._previous_position = previous[3:]
+
+
+@receiver(post_save, sender=Asset)
+@receiver(post_delete, sender=Asset)
+@receiver(post_save, sender='citizen_portal.Complaint')
+@receiver(post_delete, sender='citizen_portal.Complaint')
+def bump_map_data_version(sender, instance, **kwargs):
+    """New map payloads and their ETags once the change is committed"""
+    transaction.on_commit(map_cache.bump_version)
+
+
+@receiver(post_save, sender=Asset)
+@receiver(post_delete, sender=Asset)
+def invalidate_asset_tiles(sender, instance, **kwargs):
+    """The tiles at the asset's old and new position, no others"""
+    previous = getattr(instance, '_previous_position', None)
+    _invalidate_tiles((instance.latitude, instance.longitude), *([previous] if previous else []))
+
+
+@receiver(post_save, sender='citizen_portal.Complaint')
+@receiver(post_delete, sender='citizen_portal.Complaint')
+def invalidate_complaint_tiles(sender, instance, **kwargs):
+    """Complaint counts are tile attributes, refresh the asset's tiles"""
+    if type(instance).asset.is_cached(instance):
+        position = (instance.asset.latitude, instance.asset.longitude)
+    else:
+        position = Asset.objects.filter(pk=instance.asset_id).values_list('latitude', 'longitude').first()
+    if position:
+        _invalidate_tiles(position)
+
+
+@receiver(post_save, sender=Asset)
+def record_asset_change(sender, instance, **kwargs):
+    sync.record_change(instance.pk)
+
+
+@receiver(post_delete, sender=Asset)
+def record_asset_tombstone(sender, instance, **kwargs):
+    sync.record_change(instance.pk, AssetChange.DELETE)
+
+
+@receiver(post_save, sender='citizen_portal.Complaint')
+@receiver(post_delete, sender='citizen_portal.Complaint')
+def record_complaint_change(sender, instance, **kwargs):
+    """The asset's complaint counters change with its complaints"""
+    sync.record_change(instance.asset_id)
+
+
+@receiver(post_save, sender=Asset)
+def push_asset_commissioned(sender, instance, **kwargs):
+    if instance.status == 'COMMISSIONED' and getattr(instance, '_previous_status', None) != 'COMMISSIONED':
+        event = {'asset_id': instance.pk, 'asset_number': instance.asset_number}
+        transaction.on_commit(lambda: live.publish('asset.commissioned', **event))
+
+
+@receiver(post_save, sender=Asset)
+def record_status_transition(sender, instance, created, **kwargs):
+    previous = None if created else getattr(instance, '_previous_status', None)
+    if created or previous != instance.status:
+        lifecycle.record_transition(
+            instance.pk, previous, instance.status, lifecycle.source_for(previous, instance.status)
+        )
+
+
+@receiver(post_delete, sender=Asset)
+def record_deletion_transition(sender, instance, **kwargs):
+    lifecycle.record_transition(instance.pk, instance.status, None, AssetTransition.DELETE)
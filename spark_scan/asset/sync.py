@@ -0,0 +1,89 @@
+"""
+Delta sync for map clients.
+
+Every asset write and every complaint write (which changes the asset's
+counters) appends an AssetChange row. A client keeps the id of the last
+row it has seen as its sync token and polls for newer rows only, so each
+poll costs time proportional to what changed since then.
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .map_data import asset_feature, commissioned_assets
+from .models import AssetChange
+
+# Beyond this many changes a full reload is cheaper than a delta
+SYNC_MAX_CHANGES = 1000
+
+# How long change rows are kept (see the prune_asset_changes command)
+SYNC_RETENTION = timedelta(days=7)
+
+
+def record_change(asset_id, kind=AssetChange.UPSERT):
+    AssetChange.objects.create(asset_id=asset_id, kind=kind)
+
+
+def record_changes(asset_ids, kind=AssetChange.UPSERT):
+    """record_change for many assets at once (bulk writes that skip the signals)"""
+    AssetChange.objects.bulk_create([AssetChange(asset_id=asset_id, kind=kind) for asset_id in asset_ids])
+
+
+def latest_token():
+    """Current sync token (0 when nothing has changed yet)"""
+    return AssetChange.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+
+def parse_token(value):
+    if value in (None, ''):
+        return None
+    token = int(value)
+    if token < 0:
+        raise ValueError('since must be a positive sync token.')
+    return token
+
+
+def changes_since(since, public=False):
+    """
+    Assets changed after sync token ``since``.
+
+    Returns {'token', 'reset', 'assets', 'deleted'}: current map features of
+    changed assets plus tombstone ids for assets that were deleted or left
+    the map. ``reset`` asks the client to reload fully, either because its
+    token is older than the retained feed or too much has changed.
+    """
+    token = latest_token()
+    result = {'token': token, 'reset': False, 'assets': [], 'deleted': []}
+
+    if since is None or since >= token:
+        return result
+
+    oldest = AssetChange.objects.order_by('pk').values_list('pk', flat=True).first()
+    rows = list(
+        AssetChange.objects.filter(pk__gt=since, pk__lte=token).values_list('asset_id', 'kind')[:SYNC_MAX_CHANGES + 1]
+    )
+    if (oldest is not None and since < oldest - 1) or len(rows) > SYNC_MAX_CHANGES:
+        result['reset'] = True
+        return result
+
+    # The last change of each asset wins
+    latest_kind = {}
+    for asset_id, kind in rows:
+        latest_kind[asset_id] = kind
+
+    upserted = [asset_id for asset_id, kind in latest_kind.items() if kind == AssetChange.UPSERT]
+    visible = commissioned_assets().filter(pk__in=upserted)
+    result['assets'] = [asset_feature(asset, public=public) for asset in visible]
+
+    # Deleted, decommissioned or un-located assets disappear from the map
+    shown = {feature['properties']['id'] for feature in result['assets']}
+    result['deleted'] = sorted(asset_id for asset_id in latest_kind if asset_id not in shown)
+    return result
+
+
+def prune(retention=SYNC_RETENTION):
+    """Delete change rows older than retention (the newest row is always kept)"""
+    newest = latest_token()
+    cutoff = timezone.now() - retention
+    deleted, _ = AssetChange.objects.filter(created_at__lt=cutoff).exclude(pk=newest).delete()
+    return deleted
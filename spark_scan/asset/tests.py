@@ -1,3 +1,798 @@
-from django.test import TestCase
+import csv
+import datetime
+import importlib
+import io
+import json
+import random
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from authentication.models import Profile
+from spark_scan import live
+from spark_scan.testing import QueryBudgetMixin, QueryPlanMixin
+from .map_data import assets_in_bbox, parse_bbox
+from .models import Asset, AssetChange, AssetTransition, CommissioningReceipt
+from .views import ImportAssetsView, QRLabelsView
+from . import geo, importer, labels, lifecycle, listing, map_cache, map_data, qr, sync, vector_tiles
+
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def seed_assets(count=200):
+    """Assets of every status and type, spread over a small area"""
+    statuses = ['PROVISIONED', 'COMMISSIONED', 'COMMISSIONED', 'FAULTY', 'INACTIVE']
+    Asset.objects.bulk_create([
+        Asset(
+            asset_type='TRANSFORMER' if number % 4 == 0 else 'POLE',
+            asset_number=f'P-{number:05d}',
+            asset_group='UPDO',
+            status=statuses[number % len(statuses)],
+            provisioning_date=datetime.date(2025, 1, 1) + datetime.timedelta(days=number % 90),
+            provisioned_by='seed',
+            planned_location='seed',
+            latitude=6 + number / 1000,
+            longitude=3 + number / 1000,
+            dmm='Option1',
+            secondary_connection='SC1',
+            ct_ratio='100:5',
+            pt_ratio='11000:110',
+        )
+        for number in range(count)
+    ])
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class AssetQueryPlanTests(QueryPlanMixin, TestCase):
+    """The asset and map views must not read the asset table whole"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_assets()
+        cls.officer = Profile.objects.create_user('officer', password='x', role='Officer', phone_num='100')
+
+    def setUp(self):
+        self.client.force_login(self.officer)
+
+    def test_asset_list(self):
+        for params in [
+            {},
+            {'status': 'COMMISSIONED'},
+            {'status': 'COMMISSIONED', 'type': 'POLE'},
+            {'search': 'P-001'},
+            {'sort': 'number'},
+            {'sort': '-provisioned'},
+        ]:
+            with self.subTest(params=params):
+                self.assertViewNoFullScan(self.client, '/asset/list/', params)
+
+    def test_asset_list_next_page(self):
+        response = self.client.get('/asset/list/', {'status': 'COMMISSIONED', 'type': 'POLE'})
+        self.assertViewNoFullScan(self.client, '/asset/list/', {
+            'status': 'COMMISSIONED', 'type': 'POLE', 'after': response.context['next_cursor'],
+        })
+
+    def test_asset_number_search_ignores_case_and_uses_its_index(self):
+        def numbers(term):
+            return set(listing.filter_assets(Asset.objects.all(), search=term).values_list('asset_number', flat=True))
+
+        self.assertEqual(numbers('p-001'), numbers('P-001'))
+        self.assertEqual(numbers('p-001'), {f'P-{number:05d}' for number in range(100, 200)})
+        self.assertUsesIndex(listing.filter_assets(Asset.objects.all(), search='p-001'), 'asset_number_upper_idx')
+
+    def test_status_and_type_filter_uses_composite_index(self):
+        assets = Asset.objects.filter(status='COMMISSIONED', asset_type='POLE').order_by('-created_at', '-id')
+        self.assertUsesIndex(assets[:50], 'asset_status_type_created_idx')
+
+    def test_map_viewport_uses_bbox_index(self):
+        self.assertUsesIndex(assets_in_bbox((6.0, 3.0, 6.05, 3.05)), 'asset_status_lat_lng_idx')
+
+    def test_map_views(self):
+        self.assertViewNoFullScan(self.client, '/dashboard/')
+        self.assertViewNoFullScan(self.client, '/')
+        for zoom in ('10', '18'):
+            for url in ('/dashboard/data/', '/map-data/'):
+                with self.subTest(url=url, zoom=zoom):
+                    self.assertViewNoFullScan(self.client, url, {'bbox': '3.0,6.0,3.1,6.1', 'zoom': zoom})
+
+    def test_filtered_export(self):
+        self.assertViewNoFullScan(self.client, '/asset/export/', {'status': 'FAULTY'})
+
+    def test_unfiltered_export_reads_the_table_once(self):
+        # A full export reads every row by design, in primary key order
+        self.assertViewNoFullScan(self.client, '/asset/export/', allowed=['asset_asset'])
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class AssetQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Queries per page stay constant however many assets there are"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_assets()
+        cls.officer = Profile.objects.create_user('officer', password='x', role='Officer', phone_num='100')
+
+    def setUp(self):
+        self.client.force_login(self.officer)
+
+    def test_asset_list(self):
+        # Session, user, one page
+        response = self.assertQueryBudget(self.client, '/asset/list/', 3)
+        self.assertQueryBudget(self.client, '/asset/list/', 3, {'after': response.context['next_cursor']})
+        self.assertQueryBudget(self.client, '/asset/list/', 3, {'status': 'FAULTY', 'type': 'POLE'})
+
+    def test_map_view(self):
+        # Session, user, map bounds, sync token, complaint totals
+        self.assertQueryBudget(self.client, '/dashboard/', 5)
+
+    def test_map_data(self):
+        # Session, user, the MAP_MAX_ASSETS check, the assets
+        self.assertQueryBudget(self.client, '/dashboard/data/', 4, {'bbox': '3.0,6.0,3.2,6.2', 'zoom': '18'})
+        self.assertQueryBudget(self.client, '/map-data/', 1, {'bbox': '3.0,6.0,3.2,6.2', 'zoom': '10'})
+
+    def test_panning_reuses_the_cluster_grid(self):
+        self.assertQueryBudget(self.client, '/map-data/', 1, {'bbox': '3.0,6.0,3.2,6.2', 'zoom': '11'})
+        # Any other viewport at that zoom is cut from the cached grid
+        response = self.assertQueryBudget(self.client, '/map-data/', 0, {'bbox': '3.013,6.007,3.19,6.23', 'zoom': '11'})
+        self.assertTrue(response.json()['clustered'])
+
+
+class AssetListingTests(TestCase):
+    """Keyset pages cover the list once, in order, in both directions"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_assets(40)
+        # Ties on the sort key are broken by the id
+        Asset.objects.filter(pk__lte=Asset.objects.order_by('pk')[10].pk).update(created_at=datetime.datetime(
+            2025, 1, 1, tzinfo=datetime.timezone.utc
+        ))
+
+    def walk(self, queryset, sort):
+        pages = [listing.paginate(queryset, sort, page_size=7)]
+        while pages[-1]['next_cursor']:
+            pages.append(listing.paginate(queryset, sort, after=pages[-1]['next_cursor'], page_size=7))
+        return pages
+
+    def test_next_and_previous_cursors(self):
+        queryset = listing.filter_assets(Asset.objects.all(), asset_type='POLE')
+        for sort, order in [('-created', ['-created_at', '-pk']), ('number', ['asset_number', 'pk'])]:
+            with self.subTest(sort=sort):
+                pages = self.walk(queryset, sort)
+                ids = [asset.pk for page in pages for asset in page['assets']]
+                self.assertEqual(ids, list(queryset.order_by(*order).values_list('pk', flat=True)))
+                self.assertIsNone(pages[0]['previous_cursor'])
+
+                # Walking back from the last page gives the same pages
+                for index in range(len(pages) - 1, 0, -1):
+                    previous = listing.paginate(queryset, sort, before=pages[index]['previous_cursor'], page_size=7)
+                    self.assertEqual(previous['assets'], pages[index - 1]['assets'])
+                    self.assertIsNotNone(previous['next_cursor'])
+                self.assertIsNone(previous['previous_cursor'])
+
+    def test_malformed_cursors_start_over(self):
+        first = listing.paginate(Asset.objects.all(), page_size=7)
+        truncated = listing.encode_cursor(Asset.objects.first(), 'created_at')[:-3]
+        # Not base64, not JSON, not a pair, not a date
+        for cursor in ['***', 'garbage', truncated, 'W10', 'WyJ4IiwgMV0']:
+            with self.subTest(cursor=cursor):
+                for direction in ('after', 'before'):
+                    page = listing.paginate(Asset.objects.all(), page_size=7, **{direction: cursor})
+                    self.assertEqual(page['assets'], first['assets'])
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class AssetExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_assets(1)
+        Asset.objects.update(
+            planned_location='=HYPERLINK("http://example.com","open")',
+            provisioned_by='@crew',
+            longitude=-3.5,
+        )
+        cls.officer = Profile.objects.create_user('officer', password='x', role='Officer', phone_num='100')
+
+    def setUp(self):
+        self.client.force_login(self.officer)
+
+    def test_csv_cells_never_start_a_formula(self):
+        response = self.client.get('/asset/export/')
+        header, row = csv.reader(b''.join(response.streaming_content).decode().splitlines())
+        row = dict(zip(header, row))
+        self.assertEqual(row['planned_location'], '\'=HYPERLINK("http://example.com","open")')
+        self.assertEqual(row['provisioned_by'], "'@crew")
+        # Numbers keep their sign
+        self.assertEqual(row['longitude'], '-3.500000')
+
+        record = json.loads(b''.join(self.client.get('/asset/export/', {'format': 'ndjson'}).streaming_content))
+        self.assertEqual(record['provisioned_by'], '@crew')
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class MapDataTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_assets(50)
+
+    def test_bbox_must_be_four_ordered_finite_numbers(self):
+        self.assertEqual(parse_bbox('2.5,5.5,3.5,6.5'), (5.5, 2.5, 6.5, 3.5))
+        self.assertEqual(parse_bbox('-200,-95,200,95'), (-90.0, -180.0, 90.0, 180.0))
+        for value in ['', '1,2,3', '3,2,1,4', 'a,b,c,d', 'nan,5,3,6', '2,5,inf,6', '-inf,-inf,inf,inf', '1e999,5,3,6']:
+            with self.subTest(bbox=value), self.assertRaises(ValueError):
+                parse_bbox(value)
+
+    def decode_columnar(self, payload):
+        """The map templates' decoding of a columnar payload, as GeoJSON-like (coordinates, properties)"""
+        strings = payload['strings']
+        assets = []
+        for i, asset_id in enumerate(payload['ids']):
+            properties = {
+                'id': asset_id,
+                'asset_type': 'TRANSFORMER' if payload['flags'][i] & map_data.FLAG_TRANSFORMER else 'POLE',
+                'asset_number': payload['numbers'][i],
+                'location': strings[payload['location'][i]],
+                'has_complaints': bool(payload['flags'][i] & map_data.FLAG_HAS_COMPLAINTS),
+                'open_complaints': payload['open'][i],
+            }
+            if 'status' in payload:
+                properties.update({
+                    'status': strings[payload['status'][i]],
+                    'commissioning_date': strings[payload['date'][i]],
+                    'actual_cost': strings[payload['cost'][i]],
+                    'total_complaints': payload['total'][i],
+                })
+            coordinates = [
+                round(payload['lng0'] + payload['lng'][i] / payload['scale'], 6),
+                round(payload['lat0'] + payload['lat'][i] / payload['scale'], 6),
+            ]
+            assets.append((coordinates, properties))
+        return assets
+
+    def test_columnar_payloads_decode_to_the_geojson(self):
+        Asset.objects.filter(asset_number__in=['P-00001', 'P-00002']).update(
+            open_complaints=2, total_complaints=5, actual_cost='1250.50',
+            commissioning_date=datetime.date(2025, 4, 1), actual_location='Market road',
+        )
+        bbox = (6.0, 3.0, 6.05, 3.05)
+        for public in (False, True):
+            with self.subTest(public=public):
+                geojson = map_data.build_map_data(bbox, 18, public=public)
+                expected = [
+                    ([round(value, 6) for value in feature['geometry']['coordinates']], feature['properties'])
+                    for feature in geojson['features']
+                ]
+                columnar = map_data.build_map_data(bbox, 18, public=public, payload_format='columnar')
+                decoded = self.decode_columnar(json.loads(json.dumps(columnar)))
+                self.assertEqual(
+                    sorted(decoded, key=lambda item: item[1]['id']), sorted(expected, key=lambda item: item[1]['id'])
+                )
+                self.assertTrue(any(properties['has_complaints'] for _, properties in decoded))
+
+        clusters = map_data.build_map_data(bbox, 10)
+        columnar = map_data.build_map_data(bbox, 10, payload_format='columnar')
+        self.assertEqual(
+            sorted(zip(columnar['lng'], columnar['lat'], columnar['count'], columnar['open'])),
+            sorted(
+                (round(feature['geometry']['coordinates'][0], 6), round(feature['geometry']['coordinates'][1], 6),
+                 feature['properties']['count'], feature['properties']['open_complaints'])
+                for feature in clusters['features']
+            ),
+        )
+
+    def test_public_data_needs_a_zoom_and_large_viewports_get_clusters(self):
+        self.assertEqual(self.client.get('/map-data/', {'bbox': '-180,-90,180,90'}).status_code, 400)
+
+        assets = self.client.get('/map-data/', {'bbox': '3.0,6.0,3.1,6.1', 'zoom': '18'}).json()
+        self.assertNotIn('clustered', assets)
+        self.assertEqual(len(assets['features']), assets_in_bbox((6.0, 3.0, 6.1, 3.1)).count())
+
+        with mock.patch.object(map_data, 'MAP_MAX_ASSETS', 5):
+            clusters = self.client.get('/map-data/', {'bbox': '-180,-90,180,90', 'zoom': '18'}).json()
+        self.assertTrue(clusters['clustered'])
+        self.assertEqual(sum(feature['properties']['count'] for feature in clusters['features']), 20)
+
+
+class GeoTests(TestCase):
+    """The geohash radius queries agree with a brute-force distance check"""
+
+    center = (6.5, 3.4)
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(4)
+        assets = []
+        for number in range(400):
+            asset = Asset(
+                asset_type='POLE', asset_number=f'G-{number:05d}', asset_group='UPDO', status='COMMISSIONED',
+                provisioning_date=datetime.date(2025, 1, 1), provisioned_by='seed', planned_location='seed',
+                latitude=round(cls.center[0] + rng.uniform(-0.03, 0.03), 6),
+                longitude=round(cls.center[1] + rng.uniform(-0.03, 0.03), 6),
+                dmm='Option1', secondary_connection='SC1', ct_ratio='100:5', pt_ratio='11000:110',
+            )
+            # bulk_create skips save(), which sets the geohash
+            asset.update_geohash()
+            assets.append(asset)
+        Asset.objects.bulk_create(assets)
+
+    def brute_force(self, latitude, longitude, radius_m):
+        distances = {
+            asset.pk: geo.distance_m(latitude, longitude, asset.latitude, asset.longitude)
+            for asset in Asset.objects.all()
+        }
+        return {pk for pk, distance in distances.items() if distance <= radius_m}, distances
+
+    def test_within_radius_matches_a_brute_force_check(self):
+        rng = random.Random(7)
+        for _ in range(20):
+            latitude = self.center[0] + rng.uniform(-0.03, 0.03)
+            longitude = self.center[1] + rng.uniform(-0.03, 0.03)
+            radius = rng.choice([25, 150, 600, 2500])
+            with self.subTest(point=(latitude, longitude), radius=radius):
+                expected, distances = self.brute_force(latitude, longitude, radius)
+                found = geo.within_radius(Asset.objects.all(), latitude, longitude, radius)
+                self.assertEqual({asset.pk for asset, _ in found}, expected)
+                self.assertEqual([distance for _, distance in found], sorted(distances[pk] for pk in expected))
+
+    def test_nearest_matches_a_brute_force_check(self):
+        _, distances = self.brute_force(*self.center, 0)
+        expected = sorted(distances, key=distances.get)[:5]
+        found = geo.nearest(Asset.objects.all(), *self.center, k=5)
+        self.assertEqual([asset.pk for asset, _ in found], expected)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class VectorTileTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_assets(20)
+        cls.officer = Profile.objects.create_user('officer', password='x', role='Officer', phone_num='100')
+        cls.asset = Asset.objects.filter(status='COMMISSIONED').first()
+        cls.tile = vector_tiles.tile_for_point(float(cls.asset.longitude), float(cls.asset.latitude), 16)
+
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        settings_override = override_settings(MAP_TILE_CACHE_DIR=cache_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def cached_files(self):
+        return sorted(path.name for path in vector_tiles.tile_cache_dir().rglob('*.mvt'))
+
+    def test_tile_built_during_a_change_is_not_served(self):
+        x, y = self.tile
+        build_tile = vector_tiles.build_tile
+
+        def build_then_change(*args):
+            data = build_tile(*args)
+            # A change to an asset of the tile committed while it was being built
+            vector_tiles.invalidate_points([(self.asset.latitude, self.asset.longitude)])
+            return data
+
+        with mock.patch.object(vector_tiles, 'build_tile', side_effect=build_then_change):
+            vector_tiles.get_tile(16, x, y)
+        with mock.patch.object(vector_tiles, 'build_tile', wraps=build_tile) as rebuilt:
+            vector_tiles.get_tile(16, x, y)
+            vector_tiles.get_tile(16, x, y)
+        self.assertEqual(rebuilt.call_count, 1)
+        # The superseded file of the tile is gone
+        self.assertEqual(len(self.cached_files()), 1)
+
+    def test_a_change_only_invalidates_the_tiles_showing_it(self):
+        x, y = self.tile
+        far = vector_tiles.tile_for_point(100.0, 40.0, 16)
+        vector_tiles.get_tile(16, x, y)
+        vector_tiles.get_tile(16, *far)
+        etag, far_etag = vector_tiles.tile_etag(16, x, y, 'full'), vector_tiles.tile_etag(16, *far, 'full')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Asset.objects.create(
+                asset_type='POLE', asset_number='P-FAR', asset_group='UPDO', status='COMMISSIONED',
+                provisioning_date=datetime.date(2025, 1, 1), provisioned_by='seed', planned_location='far',
+                latitude=40.0, longitude=100.0, dmm='Option1', secondary_connection='SC1',
+                ct_ratio='100:5', pt_ratio='11000:110',
+            )
+        self.assertEqual(vector_tiles.tile_etag(16, x, y, 'full'), etag)
+        self.assertNotEqual(vector_tiles.tile_etag(16, *far, 'full'), far_etag)
+
+        # Moving an asset refreshes the tiles at its old and new position
+        asset = Asset.objects.get(pk=self.asset.pk)
+        asset.latitude, asset.longitude = 40.0, 100.0
+        with self.captureOnCommitCallbacks(execute=True):
+            asset.save()
+        self.assertNotEqual(vector_tiles.tile_etag(16, x, y, 'full'), etag)
+        with mock.patch.object(vector_tiles, 'build_tile', wraps=vector_tiles.build_tile) as rebuilt:
+            vector_tiles.get_tile(16, x, y)
+        rebuilt.assert_called_once()
+
+    def test_dashboard_tiles_need_a_login_and_carry_the_details(self):
+        x, y = self.tile
+        url = f'/dashboard/tiles/16/{x}/{y}'
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(self.officer)
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'application/vnd.mapbox-vector-tile')
+        self.assertIn(b'total_complaints', response.content)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_public_tiles_carry_the_public_subset(self):
+        x, y = self.tile
+        response = self.client.get(f'/tiles/16/{x}/{y}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'asset_number', response.content)
+        self.assertNotIn(b'total_complaints', response.content)
+        self.assertEqual(self.client.get(f'/tiles/{vector_tiles.TILE_MIN_ZOOM - 1}/0/0').status_code, 404)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class MapSyncTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_assets(10)
+        cls.officer = Profile.objects.create_user('officer', password='x', role='Officer', phone_num='100')
+
+    def test_changes_since_a_token_carry_upserts_and_tombstones(self):
+        since = sync.latest_token()
+        commissioned = Asset.objects.filter(status='COMMISSIONED').first()
+        provisioned = Asset.objects.filter(status='PROVISIONED').first()
+        commissioned.actual_cost = 1234
+        commissioned.save()
+        provisioned.save()
+        deleted_id = Asset.objects.filter(status='FAULTY').first().pk
+        Asset.objects.filter(pk=deleted_id).get().delete()
+
+        changes = sync.changes_since(since)
+        self.assertFalse(changes['reset'])
+        self.assertEqual(changes['token'], sync.latest_token())
+        self.assertEqual([feature['properties']['id'] for feature in changes['assets']], [commissioned.pk])
+        # Off the map (not commissioned) or deleted: a tombstone each
+        self.assertEqual(changes['deleted'], sorted([provisioned.pk, deleted_id]))
+
+        self.assertEqual(sync.changes_since(changes['token']), {
+            'token': changes['token'], 'reset': False, 'assets': [], 'deleted': [],
+        })
+
+    def test_too_many_changes_ask_for_a_reset(self):
+        since = sync.latest_token()
+        sync.record_changes(Asset.objects.values_list('pk', flat=True)[:3])
+        with mock.patch.object(sync, 'SYNC_MAX_CHANGES', 2):
+            self.assertTrue(sync.changes_since(since)['reset'])
+        self.assertFalse(sync.changes_since(since)['reset'])
+
+    def test_sync_view_adds_the_stats_and_rejects_bad_tokens(self):
+        self.client.force_login(self.officer)
+        since = sync.latest_token()
+        Asset.objects.filter(status='COMMISSIONED').first().save()
+
+        changes = self.client.get('/dashboard/sync/', {'since': since}).json()
+        self.assertEqual(len(changes['assets']), 1)
+        self.assertIn('stats', changes)
+        self.assertNotIn('stats', self.client.get('/dashboard/sync/', {'since': changes['token']}).json())
+        self.assertEqual(self.client.get('/dashboard/sync/', {'since': 'abc'}).status_code, 400)
+
+
+@override_settings(QR_BASE_URL='https://spark.example')
+class QRCodeTests(TestCase):
+    """QR images are stored once per complaint URL, under its digest"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_assets(5)
+        cls.asset, cls.other = Asset.objects.filter(status='COMMISSIONED')[:2]
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def test_an_image_is_rendered_once_per_url(self):
+        with mock.patch.object(qr, 'render_png', wraps=qr.render_png) as render:
+            url = qr.ensure_qr_code(self.asset, 'https://spark.example')
+            qr.ensure_qr_code(Asset.objects.get(pk=self.asset.pk), 'https://spark.example')
+            self.assertEqual(render.call_count, 1)
+
+            name = qr.storage_name(url)
+            self.assertEqual(Asset.objects.get(pk=self.asset.pk).qr_code.name, name)
+            self.assertTrue(name.endswith(f'/{qr.digest(url)}.png'))
+
+            # Another asset or another site root is another URL, so another image
+            qr.ensure_qr_codes([self.other], 'https://spark.example')
+            moved = qr.ensure_qr_code(self.asset, 'https://other.example')
+            self.assertEqual(render.call_count, 3)
+        self.assertNotEqual(qr.storage_name(moved), name)
+        other_name = Asset.objects.get(pk=self.other.pk).qr_code.name
+        self.assertEqual(len({name, qr.storage_name(moved), other_name}), 3)
+
+    def test_images_are_served_immutable_by_digest(self):
+        response = self.client.post(f'/asset/view-qr/{self.asset.pk}/')
+        image_url = response.json()['qr_code']
+        digest = qr.digest(response.json()['complaint_url'])
+        self.assertEqual(image_url, f'/asset/qr/{digest}.png')
+
+        image = self.client.get(image_url)
+        self.assertEqual(image['ETag'], f'"{digest}"')
+        self.assertIn('immutable', image['Cache-Control'])
+        self.assertTrue(b''.join(image.streaming_content).startswith(b'\x89PNG'))
+        self.assertEqual(self.client.get(image_url, HTTP_IF_NONE_MATCH=f'"{digest}"').status_code, 304)
+        self.assertEqual(self.client.get(f'/asset/qr/{"0" * 64}.png').status_code, 404)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class QRLabelTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_assets(60)
+        cls.officer = Profile.objects.create_user('officer', password='x', role='Officer', phone_num='100')
+
+    def setUp(self):
+        self.client.force_login(self.officer)
+
+    def test_pdf_is_streamed_a_sheet_at_a_time_without_a_process_pool(self):
+        with mock.patch.object(labels, 'ProcessPoolExecutor') as pool:
+            response = self.client.get('/asset/qr-labels/', {'format': 'pdf'})
+            chunks = list(response.streaming_content)
+        pool.assert_not_called()
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+
+        # 60 labels at 12 per sheet, each sheet its own chunk
+        document = b''.join(chunks)
+        self.assertEqual(document.count(b'/Type /Page '), 5)
+        self.assertGreaterEqual(len(chunks), 5)
+
+        # Every cross-reference entry points at its object
+        xref = int(document.rsplit(b'startxref\n', 1)[1].split()[0])
+        lines = document[xref:].split(b'\n')
+        size = int(lines[1].split()[1])
+        for number, entry in enumerate(lines[3:2 + size], start=1):
+            offset = int(entry.split()[0])
+            self.assertTrue(document[offset:].startswith(f'{number} 0 obj\n'.encode()))
+
+    def test_labels_follow_every_list_filter(self):
+        params = {'search': 'p-000', 'type': 'TRANSFORMER', 'status': 'PROVISIONED', 'group': 'UPDO'}
+        page = self.client.get('/asset/list/', params).content.decode()
+        self.assertIn(
+            '/asset/qr-labels/?format=pdf&amp;search=p-000&amp;type=TRANSFORMER&amp;status=PROVISIONED&amp;group=UPDO', page
+        )
+
+        with mock.patch.object(labels, 'render_labels', return_value=iter([])) as render:
+            response = self.client.get('/asset/qr-labels/', {'format': 'zip', **params})
+            b''.join(response.streaming_content)
+        # Transformers are every 4th seeded asset, provisioned ones every 5th
+        self.assertEqual(
+            [asset.asset_number for asset in render.call_args.args[0]], ['P-00000', 'P-00020', 'P-00040'],
+        )
+
+    def test_large_selections_are_left_to_the_command(self):
+        with mock.patch.object(QRLabelsView, 'max_assets', 50):
+            response = self.client.get('/asset/qr-labels/', {'format': 'zip'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('generate_qr_labels', response.json()['message'])
+
+
+@override_settings(CACHES=LOCAL_CACHE, QR_BASE_URL='https://spark.example')
+class CommissionBatchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_assets(20)
+        cls.operator = Profile.objects.create_user('operator', password='x', role='Operator', phone_num='200')
+        cls.assets = list(Asset.objects.filter(status='PROVISIONED').order_by('pk')[:3])
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client.force_login(self.operator)
+
+    def records(self, suffix=''):
+        return [{
+            'idempotency_key': f'key-{asset.pk}{suffix}',
+            'asset_id': asset.pk,
+            'commissioning_date': '2025-06-01',
+            'commissioned_by': 'crew 7',
+            'actual_location': 'Installed',
+            'latitude': '6.500000',
+            'longitude': '3.500000',
+            'actual_cost': '1000.00',
+        } for asset in self.assets]
+
+    def commission(self, records):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post(
+                '/asset/commission/batch/', json.dumps({'records': records}), content_type='application/json'
+            )
+        return response.json(), callbacks
+
+    def test_records_are_applied_in_bulk_with_the_signal_side_effects(self):
+        ids = [asset.pk for asset in self.assets]
+        version = map_cache.get_version()
+        with mock.patch.object(Asset, 'save') as save, mock.patch.object(live, 'publish') as publish:
+            body, _ = self.commission(self.records())
+        save.assert_not_called()
+        self.assertEqual(body['commissioned'], 3)
+
+        commissioned = Asset.objects.filter(pk__in=ids, status='COMMISSIONED', commissioned_by='crew 7')
+        self.assertEqual(commissioned.count(), 3)
+        self.assertEqual(CommissioningReceipt.objects.filter(asset_id__in=ids).count(), 3)
+        self.assertEqual(AssetChange.objects.filter(asset_id__in=ids).count(), 3)
+        self.assertEqual(AssetTransition.objects.filter(asset_id__in=ids, to_status='COMMISSIONED').count(), 3)
+
+        # After commit: new map version, live events and the QR images
+        self.assertNotEqual(map_cache.get_version(), version)
+        self.assertEqual(sorted(call.kwargs['asset_id'] for call in publish.call_args_list), ids)
+        for asset, result in zip(commissioned.order_by('pk'), body['results']):
+            self.assertTrue(asset.qr_code.name)
+            self.assertEqual(self.client.get(result['qr_code']).status_code, 200)
+
+    def test_replayed_records_return_the_stored_result(self):
+        first, _ = self.commission(self.records())
+        changes = AssetChange.objects.count()
+
+        replay, callbacks = self.commission(self.records())
+        self.assertEqual(replay['commissioned'], 3)
+        for stored, replayed in zip(first['results'], replay['results']):
+            self.assertEqual(replayed, {**stored, 'replayed': True})
+        self.assertEqual(callbacks, [])
+        self.assertEqual(AssetChange.objects.count(), changes)
+        self.assertEqual(CommissioningReceipt.objects.count(), 3)
+
+    def test_a_key_is_not_reused_for_another_asset(self):
+        self.commission(self.records())
+        record = {**self.records()[0], 'asset_id': self.assets[1].pk}
+        body, _ = self.commission([record])
+        self.assertEqual(body['results'][0]['status'], 'rejected')
+        self.assertIn('idempotency_key', body['results'][0]['errors'])
+
+
+class LifecycleTests(TestCase):
+    """Stints close with their stored durations (computed in SQL on every backend)"""
+
+    start = datetime.datetime(2025, 3, 1, 8, 0, tzinfo=datetime.timezone.utc)
+
+    def test_each_transition_closes_the_previous_stint(self):
+        lifecycle.record_transition(9001, None, 'PROVISIONED', AssetTransition.PROVISION, self.start)
+        lifecycle.record_transition(
+            9001, 'PROVISIONED', 'COMMISSIONED', AssetTransition.COMMISSION, self.start + datetime.timedelta(hours=3)
+        )
+        lifecycle.record_transition(
+            9001, 'COMMISSIONED', 'FAULTY', AssetTransition.EDIT, self.start + datetime.timedelta(days=1, minutes=30)
+        )
+
+        stints = list(lifecycle.history(9001).values_list('to_status', 'left_at', 'duration'))
+        self.assertEqual(stints, [
+            ('PROVISIONED', self.start + datetime.timedelta(hours=3), datetime.timedelta(hours=3)),
+            ('COMMISSIONED', self.start + datetime.timedelta(days=1, minutes=30), datetime.timedelta(hours=21, minutes=30)),
+            ('FAULTY', None, None),
+        ])
+        self.assertEqual(lifecycle.status_at(9001, self.start + datetime.timedelta(hours=5)), 'COMMISSIONED')
+        self.assertEqual(
+            lifecycle.time_in_status(9001, 'FAULTY', now=self.start + datetime.timedelta(days=2, minutes=30)),
+            datetime.timedelta(days=1),
+        )
+
+    def test_bulk_transitions_close_each_assets_own_stint(self):
+        for offset, asset_id in enumerate((9001, 9002)):
+            lifecycle.record_transition(
+                asset_id, None, 'PROVISIONED', AssetTransition.PROVISION, self.start + datetime.timedelta(hours=offset)
+            )
+        lifecycle.record_transitions(
+            [9001, 9002], 'PROVISIONED', 'COMMISSIONED', AssetTransition.COMMISSION, self.start + datetime.timedelta(hours=4)
+        )
+
+        durations = dict(AssetTransition.objects.filter(to_status='PROVISIONED').values_list('asset_id', 'duration'))
+        self.assertEqual(durations, {9001: datetime.timedelta(hours=4), 9002: datetime.timedelta(hours=3)})
+        self.assertEqual(lifecycle.average_duration('PROVISIONED'), datetime.timedelta(hours=3, minutes=30))
+        self.assertEqual(lifecycle.counts_at(self.start + datetime.timedelta(hours=2)), {'PROVISIONED': 2})
+
+    def test_backfill_seeds_the_history_from_the_asset_timestamps(self):
+        seed_assets(5)
+        updated = self.start + datetime.timedelta(days=10)
+        Asset.objects.update(created_at=self.start, updated_at=updated)
+        backfill = importlib.import_module('asset.migrations.0008_asset_transition_log').backfill_transitions
+        backfill(django_apps, None)
+
+        for asset_id, status in Asset.objects.values_list('id', 'status'):
+            rows = list(lifecycle.history(asset_id).values_list(
+                'from_status', 'to_status', 'source', 'entered_at', 'left_at', 'duration'
+            ))
+            with self.subTest(status=status):
+                if status == 'PROVISIONED':
+                    self.assertEqual(rows, [(None, 'PROVISIONED', 'BACKFILL', self.start, None, None)])
+                else:
+                    self.assertEqual(rows, [
+                        (None, 'PROVISIONED', 'BACKFILL', self.start, updated, datetime.timedelta(days=10)),
+                        ('PROVISIONED', status, 'BACKFILL', updated, None, None),
+                    ])
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class AssetImportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_assets(5)
+        cls.officer = Profile.objects.create_user('officer', password='x', role='Officer', phone_num='100')
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def row(self, asset_number, **values):
+        return {
+            'asset_type': 'POLE', 'asset_number': asset_number, 'asset_group': 'UPDO',
+            'provisioning_date': '2025-02-01', 'provisioned_by': 'import', 'planned_location': 'Street 1',
+            'dmm': 'Option1', 'secondary_connection': 'SC1', 'ct_ratio': '100:5', 'pt_ratio': '11000:110',
+            **values,
+        }
+
+    def csv_file(self, rows):
+        content = io.StringIO()
+        writer = csv.DictWriter(content, fieldnames=importer.IMPORT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+        return SimpleUploadedFile('assets.csv', content.getvalue().encode('utf-8'), 'text/csv')
+
+    def test_rows_are_validated_and_checked_against_the_database_once_per_chunk(self):
+        rows = [
+            self.row('IMP-1'),
+            self.row('IMP-1'),
+            self.row('IMP-2', asset_type='LAMP'),
+            self.row('P-00000'),
+            self.row('IMP-3'),
+        ]
+        with self.assertNumQueries(2):
+            result = importer.import_assets(rows, chunk_size=3, dry_run=True)
+        self.assertEqual((result.rows, result.created, result.error_count), (5, 2, 3))
+        self.assertEqual(
+            [(error.row, error.field) for error in result.errors],
+            [(3, 'asset_number'), (4, 'asset_type'), (5, 'asset_number')],
+        )
+        self.assertIn('Duplicate', result.errors[0].message)
+        self.assertIn('already exists', result.errors[2].message)
+
+        result = importer.import_assets(rows, chunk_size=3)
+        self.assertEqual(result.created, 2)
+        imported = Asset.objects.filter(asset_number__startswith='IMP-').values_list('asset_number', flat=True)
+        self.assertEqual(set(imported), {'IMP-1', 'IMP-3'})
+        # Bulk inserted, the status history is written directly
+        self.assertEqual(lifecycle.history(Asset.objects.get(asset_number='IMP-3').pk).count(), 1)
+
+    def test_a_rebound_form_keeps_nothing_of_the_previous_row(self):
+        form = importer.ImportRowForm()
+        self.assertFalse(form.rebind(self.row('IMP-1', asset_type='LAMP')).is_valid())
+        self.assertTrue(form.rebind(self.row('IMP-2')).is_valid())
+        self.assertEqual(form.save(commit=False).asset_number, 'IMP-2')
+        self.assertIsNone(form.instance.pk)
+
+    def test_the_report_has_every_error_the_page_only_the_first(self):
+        self.client.force_login(self.officer)
+        rows = [self.row(f'BAD-{number}', asset_type='LAMP') for number in range(5)] + [self.row('IMP-OK')]
+        with mock.patch.object(ImportAssetsView, 'shown_errors', 2):
+            response = self.client.post('/asset/import/', {'file': self.csv_file(rows)})
+
+        self.assertEqual(response.context['result'].error_count, 5)
+        self.assertEqual(len(response.context['shown_errors']), 2)
+        self.assertTrue(Asset.objects.filter(asset_number='IMP-OK').exists())
+
+        report = self.client.get(response.context['report_url'])
+        lines = b''.join(report.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(lines[0], 'row,asset_number,field,message')
+        self.assertEqual([line.split(',')[:2] for line in lines[1:]], [[str(number + 2), f'BAD-{number}'] for number in range(5)])
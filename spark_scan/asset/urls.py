@@ -8,9 +8,16 @@ urlpatterns = [
     # NEW: Asset List (for Actions button)
     path('list/', views.AssetListView.as_view(), name='asset_list'),
     
+    # Streaming CSV/NDJSON export with the list filters
+    path('export/', views.AssetExportView.as_view(), name='asset_export'),
+    
     # Provisioning
     path('provision/', views.ProvisionAssetView.as_view(), name='provision'),
     
+    # Bulk provisioning from CSV/XLSX (Officer only)
+    path('import/', views.ImportAssetsView.as_view(), name='import_assets'),
+    path('import/reports/<str:name>', views.import_report, name='import_report'),
+    
     # NEW: Edit Asset (Officer only)
     path('edit/<int:asset_id>/', views.EditAssetView.as_view(), name='edit_asset'),
     
@@ -20,6 +27,15 @@ urlpatterns = [
     # NEW: View QR Code (All roles)
     path('view-qr/<int:asset_id>/', views.view_qr_code, name='view_qr'),
     
+    # Stored QR images (content-addressed, long-lived cache headers)
+    path('qr/<str:digest>.png', views.qr_code_image, name='qr_image'),
+    
+    # Bulk QR label sheets (PDF) or archives (ZIP)
+    path('qr-labels/', views.QRLabelsView.as_view(), name='qr_labels'),
+    
     # Commissioning
     path('commission/<int:asset_id>/', views.CommissionAssetView.as_view(), name='commission'),
+    
+    # Batch commissioning API for field crews (idempotent records)
+    path('commission/batch/', views.CommissionBatchView.as_view(), name='commission_batch'),
 ]
\ No newline at end of file
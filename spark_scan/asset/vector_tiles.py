@@ -0,0 +1,269 @@
+"""
+Mapbox Vector Tile (MVT) encoding and on-disk tile cache for commissioned assets.
+
+The encoder writes the protobuf wire format directly, it only needs the
+small subset of the spec used here (one point layer with attributes).
+
+Each tile has its own data version in the cache (tile_version), dropped
+for the tiles showing an asset when it or its complaints change
+(invalidate_points, run once the change is committed). Cached tiles are
+stored under their version, so a tile built from data that changes before
+it is written lands under a superseded name and is never read again; a
+tile's older files are removed when its current one is stored. A write
+leaves every other tile, cached file and ETag alone.
+"""
+import hashlib
+import math
+import os
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+
+from .map_data import CLUSTER_MAX_ZOOM, asset_feature, assets_in_bbox
+from . import map_cache
+
+# Bump when the tile contents change so stale cached tiles are ignored
+MAP_TILE_VERSION = 3
+
+# Zoom levels served as tiles, the maps show clusters below
+TILE_MIN_ZOOM = CLUSTER_MAX_ZOOM + 1
+TILE_MAX_ZOOM = 19
+
+TILE_EXTENT = 4096
+TILE_LAYER_NAME = 'assets'
+
+# Assets just outside the tile are included so markers are not clipped
+TILE_BUFFER = 64
+
+
+# ---------- tile math (Web Mercator / slippy map) ----------
+
+def lnglat_to_tile_fraction(lng, lat, zoom):
+    """Fractional tile coordinates of a point at a zoom level"""
+    lat = max(min(lat, 85.0511287798), -85.0511287798)
+    n = 2 ** zoom
+    x = (lng + 180.0) / 360.0 * n
+    lat_rad = math.radians(lat)
+    y = (1.0 - math.log(math.tan(lat_rad) + 1.0 / math.cos(lat_rad)) / math.pi) / 2.0 * n
+    return x, y
+
+
+def tile_for_point(lng, lat, zoom):
+    """(x, y) of the tile containing a point"""
+    x, y = lnglat_to_tile_fraction(lng, lat, zoom)
+    n = 2 ** zoom
+    return min(int(x), n - 1), min(int(y), n - 1)
+
+
+def tile_bbox(zoom, x, y, buffer=0):
+    """(south, west, north, east) of a tile, optionally grown by buffer tile units"""
+    n = 2 ** zoom
+    pad = buffer / TILE_EXTENT
+
+    def lng(tx):
+        return tx / n * 360.0 - 180.0
+
+    def lat(ty):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+    west, east = lng(x - pad), lng(x + 1 + pad)
+    north, south = lat(y - pad), lat(y + 1 + pad)
+    return max(south, -90.0), max(west, -180.0), min(north, 90.0), min(east, 180.0)
+
+
+def is_valid_tile(zoom, x, y):
+    return TILE_MIN_ZOOM <= zoom <= TILE_MAX_ZOOM and 0 <= x < 2 ** zoom and 0 <= y < 2 ** zoom
+
+
+# ---------- protobuf encoding ----------
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 31)
+
+
+def _key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _length_delimited(field, payload):
+    return _key(field, 2) + _varint(len(payload)) + payload
+
+
+def _uint_field(field, value):
+    return _key(field, 0) + _varint(value)
+
+
+def _packed(field, values):
+    return _length_delimited(field, b''.join(_varint(v) for v in values))
+
+
+def _encode_value(value):
+    """Encode a tile Value message (string, bool or unsigned int)"""
+    if isinstance(value, bool):
+        return _uint_field(7, int(value))
+    if isinstance(value, int) and value >= 0:
+        return _uint_field(5, value)
+    return _length_delimited(1, str(value).encode('utf-8'))
+
+
+def encode_tile(zoom, x, y, features):
+    """
+    Encode point features as a single-layer MVT.
+
+    features: iterable of (id, lng, lat, {attribute: value}) tuples.
+    """
+    keys, key_index = [], {}
+    values, value_index = [], {}
+    encoded_features = []
+
+    for feature_id, lng, lat, attributes in features:
+        fx, fy = lnglat_to_tile_fraction(lng, lat, zoom)
+        px = int(round((fx - x) * TILE_EXTENT))
+        py = int(round((fy - y) * TILE_EXTENT))
+
+        tags = []
+        for key, value in attributes.items():
+            if key not in key_index:
+                key_index[key] = len(keys)
+                keys.append(key)
+            value_key = (type(value), value)
+            if value_key not in value_index:
+                value_index[value_key] = len(values)
+                values.append(value)
+            tags.extend((key_index[key], value_index[value_key]))
+
+        # MoveTo(1) command followed by the zigzag encoded point
+        geometry = [(1 & 0x7) | (1 << 3), _zigzag(px), _zigzag(py)]
+
+        encoded_features.append(_length_delimited(2, b''.join([
+            _uint_field(1, feature_id),
+            _packed(2, tags),
+            _uint_field(3, 1),  # GeomType.POINT
+            _packed(4, geometry),
+        ])))
+
+    layer = b''.join([
+        _uint_field(15, 2),  # version
+        _length_delimited(1, TILE_LAYER_NAME.encode('utf-8')),
+        *encoded_features,
+        *(_length_delimited(3, key.encode('utf-8')) for key in keys),
+        *(_length_delimited(4, _encode_value(value)) for value in values),
+        _uint_field(5, TILE_EXTENT),
+    ])
+    return _length_delimited(3, layer)
+
+
+def build_tile(zoom, x, y, public=False):
+    """Encode the commissioned assets of one tile, with the map popup attributes"""
+    assets = assets_in_bbox(tile_bbox(zoom, x, y, buffer=TILE_BUFFER))
+    features = (
+        (asset.id, float(asset.longitude), float(asset.latitude), asset_feature(asset, public=public)['properties'])
+        for asset in assets
+    )
+    return encode_tile(zoom, x, y, features)
+
+
+def tile_url_template(url_name):
+    """Leaflet URL template ({z}/{x}/{y}) of a tile endpoint"""
+    return reverse(url_name, args=(0, 0, 0)).replace('/0/0/0', '/{z}/{x}/{y}')
+
+
+# ---------- disk cache ----------
+
+def tile_cache_dir():
+    return Path(getattr(settings, 'MAP_TILE_CACHE_DIR', Path(settings.BASE_DIR) / 'tile_cache'))
+
+
+def tile_version(zoom, x, y):
+    """(token, modified timestamp) of the data shown by one tile"""
+    return map_cache.get_version(f'map_tile:{zoom}/{x}/{y}')
+
+
+def tiles_for_point(lng, lat):
+    """(zoom, x, y) of every served tile showing a point, buffered neighbours included"""
+    pad = TILE_BUFFER / TILE_EXTENT
+    for zoom in range(TILE_MIN_ZOOM, TILE_MAX_ZOOM + 1):
+        n = 2 ** zoom
+        fx, fy = lnglat_to_tile_fraction(lng, lat, zoom)
+        for x in {int(fx - pad), int(fx), int(fx + pad)}:
+            for y in {int(fy - pad), int(fy), int(fy + pad)}:
+                if 0 <= x < n and 0 <= y < n:
+                    yield zoom, x, y
+
+
+def invalidate_points(points):
+    """
+    New versions for the tiles showing any of the (latitude, longitude)
+    points, e.g. an asset's old and new position. Call once committed.
+    """
+    keys = {
+        f'map_tile:{zoom}/{x}/{y}'
+        for latitude, longitude in points if latitude is not None and longitude is not None
+        for zoom, x, y in tiles_for_point(float(longitude), float(latitude))
+    }
+    # The next read starts a fresh version (see map_cache.get_version)
+    cache.delete_many(keys)
+
+
+def tile_etag(zoom, x, y, variant):
+    token, _ = tile_version(zoom, x, y)
+    return hashlib.md5(repr((variant, zoom, x, y, token)).encode('utf-8')).hexdigest()
+
+
+def tile_last_modified(zoom, x, y):
+    _, modified = tile_version(zoom, x, y)
+    return datetime.fromtimestamp(modified, tz=timezone.utc)
+
+
+def tile_path(zoom, x, y, public=False, token=None):
+    variant = 'public' if public else 'full'
+    token = token or tile_version(zoom, x, y)[0]
+    return tile_cache_dir() / f'v{MAP_TILE_VERSION}' / variant / str(zoom) / str(x) / f'{y}-{token}.mvt'
+
+
+def _prune(path):
+    """Remove the files of the tile's superseded versions"""
+    prefix = path.name.split('-', 1)[0] + '-'
+    for stored in path.parent.glob(f'{prefix}*.mvt'):
+        if stored != path:
+            stored.unlink(missing_ok=True)
+
+
+def get_tile(zoom, x, y, public=False):
+    """Cached tile bytes, encoding and storing the tile on a miss"""
+    # Read the version before the data: a change committed meanwhile
+    # gives the tile a new version, this file keeps the old one
+    token, _ = tile_version(zoom, x, y)
+    path = tile_path(zoom, x, y, public, token)
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        pass
+
+    data = build_tile(zoom, x, y, public)
+
+    # Write atomically so concurrent readers never see a partial tile
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as tmp:
+        tmp.write(data)
+    os.replace(tmp_path, path)
+    if tile_version(zoom, x, y)[0] == token:
+        _prune(path)
+    return data
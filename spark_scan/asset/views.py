@@ -2,34 +2,81 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.views import View
 from django.contrib import messages
 from django.db.models import Count, Q
-from django.http import JsonResponse
+from django.http import JsonResponse, FileResponse, Http404, HttpResponseNotModified, StreamingHttpResponse
+from django.core.files.storage import default_storage
+from django.utils.cache import patch_cache_control
 from django.utils.decorators import method_decorator
 from django.views.decorators.http import require_http_methods
 from django.urls import reverse
-import qrcode
-from io import BytesIO
-import base64
+from django.core.files import File
+from io import TextIOWrapper
+import json
+import tempfile
 
-from .models import Asset
+from .models import Asset, ASSET_TYPE_CHOICES, ASSET_GROUP_CHOICES, STATUS_CHOICES
 from .forms import ProvisioningForm, CommissioningForm
 from authentication.permissions import permission_roles
+from spark_scan import exports
+from . import commissioning, importer, labels, listing, qr
 
 
 # NEW: Asset List View for Actions button
 class AssetListView(View):
-    """View to list all assets with role-based actions"""
+    """View to list assets with role-based actions, one keyset page at a time"""
     template_name = 'asset/asset_list.html'
     
     def get(self, request):
-        assets = Asset.objects.all().order_by('-created_at')
+        filters = listing.filters_from_request(request.GET)
+        assets = listing.filter_assets(Asset.objects.all(), **filters)
+        page = listing.paginate(
+            assets,
+            sort=request.GET.get('sort'),
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        )
+        
+        # Filters and sort carried over to the page links
+        query = request.GET.copy()
+        for key in ('after', 'before'):
+            query.pop(key, None)
+        query['sort'] = page['sort']
         
         context = {
-            'assets': assets,
+            'assets': page['assets'],
+            'next_cursor': page['next_cursor'],
+            'previous_cursor': page['previous_cursor'],
+            'sort': page['sort'],
+            'page_query': query.urlencode(),
+            'type_filter': filters['asset_type'],
+            'status_filter': filters['status'],
+            'group_filter': filters['asset_group'],
+            'search_query': filters['search'],
+            'asset_type_choices': ASSET_TYPE_CHOICES,
+            'status_choices': STATUS_CHOICES,
+            'asset_group_choices': ASSET_GROUP_CHOICES,
             'page_title': 'Asset Management'
         }
         return render(request, self.template_name, context)
 
 
+@method_decorator(permission_roles(roles=['Officer', 'Operator']), name='dispatch')
+class AssetExportView(View):
+    """Stream the filtered assets as CSV or NDJSON"""
+    
+    def get(self, request):
+        try:
+            export_format = exports.parse_format(request.GET.get('format'))
+        except ValueError as e:
+            return JsonResponse({
+                'success': False,
+                'message': str(e)
+            }, status=400)
+        
+        filters = listing.filters_from_request(request.GET)
+        assets = listing.filter_assets(Asset.objects.all(), **filters).order_by('pk')
+        return exports.export_response(listing.ASSET_EXPORT_COLUMNS, assets, export_format, 'assets')
+
+
 @method_decorator(permission_roles(roles=['Officer']), name='dispatch')    
 class ProvisionAssetView(View):
     """View for provisioning new assets"""
@@ -58,6 +105,69 @@ class ProvisionAssetView(View):
         return render(request, self.template_name, context)
 
 
+# Bulk provisioning from a CSV/XLSX file (Officer only)
+@method_decorator(permission_roles(roles=['Officer']), name='dispatch')
+class ImportAssetsView(View):
+    """Provision assets from an uploaded file, rows validated like ProvisioningForm"""
+    template_name = 'asset/import_assets.html'
+    shown_errors = 200
+    
+    def get(self, request):
+        return render(request, self.template_name, self.get_context())
+    
+    def post(self, request):
+        uploaded = request.FILES.get('file')
+        dry_run = bool(request.POST.get('dry_run'))
+        context = self.get_context(dry_run=dry_run)
+        
+        if not uploaded:
+            context['error'] = 'Choose a CSV or XLSX file to import.'
+            return render(request, self.template_name, context, status=400)
+        
+        # Errors go to a temporary file as they are found, not to memory
+        with tempfile.TemporaryFile() as report_file:
+            report = TextIOWrapper(report_file, encoding='utf-8', newline='')
+            try:
+                rows = importer.read_rows(uploaded.file, importer.format_from_name(uploaded.name))
+                result = importer.import_assets(rows, dry_run=dry_run, report=report, max_errors=self.shown_errors)
+            except (ValueError, UnicodeDecodeError) as e:
+                context['error'] = f'Could not read {uploaded.name}: {e}'
+                return render(request, self.template_name, context, status=400)
+            finally:
+                # Flushed, the temporary file stays open
+                report.detach()
+            
+            if result.error_count:
+                report_file.seek(0)
+                name = default_storage.save(f'{importer.REPORT_DIRECTORY}/import-errors.csv', File(report_file))
+                context['report_url'] = reverse('asset:import_report', kwargs={'name': name.rsplit('/', 1)[-1]})
+        
+        if result.created and not dry_run:
+            messages.success(request, f'{result.created} asset(s) provisioned from {uploaded.name}.')
+        context.update({
+            'result': result,
+            'shown_errors': result.errors,
+        })
+        return render(request, self.template_name, context)
+    
+    def get_context(self, **extra):
+        return {
+            'columns': importer.IMPORT_COLUMNS,
+            'page_title': 'Import Assets',
+            **extra,
+        }
+
+
+@require_http_methods(["GET"])
+@permission_roles(roles=['Officer'])
+def import_report(request, name):
+    """Download the error report of an import"""
+    path = f'{importer.REPORT_DIRECTORY}/{name}'
+    if '/' in name or not default_storage.exists(path):
+        raise Http404('Report not found')
+    return FileResponse(default_storage.open(path, 'rb'), as_attachment=True, filename=name, content_type='text/csv')
+
+
 # NEW: Edit Asset View (Officer only)
 @method_decorator(permission_roles(roles=['Officer']), name='dispatch')
 class EditAssetView(View):
@@ -115,7 +225,7 @@ def delete_asset(request, asset_id):
 # NEW: View QR Code (All roles)
 @require_http_methods(["POST"])
 def view_qr_code(request, asset_id):
-    """Generate and return QR code for asset complaint URL (AJAX endpoint)"""
+    """Return the QR image URL for the asset complaint URL (AJAX endpoint)"""
     try:
         asset = get_object_or_404(Asset, id=asset_id)
         
@@ -127,33 +237,12 @@ def view_qr_code(request, asset_id):
                 'message': 'Asset is not commissioned yet. QR code can only be generated for commissioned assets.'
             }, status=400)
         
-        # Build the complaint registration URL
-        complaint_url = request.build_absolute_uri(
-            reverse('citizen_portal:report_step1', kwargs={'asset_id': asset.id})
-        )
-        
-        # Generate QR code
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(complaint_url)
-        qr.make(fit=True)
-        
-        # Create QR code image
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convert to base64 for sending to frontend
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        img_base64 = base64.b64encode(buffer.getvalue()).decode()
+        # Stored image of the complaint registration URL (rendered on first use)
+        complaint_url = qr.ensure_qr_code(asset, qr.base_url(request))
         
         return JsonResponse({
             'success': True,
-            'qr_code': f'data:image/png;base64,{img_base64}',
+            'qr_code': reverse('asset:qr_image', kwargs={'digest': qr.digest(complaint_url)}),
             'asset_number': asset.asset_number,
             'complaint_url': complaint_url
         })
@@ -165,6 +254,97 @@ def view_qr_code(request, asset_id):
         }, status=400)
 
 
+# QR image files, cacheable forever: the name is the content hash
+@require_http_methods(["GET", "HEAD"])
+def qr_code_image(request, digest):
+    """Serve a stored QR image"""
+    name = f'{qr.QR_DIRECTORY}/{digest}.png'
+    if not default_storage.exists(name):
+        raise Http404('QR code not found')
+    if request.headers.get('If-None-Match', '').strip('"') == digest:
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(default_storage.open(name, 'rb'), content_type='image/png')
+    response['ETag'] = f'"{digest}"'
+    patch_cache_control(response, public=True, max_age=qr.QR_CACHE_SECONDS, immutable=True)
+    return response
+
+
+# Bulk QR sticker sheets (Officer/Operator)
+@method_decorator(permission_roles(roles=['Officer', 'Operator']), name='dispatch')
+class QRLabelsView(View):
+    """
+    PDF sheet or ZIP of QR labels for a filtered set of assets, streamed
+    while they are rendered in the request's own process. Larger batches
+    are rendered by the generate_qr_labels command in a process pool.
+    """
+    max_assets = 500
+    
+    def get(self, request):
+        try:
+            label_format = request.GET.get('format', 'pdf')
+            if label_format not in labels.LABEL_FORMATS:
+                raise ValueError(f'format must be one of {", ".join(labels.LABEL_FORMATS)}.')
+            filters = listing.filters_from_request(request.GET)
+            assets = labels.select_assets(
+                asset_group=filters['asset_group'],
+                status=filters['status'],
+                asset_type=filters['asset_type'],
+                search=filters['search'],
+                id_from=int(request.GET['id_from']) if request.GET.get('id_from') else None,
+                id_to=int(request.GET['id_to']) if request.GET.get('id_to') else None,
+            )
+            count = assets.count()
+            if count > self.max_assets:
+                raise ValueError(
+                    f'{count} assets selected, at most {self.max_assets} per download '
+                    f'(use the generate_qr_labels command for larger batches).'
+                )
+            root = qr.base_url(request)
+        except ValueError as e:
+            return JsonResponse({
+                'success': False,
+                'message': str(e)
+            }, status=400)
+        
+        filename = f'qr-labels.{label_format}'
+        response = StreamingHttpResponse(
+            labels.stream_labels(label_format, labels.render_labels(assets, root, workers=1)),
+            content_type='application/pdf' if label_format == 'pdf' else 'application/zip',
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+# Batch commissioning for field crews (JSON, Operator only)
+@method_decorator(permission_roles(roles=['Operator']), name='dispatch')
+class CommissionBatchView(View):
+    """
+    Apply many commissioning records in one request. Body:
+    {"records": [{"idempotency_key", "asset_id" or "asset_number", <CommissioningForm fields>}]}.
+    Retrying a record with the same idempotency_key is safe.
+    """
+    
+    def post(self, request):
+        try:
+            records = json.loads(request.body).get('records')
+            if not isinstance(records, list):
+                raise ValueError('records must be a list.')
+            results = commissioning.commission_batch(records, qr.base_url(request))
+        except (ValueError, AttributeError) as e:
+            return JsonResponse({
+                'success': False,
+                'message': str(e)
+            }, status=400)
+        
+        return JsonResponse({
+            'success': True,
+            'commissioned': sum(1 for result in results if result['status'] == 'commissioned'),
+            'rejected': sum(1 for result in results if result['status'] == 'rejected'),
+            'results': results,
+        })
+
+
 @method_decorator(permission_roles(roles=['Operator']), name='dispatch')    
 class CommissionAssetView(View):
     """View for commissioning a provisioned asset"""
@@ -187,6 +367,7 @@ class CommissionAssetView(View):
         
         if form.is_valid():
             commissioned_asset = form.save()
+            qr.ensure_qr_code(commissioned_asset, qr.base_url(request))
             messages.success(request, f'Asset {commissioned_asset.asset_number} commissioned successfully!')
             return redirect('asset:asset_list')
         
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='otp',
+            index=models.Index(fields=['phone_number'], name='otp_phone_number_idx'),
+        ),
+    ]
@@ -35,6 +35,10 @@ class OTP(models.Model):
     class Meta:
         verbose_name = "OTP"
         verbose_name_plural = "OTPs"
+        indexes = [
+            # Guest OTP lookup and cleanup by phone number
+            models.Index(fields=["phone_number"], name="otp_phone_number_idx"),
+        ]
 
     def __str__(self):
         if self.user:
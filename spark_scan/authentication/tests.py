@@ -1,3 +1,19 @@
 from django.test import TestCase
 
-# Create your tests here.
+from spark_scan.testing import QueryPlanMixin
+from .models import OTP
+
+
+class OTPQueryPlanTests(QueryPlanMixin, TestCase):
+    """Guest OTPs are looked up and cleared by phone number"""
+
+    @classmethod
+    def setUpTestData(cls):
+        OTP.objects.bulk_create([
+            OTP(phone_number=f'0800{number:07d}', phone_otp='123456') for number in range(200)
+        ])
+
+    def test_lookup_uses_phone_number_index(self):
+        otps = OTP.objects.filter(phone_number='08000000042', phone_otp='123456')
+        self.assertUsesIndex(otps, 'otp_phone_number_idx')
+        self.assertNoFullScan(otps)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CitizenPortalConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'citizen_portal'
+
+
+    def ready(self):
+        # Register asset counter maintenance handlers
+        from . import signals  # noqa: F401
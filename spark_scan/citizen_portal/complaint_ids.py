@@ -0,0 +1,88 @@
+"""
+Complaint IDs: CPN-<year>-<number>, numbered per year from a counter row.
+
+allocate() advances ComplaintIdSequence with a single statement
+(INSERT .. ON CONFLICT DO UPDATE .. RETURNING on SQLite/PostgreSQL, a
+locked read-update elsewhere), so concurrent submissions never get the
+same number and no uniqueness probing is needed. Numbers are zero-padded
+to four digits and simply grow longer past 9999.
+
+With the default COMPLAINT_ID_BLOCK_SIZE of 1, Complaint.save takes the
+number inside the transaction that inserts the complaint, so a failed
+insert rolls the counter back with it and numbers have no gaps (the
+counter row stays locked until the submission commits).
+
+With COMPLAINT_ID_BLOCK_SIZE > 1 each process reserves a block of numbers
+per write, outside the insert's transaction, and hands them out from
+memory. Numbers of failed submissions and those left in a block when the
+process exits are skipped, and IDs of concurrent workers interleave
+rather than follow submission order.
+"""
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ComplaintIdSequence
+
+ID_PREFIX = 'CPN'
+
+# Backends with INSERT .. ON CONFLICT .. RETURNING
+UPSERT_VENDORS = ('sqlite', 'postgresql')
+
+_lock = threading.Lock()
+# year -> [next number, last number of the reserved block]
+_blocks = {}
+
+
+def format_complaint_id(year, number):
+    return f'{ID_PREFIX}-{year}-{number:04d}'
+
+
+def allocate(year, count=1):
+    """Reserve count numbers of year, returns the last one (the first is last - count + 1)"""
+    if connection.vendor in UPSERT_VENDORS:
+        quote = connection.ops.quote_name
+        table, year_column, value = quote(ComplaintIdSequence._meta.db_table), quote('year'), quote('last_value')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({year_column}, {value}) VALUES (%s, %s) '
+                f'ON CONFLICT ({year_column}) DO UPDATE SET {value} = {table}.{value} + excluded.{value} '
+                f'RETURNING {value}',
+                [year, count],
+            )
+            return cursor.fetchone()[0]
+
+    with transaction.atomic():
+        sequence, _ = ComplaintIdSequence.objects.select_for_update().get_or_create(year=year)
+        sequence.last_value += count
+        sequence.save(update_fields=['last_value'])
+        return sequence.last_value
+
+
+def _next_from_block(year, block_size):
+    with _lock:
+        block = _blocks.get(year)
+        if block is None or block[0] > block[1]:
+            last = allocate(year, block_size)
+            block = _blocks[year] = [last - block_size + 1, last]
+        number = block[0]
+        block[0] += 1
+        return number
+
+
+def reserves_blocks():
+    """Whether numbers come from per-process blocks (allocated outside transactions)"""
+    return settings.COMPLAINT_ID_BLOCK_SIZE > 1
+
+
+def next_complaint_id(year=None):
+    year = year or timezone.localdate().year
+    if reserves_blocks() and not connection.in_atomic_block:
+        number = _next_from_block(year, settings.COMPLAINT_ID_BLOCK_SIZE)
+    else:
+        # A block reserved inside a transaction could be rolled back while
+        # this process keeps handing it out, so allocate one number there
+        number = allocate(year)
+    return format_complaint_id(year, number)
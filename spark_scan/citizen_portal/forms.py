@@ -1,5 +1,6 @@
 from django import forms
-from .models import Complaint
+from .models import Complaint, Incident
+from . import uploads
 
 class PhoneNumberForm(forms.Form):
     phone_number = forms.CharField(
@@ -27,6 +28,11 @@ class OTPVerificationForm(forms.Form):
     )
 
 class ComplaintForm(forms.ModelForm):
+    # Photos sent beforehand through the chunked upload (citizen_portal.uploads),
+    # used when the matching file input is empty
+    image1_upload = forms.UUIDField(required=False, widget=forms.HiddenInput)
+    image2_upload = forms.UUIDField(required=False, widget=forms.HiddenInput)
+    
     class Meta:
         model = Complaint
         fields = [
@@ -67,6 +73,43 @@ class ComplaintForm(forms.ModelForm):
             'image2': 'Photo 2 (Optional)',
             'reporter_name': 'Your Name (Optional)'
         }
+    
+    def __init__(self, *args, reporter_phone=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reporter_phone = reporter_phone
+        # (field, completed upload) used for the photos, discarded once saved
+        self.photo_uploads = []
+        self._photo_files = []
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        for field in ('image1', 'image2'):
+            upload_id = cleaned_data.get(f'{field}_upload')
+            if not upload_id or cleaned_data.get(field):
+                continue
+            upload = uploads.completed_upload(upload_id, self.reporter_phone)
+            if upload is None:
+                self.add_error(field, 'The photo upload has expired, please add the photo again.')
+                continue
+            self.photo_uploads.append((field, upload))
+        return cleaned_data
+    
+    def save(self, commit=True):
+        # Opened only now, a form that does not validate leaves no file open
+        for field, upload in self.photo_uploads:
+            photo = uploads.open_upload(upload)
+            self._photo_files.append(photo)
+            setattr(self.instance, field, photo)
+        return super().save(commit)
+    
+    def release_uploads(self):
+        """Drop the chunked uploads once the complaint has stored their photos"""
+        for photo in self._photo_files:
+            photo.close()
+        for _, upload in self.photo_uploads:
+            uploads.discard(upload)
+        self.photo_uploads = []
+        self._photo_files = []
 
 
 class ComplaintResolutionForm(forms.ModelForm):
@@ -129,4 +172,9 @@ class ComplaintResolutionForm(forms.ModelForm):
         status = self.cleaned_data.get('status')
         if not status:
             raise forms.ValidationError('Please select a status.')
-        return status
\ No newline at end of file
+        return status
+
+class IncidentResolutionForm(ComplaintResolutionForm):
+    """Status and notes of an incident, applied to all its complaints"""
+    class Meta(ComplaintResolutionForm.Meta):
+        model = Incident
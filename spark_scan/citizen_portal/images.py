@@ -0,0 +1,186 @@
+"""
+Complaint photo processing.
+
+Phones upload multi-megabyte camera JPEGs with EXIF (GPS, device). Once a
+complaint is committed its photos are processed in a thread pool, after
+the request has returned:
+
+- the original is re-encoded upright, without EXIF, at most
+  ORIGINAL_MAX_SIZE pixels on its long edge, as a JPEG (PNGs stay PNG),
+  and stored as a new file named for that format (a new blob in the
+  content-addressed storage, see storage.py),
+- thumb and medium renditions are written as WebP and JPEG next to it,
+  at paths derived from the original's name (rendition_name),
+
+and Complaint.images_processed is set. Templates ask for a rendition with
+the ``rendition`` filter (templatetags/complaint_images.py), which falls
+back to the original until the complaint is processed.
+"""
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connection, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import IMAGE_FIELDS, Complaint
+
+logger = logging.getLogger(__name__)
+
+# Long edge of the stored original after processing
+ORIGINAL_MAX_SIZE = 2048
+
+# Rendition name -> bounding box
+RENDITIONS = {
+    'thumb': (320, 320),
+    'medium': (1280, 1280),
+}
+
+# File extension -> Pillow format and save options
+RENDITION_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+RENDITION_DIRECTORY = 'renditions'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def rendition_name(name, rendition, extension='jpg'):
+    """Storage name of a rendition of the stored image ``name``"""
+    directory, filename = posixpath.split(name)
+    return posixpath.join(directory, RENDITION_DIRECTORY, f'{filename}.{rendition}.{extension}')
+
+
+def rendition_names(name):
+    """Storage names of all renditions of the stored image ``name``"""
+    return [
+        rendition_name(name, rendition, extension)
+        for rendition in RENDITIONS for extension in RENDITION_FORMATS
+    ]
+
+
+def _encode(image, extension):
+    image_format, options = RENDITION_FORMATS[extension]
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def _replace(name, content):
+    """Overwrite a stored file, returns the name it was stored under"""
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    return default_storage.save(name, ContentFile(content))
+
+
+def process_image(field_file):
+    """
+    Clean the stored image of ``field_file`` and write its renditions.
+    Returns the name the cleaned original was stored under.
+    """
+    name, storage = field_file.name, field_file.storage
+    with storage.open(name, 'rb') as source:
+        image = Image.open(source)
+        image.load()
+    source_format = image.format
+
+    # Apply the EXIF orientation to the pixels, the EXIF itself is dropped
+    # (nothing is copied over when re-encoding)
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((ORIGINAL_MAX_SIZE, ORIGINAL_MAX_SIZE), Image.LANCZOS)
+
+    # PNGs (screenshots, diagrams) stay lossless, anything else becomes a JPEG
+    if source_format == 'PNG':
+        buffer = BytesIO()
+        image.save(buffer, format='PNG', optimize=True)
+        original, extension = buffer.getvalue(), '.png'
+    else:
+        original, extension = None, '.jpg'
+
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    # New content, so a new name in the content-addressed storage; the
+    # upload it replaces may still be shared with other complaints. The
+    # extension is the written format's, not the upload's
+    stored = storage.save(
+        posixpath.splitext(name)[0] + extension, ContentFile(original or _encode(image, 'jpg'))
+    )
+    if all(default_storage.exists(rendition) for rendition in rendition_names(stored)):
+        # Same photo as an already processed complaint
+        return stored
+    for rendition, size in RENDITIONS.items():
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+        for extension in RENDITION_FORMATS:
+            _replace(rendition_name(stored, rendition, extension), _encode(resized, extension))
+    return stored
+
+
+def process_complaint(complaint_id):
+    """Process the photos of one complaint (by pk) and flag it processed"""
+    complaint = Complaint.objects.filter(pk=complaint_id).only(*IMAGE_FIELDS).first()
+    if complaint is None:
+        return
+    updates = {}
+    replaced = []
+    processed = True
+    for field in IMAGE_FIELDS:
+        field_file = getattr(complaint, field)
+        name = field_file.name
+        if not name:
+            continue
+        try:
+            stored = process_image(field_file)
+        except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+            # Left unprocessed: pages keep showing the original and
+            # process_complaint_images retries it
+            logger.exception('Could not process %s of complaint %s', name, complaint_id)
+            processed = False
+            continue
+        if stored != name:
+            updates[field] = stored
+            replaced.append((field_file.storage, name))
+    updates['images_processed'] = processed
+    # update(), not save(): no signals, the complaint itself did not change
+    Complaint.objects.filter(pk=complaint_id).update(**updates)
+    for storage, name in replaced:
+        storage.delete(name)
+
+
+def _run(complaint_id):
+    close_old_connections()
+    try:
+        process_complaint(complaint_id)
+    except Exception:
+        logger.exception('Image processing failed for complaint %s', complaint_id)
+    finally:
+        # Worker threads own their connection
+        connection.close()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.COMPLAINT_IMAGE_WORKERS, thread_name_prefix='complaint-images'
+            )
+        return _executor
+
+
+def schedule(complaint_id):
+    """Process a complaint's photos once the current transaction commits"""
+    def submit():
+        if settings.COMPLAINT_IMAGE_WORKERS:
+            _get_executor().submit(_run, complaint_id)
+        else:
+            process_complaint(complaint_id)
+    transaction.on_commit(submit)
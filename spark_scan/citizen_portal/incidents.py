@@ -0,0 +1,221 @@
+"""
+Coalescing duplicate complaints into incidents.
+
+When a pole sparks many citizens scan the same QR code. Each new complaint
+is attached, as it is saved, to an open incident of its asset or of an
+asset within INCIDENT_RADIUS_M whose last complaint is less than
+INCIDENT_WINDOW_MINUTES old and whose description is similar enough, or
+else starts a new incident.
+
+Similarity is the Jaccard estimate of two MinHash signatures over the
+character trigrams of the descriptions. The incident keeps the signature
+of its first complaint, so grouping a complaint costs the same whatever
+the size of the incident: one indexed radius query for the nearby
+assets, one for at most MAX_CANDIDATES recent incidents, one write.
+
+resolve() applies an operator's status and notes to the incident and to
+all its complaints in bulk, with the asset counter, rollup, change feed,
+map version and live event updates that Complaint.save would have made.
+A complaint resolved or reopened on its own moves its incident along
+(follow_complaint).
+"""
+import hashlib
+import random
+import re
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from asset import geo, map_cache, sync, vector_tiles
+from asset.models import Asset
+from spark_scan import live
+from .models import Complaint, ComplaintStatus, Incident, OPEN_STATUSES
+from . import rollups
+
+SIGNATURE_SIZE = 64
+SHINGLE_SIZE = 3
+
+# Mersenne prime modulus of the permutations (a * x + b) % MINHASH_PRIME
+MINHASH_PRIME = (1 << 61) - 1
+
+# Fixed seed: signatures must stay comparable across processes and releases
+_random = random.Random(20240601)
+PERMUTATIONS = [
+    (_random.randrange(1, MINHASH_PRIME), _random.randrange(0, MINHASH_PRIME))
+    for _ in range(SIGNATURE_SIZE)
+]
+
+# Lowest similarity to join an incident of the same asset (people describe
+# one fault in different words) and of a nearby asset
+SAME_ASSET_SIMILARITY = 0.2
+NEARBY_ASSET_SIMILARITY = 0.5
+
+# Bounds of the work per complaint
+MAX_NEARBY_ASSETS = 20
+MAX_CANDIDATES = 10
+
+
+def shingles(text):
+    """Character trigrams of the lowercased words"""
+    normalized = ' '.join(re.findall(r'\w+', (text or '').lower()))
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+
+def signature(text):
+    """MinHash signature (SIGNATURE_SIZE ints) of a description"""
+    hashes = [
+        int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+        for shingle in shingles(text)
+    ]
+    if not hashes:
+        return [MINHASH_PRIME] * SIGNATURE_SIZE
+    return [min((a * value + b) % MINHASH_PRIME for value in hashes) for a, b in PERMUTATIONS]
+
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of the texts behind two signatures"""
+    if len(first) != len(second) or not first:
+        return 0.0
+    return sum(
+        1 for x, y in zip(first, second) if x == y and x != MINHASH_PRIME
+    ) / len(first)
+
+
+def _nearby_asset_ids(asset):
+    if asset.latitude is None or asset.longitude is None:
+        return []
+    nearby = geo.within_radius(
+        Asset.objects.exclude(pk=asset.pk).only('id', 'latitude', 'longitude'),
+        asset.latitude, asset.longitude, settings.INCIDENT_RADIUS_M,
+    )
+    return [nearby_asset.pk for nearby_asset, _ in nearby[:MAX_NEARBY_ASSETS]]
+
+
+def find_incident(asset, description_signature, moment=None):
+    """The open incident a new complaint on asset belongs to, or None"""
+    moment = moment or timezone.now()
+    asset_ids = [asset.pk, *_nearby_asset_ids(asset)]
+    candidates = Incident.objects.filter(
+        asset_id__in=asset_ids,
+        status__in=OPEN_STATUSES,
+        last_complaint_at__gte=moment - timedelta(minutes=settings.INCIDENT_WINDOW_MINUTES),
+    ).only('id', 'asset_id', 'signature').order_by('-last_complaint_at')[:MAX_CANDIDATES]
+
+    best, best_similarity = None, 0.0
+    for incident in candidates:
+        threshold = SAME_ASSET_SIMILARITY if incident.asset_id == asset.pk else NEARBY_ASSET_SIMILARITY
+        score = similarity(description_signature, incident.signature)
+        if score >= threshold and score > best_similarity:
+            best, best_similarity = incident, score
+    return best
+
+
+def attach(complaint, moment=None):
+    """
+    Set complaint.incident for a complaint about to be inserted, creating
+    the incident if none matches. Called by Complaint.save in its transaction.
+    """
+    moment = moment or timezone.now()
+    description_signature = signature(complaint.complaint_description)
+    incident = find_incident(complaint.asset, description_signature, moment)
+    if incident is None:
+        # Two first reports at the same moment may each start one
+        incident = Incident.objects.create(
+            asset_id=complaint.asset_id,
+            signature=description_signature,
+            complaint_count=1,
+            first_complaint_at=moment,
+            last_complaint_at=moment,
+        )
+    else:
+        Incident.objects.filter(pk=incident.pk).update(
+            complaint_count=F('complaint_count') + 1, last_complaint_at=moment,
+        )
+    complaint.incident = incident
+    return incident
+
+
+def resolve(incident, status, resolution_notes, resolved_by):
+    """
+    Set the status and notes of an incident and of its complaints that are
+    not completed yet. Returns the number of complaints updated.
+    """
+    now = timezone.now()
+    resolved_at = now if status == ComplaintStatus.COMPLETED else None
+    with transaction.atomic():
+        complaints = list(
+            incident.complaints.exclude(status=ComplaintStatus.COMPLETED)
+            .select_related('asset').select_for_update(of=('self',))
+        )
+        Incident.objects.filter(pk=incident.pk).update(
+            status=status, resolution_notes=resolution_notes,
+            resolved_by=resolved_by if resolved_at else None, resolved_at=resolved_at,
+        )
+        if not complaints:
+            return 0
+
+        updates = {'status': status, 'resolution_notes': resolution_notes, 'updated_at': now}
+        if resolved_at:
+            updates.update(resolved_by=resolved_by, resolved_at=resolved_at)
+        Complaint.objects.filter(pk__in=[complaint.pk for complaint in complaints]).update(**updates)
+
+        # The queryset update skips Complaint.save and its signals: counters,
+        # rollups and the change feed are updated here once per asset /
+        # rollup row, the map version and live events once committed (the
+        # search index has no status)
+        if status not in OPEN_STATUSES:
+            open_counts = Counter(complaint.asset_id for complaint in complaints if complaint.status in OPEN_STATUSES)
+            for asset_id, count in open_counts.items():
+                Asset.adjust_complaint_counters(asset_id, open_delta=-count)
+        rollups.record_status_change(complaints, status)
+        sync.record_changes({complaint.asset_id for complaint in complaints})
+
+        events = [
+            {
+                'complaint_id': complaint.complaint_id,
+                'asset_id': complaint.asset_id,
+                'status': status,
+                'severity': complaint.severity,
+                'previous_status': complaint.status,
+            }
+            for complaint in complaints if complaint.status != status
+        ]
+        positions = {(complaint.asset.latitude, complaint.asset.longitude) for complaint in complaints}
+        transaction.on_commit(lambda: _after_resolve(events, positions))
+    return len(complaints)
+
+
+def _after_resolve(events, positions):
+    map_cache.bump_version()
+    vector_tiles.invalidate_points(positions)
+    for event in events:
+        live.publish('complaint.status', **event)
+
+
+def follow_complaint(complaint):
+    """
+    Keep the incident of a complaint whose status was changed on its own in
+    step: completed with that complaint's resolution once none of its
+    complaints is open, reopened with its status when it is reopened.
+    """
+    if not complaint.incident_id:
+        return
+    if complaint.status == ComplaintStatus.COMPLETED:
+        still_open = Complaint.objects.filter(
+            incident_id=complaint.incident_id, status__in=OPEN_STATUSES
+        ).exists()
+        if not still_open:
+            Incident.objects.filter(pk=complaint.incident_id).exclude(status=ComplaintStatus.COMPLETED).update(
+                status=ComplaintStatus.COMPLETED, resolution_notes=complaint.resolution_notes,
+                resolved_by=complaint.resolved_by, resolved_at=complaint.resolved_at or timezone.now(),
+            )
+    else:
+        Incident.objects.filter(pk=complaint.incident_id, status=ComplaintStatus.COMPLETED).update(
+            status=complaint.status, resolved_by=None, resolved_at=None,
+        )
@@ -0,0 +1,84 @@
+"""
+Complaint list filters, shared by the complaint list page and its export,
+and the keyset pages of the complaint and incident lists (newest first,
+see asset.listing).
+"""
+from asset.listing import keyset_page
+from .models import ComplaintStatus, SeverityLevel
+from . import search
+
+PAGE_SIZE = 50
+
+# Export column -> queryset field (asset fields joined in)
+COMPLAINT_EXPORT_COLUMNS = {
+    'complaint_id': 'complaint_id',
+    'status': 'status',
+    'severity': 'severity',
+    'created_at': 'created_at',
+    'resolved_at': 'resolved_at',
+    'resolved_by': 'resolved_by',
+    'resolution_notes': 'resolution_notes',
+    'reporter_name': 'reporter_name',
+    'reporter_phone': 'reporter_phone',
+    'description': 'complaint_description',
+    'asset_number': 'asset__asset_number',
+    'asset_type': 'asset__asset_type',
+    'asset_group': 'asset__asset_group',
+    'asset_location': 'asset__actual_location',
+    'latitude': 'asset__latitude',
+    'longitude': 'asset__longitude',
+}
+
+
+def filters_from_request(params):
+    """Filter values from request.GET (unknown choices are ignored)"""
+    status = params.get('status', '')
+    severity = params.get('severity', '')
+    return {
+        'status': status if status in ComplaintStatus.values else '',
+        'severity': severity if severity in SeverityLevel.values else '',
+        'search': params.get('search', '').strip(),
+    }
+
+
+def filter_complaints(queryset, status='', severity='', search_query=''):
+    """Status/severity filters plus a full-text match (all matches, unranked)"""
+    if status:
+        queryset = queryset.filter(status=status)
+    if severity:
+        queryset = queryset.filter(severity=severity)
+    if search_query:
+        queryset = search.get_backend().filter_queryset(queryset, search_query)
+    return queryset
+
+
+def paginate(queryset, after=None, before=None, page_size=PAGE_SIZE):
+    """One page of complaints, newest first: {'complaints', 'next_cursor', 'previous_cursor'}"""
+    complaints, next_cursor, previous_cursor = keyset_page(queryset, 'created_at', True, after, before, page_size)
+    return {
+        'complaints': complaints,
+        'next_cursor': next_cursor,
+        'previous_cursor': previous_cursor,
+    }
+
+
+def paginate_search(queryset, after=None, before=None, page_size=PAGE_SIZE):
+    """One page of ranked search matches (see search.rank_queryset), best first"""
+    complaints, next_cursor, previous_cursor = keyset_page(queryset, 'search_rank', False, after, before, page_size)
+    return {
+        'complaints': complaints,
+        'next_cursor': next_cursor,
+        'previous_cursor': previous_cursor,
+    }
+
+
+def paginate_incidents(queryset, after=None, before=None, page_size=PAGE_SIZE):
+    """One page of incidents, most recently reported first: {'incidents', 'next_cursor', 'previous_cursor'}"""
+    incidents, next_cursor, previous_cursor = keyset_page(
+        queryset, 'last_complaint_at', True, after, before, page_size
+    )
+    return {
+        'incidents': incidents,
+        'next_cursor': next_cursor,
+        'previous_cursor': previous_cursor,
+    }
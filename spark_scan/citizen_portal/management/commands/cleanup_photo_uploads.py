@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from citizen_portal import uploads
+
+
+class Command(BaseCommand):
+    help = 'Delete chunked photo uploads that expired before being used in a complaint'
+
+    def handle(self, *args, **options):
+        removed = uploads.cleanup_expired()
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} expired upload(s).'))
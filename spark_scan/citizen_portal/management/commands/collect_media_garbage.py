@@ -0,0 +1,55 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.utils import timezone
+
+from citizen_portal.images import IMAGE_FIELDS
+from citizen_portal.models import Complaint, MediaBlob
+from citizen_portal.storage import blob_digest, media_store
+
+
+class Command(BaseCommand):
+    help = 'Delete stored complaint photos (blobs) that no complaint references any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours', type=float, default=24,
+            help='Keep blobs unreferenced for less than this long (default: 24)',
+        )
+        parser.add_argument(
+            '--recount', action='store_true',
+            help='First recompute the reference counts from the complaints',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='List what would be deleted')
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            fixed = self.recount(dry_run=options['dry_run'])
+            self.stdout.write(f'{fixed} reference count(s) corrected.')
+
+        deleted = media_store.collect_garbage(
+            grace=timedelta(hours=options['grace_hours']), dry_run=options['dry_run'],
+        )
+        for name in deleted:
+            self.stdout.write(f'  {name}')
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {len(deleted)} unreferenced file(s).'))
+
+    def recount(self, dry_run=False):
+        references = Counter()
+        for names in Complaint.objects.values_list(*IMAGE_FIELDS).iterator():
+            references.update(filter(None, map(blob_digest, names)))
+
+        fixed = 0
+        for digest, refcount in MediaBlob.objects.values_list('digest', 'refcount').iterator():
+            if refcount != references[digest]:
+                fixed += 1
+                if not dry_run:
+                    # Relative to the count read, so references added meanwhile are kept;
+                    # a new updated_at restarts the grace period
+                    MediaBlob.objects.filter(digest=digest).update(
+                        refcount=F('refcount') + (references[digest] - refcount), updated_at=timezone.now(),
+                    )
+        return fixed
@@ -0,0 +1,48 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from citizen_portal.images import IMAGE_FIELDS, rendition_names
+from citizen_portal.models import Complaint
+from citizen_portal.storage import blob_digest, media_store
+
+
+class Command(BaseCommand):
+    help = 'Move complaint photos stored before the content-addressed storage into it, merging duplicates'
+
+    def handle(self, *args, **options):
+        with_images = Q()
+        for field in IMAGE_FIELDS:
+            with_images |= Q(**{f'{field}__gt': ''})
+        complaints = Complaint.objects.filter(with_images).order_by('pk').values_list('pk', *IMAGE_FIELDS)
+
+        legacy = set()
+        moved = 0
+        for complaint_id, *names in complaints.iterator():
+            updates = {}
+            for field, name in zip(IMAGE_FIELDS, names):
+                if not name or blob_digest(name) or not media_store.exists(name):
+                    continue
+                stored = media_store.adopt(name)
+                self._move_renditions(name, stored)
+                updates[field] = stored
+                legacy.add(name)
+            if updates:
+                Complaint.objects.filter(pk=complaint_id).update(**updates)
+                moved += len(updates)
+
+        # Only once every complaint points at the blobs
+        for name in legacy:
+            media_store.delete(name)
+            for rendition in rendition_names(name):
+                default_storage.delete(rendition)
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {moved} photo(s) from {len(legacy)} file(s) into the content-addressed storage.'
+        ))
+
+    def _move_renditions(self, name, stored):
+        """Renditions of processed photos, stored under the blob's name"""
+        for old, new in zip(rendition_names(name), rendition_names(stored)):
+            if default_storage.exists(old) and not default_storage.exists(new):
+                with default_storage.open(old, 'rb') as rendition:
+                    default_storage.save(new, rendition)
@@ -0,0 +1,33 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from citizen_portal import listing
+from citizen_portal.models import Complaint, ComplaintStatus, SeverityLevel
+from spark_scan import exports
+
+
+class Command(BaseCommand):
+    help = 'Stream complaints with their asset fields as CSV or NDJSON (same filters as the complaint list)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(exports.EXPORT_FORMATS), default='csv')
+        parser.add_argument('--status', choices=ComplaintStatus.values, default='')
+        parser.add_argument('--severity', choices=SeverityLevel.values, default='')
+        parser.add_argument('--search', default='', help='Full-text search query')
+        parser.add_argument('--output', help='File to write (default: stdout)')
+
+    def handle(self, *args, **options):
+        complaints = listing.filter_complaints(
+            Complaint.objects.all(), options['status'], options['severity'], options['search']
+        ).order_by('pk')
+
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in exports.stream(listing.COMPLAINT_EXPORT_COLUMNS, complaints, options['format']):
+                output.write(chunk)
+        finally:
+            if options['output']:
+                output.close()
+            else:
+                output.flush()
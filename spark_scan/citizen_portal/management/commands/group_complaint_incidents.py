@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from citizen_portal import incidents
+from citizen_portal.models import Complaint, OPEN_STATUSES
+
+
+class Command(BaseCommand):
+    help = 'Group the open complaints saved before incidents existed (or bulk-created) into incidents'
+
+    def handle(self, *args, **options):
+        complaints = (
+            Complaint.objects.filter(incident__isnull=True, status__in=OPEN_STATUSES)
+            .select_related('asset')
+            .order_by('created_at', 'pk')
+        )
+        count = 0
+        for complaint in complaints.iterator():
+            # In submission order, as if each had just been submitted
+            with transaction.atomic():
+                incident = incidents.attach(complaint, moment=complaint.created_at)
+                Complaint.objects.filter(pk=complaint.pk).update(incident=incident)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Grouped {count} complaint(s) into incidents.'))
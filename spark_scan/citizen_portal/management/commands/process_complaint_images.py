@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from citizen_portal import images
+from citizen_portal.models import Complaint
+
+
+class Command(BaseCommand):
+    help = 'Strip EXIF from and write renditions of the complaint photos not processed yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help='Process at most this many complaints')
+
+    def handle(self, *args, **options):
+        complaints = (
+            Complaint.objects.filter(images_processed=False)
+            .filter(Q(image1__gt='') | Q(image2__gt=''))
+            .order_by('pk')
+            .values_list('pk', flat=True)
+        )
+        if options['limit']:
+            complaints = complaints[:options['limit']]
+        count = 0
+        for complaint_id in complaints.iterator():
+            images.process_complaint(complaint_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Processed the photos of {count} complaint(s).'))
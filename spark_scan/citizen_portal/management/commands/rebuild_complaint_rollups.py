@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from citizen_portal import rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the hourly/daily complaint rollup tables from the complaints table'
+
+    def handle(self, *args, **options):
+        count = rollups.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt complaint rollups ({count} row(s)).'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from citizen_portal import search
+
+
+class Command(BaseCommand):
+    help = 'Re-create the complaint full-text search index'
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        count = backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt complaint search index with {backend.__class__.__name__} ({count} complaint(s)).'
+        ))
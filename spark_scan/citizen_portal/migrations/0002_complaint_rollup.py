@@ -0,0 +1,60 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:40
+
+from django.db import migrations, models
+from django.db.models import Count, F
+from django.db.models.functions import TruncDay, TruncHour
+
+
+def populate_rollups(apps, schema_editor):
+    Complaint = apps.get_model('citizen_portal', 'Complaint')
+    ComplaintRollup = apps.get_model('citizen_portal', 'ComplaintRollup')
+
+    rows = []
+    for granularity, trunc in (('HOUR', TruncHour('created_at')), ('DAY', TruncDay('created_at'))):
+        buckets = Complaint.objects.annotate(
+            bucket=trunc,
+            asset_type=F('asset__asset_type'),
+            asset_group=F('asset__asset_group'),
+        ).values('bucket', 'status', 'severity', 'asset_type', 'asset_group').annotate(
+            total=Count('pk')
+        ).order_by()
+        for bucket in buckets:
+            rows.append(ComplaintRollup(
+                granularity=granularity,
+                bucket_start=bucket['bucket'],
+                status=bucket['status'],
+                severity=bucket['severity'],
+                asset_type=bucket['asset_type'],
+                asset_group=bucket['asset_group'],
+                count=bucket['total'],
+            ))
+    ComplaintRollup.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('asset', '0001_initial'),
+        ('citizen_portal', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComplaintRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('HOUR', 'Hour'), ('DAY', 'Day')], max_length=4)),
+                ('bucket_start', models.DateTimeField()),
+                ('status', models.CharField(choices=[('SUBMITTED', 'Submitted'), ('INSPECTING', 'Inspecting'), ('REPAIRING', 'Repairing'), ('COMPLETED', 'Completed')], max_length=20)),
+                ('severity', models.CharField(choices=[('LOW', 'Low'), ('MEDIUM', 'Medium'), ('HIGH', 'High'), ('CRITICAL', 'Critical')], max_length=20)),
+                ('asset_type', models.CharField(max_length=20)),
+                ('asset_group', models.CharField(max_length=10)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['granularity', 'bucket_start'],
+                'constraints': [models.UniqueConstraint(fields=('granularity', 'bucket_start', 'status', 'severity', 'asset_type', 'asset_group'), name='complaint_rollup_bucket_unique')],
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+from django.db import migrations
+
+# The index as of this migration, independent of later changes to
+# citizen_portal.search, which rebuild_complaint_search applies
+CREATE_FTS_TABLE = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS citizen_portal_complaint_fts USING fts5('
+    'complaint_id, description, reporter_name, reporter_phone, asset_number, location, '
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+
+DROP_FTS_TABLE = 'DROP TABLE IF EXISTS citizen_portal_complaint_fts'
+
+POPULATE_FTS_TABLE = (
+    'INSERT INTO citizen_portal_complaint_fts '
+    '(rowid, complaint_id, description, reporter_name, reporter_phone, asset_number, location) '
+    'SELECT c.id, c.complaint_id, c.complaint_description, '
+    "COALESCE(c.reporter_name, ''), COALESCE(c.reporter_phone, ''), a.asset_number, "
+    "TRIM(COALESCE(a.actual_location, '') || ' ' || COALESCE(a.planned_location, '')) "
+    'FROM {complaint_table} c JOIN {asset_table} a ON a.id = c.asset_id'
+)
+
+
+def create_fts_index(apps, schema_editor):
+    # FTS5 is SQLite only, other databases use the basic search backend
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Complaint = apps.get_model('citizen_portal', 'Complaint')
+    Asset = apps.get_model('asset', 'Asset')
+    schema_editor.execute(CREATE_FTS_TABLE)
+    schema_editor.execute(POPULATE_FTS_TABLE.format(
+        complaint_table=Complaint._meta.db_table, asset_table=Asset._meta.db_table,
+    ))
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(DROP_FTS_TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('asset', '0006_asset_list_keyset_indexes'),
+        ('citizen_portal', '0002_complaint_rollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
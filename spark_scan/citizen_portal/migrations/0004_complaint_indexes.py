@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('asset', '0009_asset_status_type_index'),
+        ('citizen_portal', '0003_complaint_fts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['created_at'], name='complaint_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['status', 'created_at'], name='complaint_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['asset', 'status'], name='complaint_asset_status_idx'),
+        ),
+    ]
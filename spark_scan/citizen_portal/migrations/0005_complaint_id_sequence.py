@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:04
+
+import re
+
+from django.db import migrations, models
+
+
+def seed_sequences(apps, schema_editor):
+    """Start each year's counter after the highest existing (random) number"""
+    Complaint = apps.get_model('citizen_portal', 'Complaint')
+    ComplaintIdSequence = apps.get_model('citizen_portal', 'ComplaintIdSequence')
+    highest = {}
+    for complaint_id in Complaint.objects.values_list('complaint_id', flat=True).iterator():
+        match = re.fullmatch(r'CPN-(\d{4})-(\d+)', complaint_id)
+        if match:
+            year, number = int(match.group(1)), int(match.group(2))
+            highest[year] = max(highest.get(year, 0), number)
+    ComplaintIdSequence.objects.bulk_create([
+        ComplaintIdSequence(year=year, last_value=number) for year, number in highest.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citizen_portal', '0004_complaint_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComplaintIdSequence',
+            fields=[
+                ('year', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('last_value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citizen_portal', '0005_complaint_id_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='complaint',
+            name='images_processed',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:10
+
+import citizen_portal.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citizen_portal', '0006_complaint_images_processed'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='complaint',
+            name='image1',
+            field=models.ImageField(blank=True, null=True, storage=citizen_portal.storage.ContentAddressedStorage(), upload_to='complaint_images/'),
+        ),
+        migrations.AlterField(
+            model_name='complaint',
+            name='image2',
+            field=models.ImageField(blank=True, null=True, storage=citizen_portal.storage.ContentAddressedStorage(), upload_to='complaint_images/'),
+        ),
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('size', models.PositiveBigIntegerField()),
+                ('refcount', models.IntegerField(default=1)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['refcount', 'updated_at'], name='media_blob_refcount_idx')],
+            },
+        ),
+    ]
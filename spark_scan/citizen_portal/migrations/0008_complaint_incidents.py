@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('asset', '0009_asset_status_type_index'),
+        ('citizen_portal', '0007_media_blob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Incident',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('SUBMITTED', 'Submitted'), ('INSPECTING', 'Inspecting'), ('REPAIRING', 'Repairing'), ('COMPLETED', 'Completed')], default='SUBMITTED', max_length=20)),
+                ('signature', models.JSONField(default=list)),
+                ('complaint_count', models.PositiveIntegerField(default=0)),
+                ('first_complaint_at', models.DateTimeField()),
+                ('last_complaint_at', models.DateTimeField()),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+                ('resolution_notes', models.TextField(blank=True, null=True)),
+                ('resolved_by', models.CharField(blank=True, max_length=100, null=True)),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='incidents', to='asset.asset')),
+            ],
+            options={
+                'ordering': ['-last_complaint_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='complaint',
+            name='incident',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='complaints', to='citizen_portal.incident'),
+        ),
+        migrations.AddIndex(
+            model_name='incident',
+            index=models.Index(fields=['asset', 'status', 'last_complaint_at'], name='incident_asset_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='incident',
+            index=models.Index(fields=['last_complaint_at'], name='incident_last_complaint_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='incident',
+            index=models.Index(fields=['status', 'last_complaint_at'], name='incident_status_last_idx'),
+        ),
+    ]
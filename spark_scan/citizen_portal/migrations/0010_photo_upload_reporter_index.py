@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citizen_portal', '0009_photo_upload'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='photoupload',
+            index=models.Index(fields=['reporter_phone', 'expires_at'], name='photo_upload_reporter_idx'),
+        ),
+    ]
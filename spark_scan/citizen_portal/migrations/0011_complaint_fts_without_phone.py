@@ -0,0 +1,54 @@
+import importlib
+
+from django.db import migrations
+
+# The index as of this migration: 0003's without reporter_phone, so phone
+# numbers are neither searchable nor kept in the FTS shadow tables
+CREATE_FTS_TABLE = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS citizen_portal_complaint_fts USING fts5('
+    'complaint_id, description, reporter_name, asset_number, location, '
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+
+DROP_FTS_TABLE = 'DROP TABLE IF EXISTS citizen_portal_complaint_fts'
+
+POPULATE_FTS_TABLE = (
+    'INSERT INTO citizen_portal_complaint_fts '
+    '(rowid, complaint_id, description, reporter_name, asset_number, location) '
+    'SELECT c.id, c.complaint_id, c.complaint_description, '
+    "COALESCE(c.reporter_name, ''), a.asset_number, "
+    "TRIM(COALESCE(a.actual_location, '') || ' ' || COALESCE(a.planned_location, '')) "
+    'FROM {complaint_table} c JOIN {asset_table} a ON a.id = c.asset_id'
+)
+
+
+def rebuild_without_phone(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Complaint = apps.get_model('citizen_portal', 'Complaint')
+    Asset = apps.get_model('asset', 'Asset')
+    # FTS5 tables cannot drop a column: re-create and re-populate
+    schema_editor.execute(DROP_FTS_TABLE)
+    schema_editor.execute(CREATE_FTS_TABLE)
+    schema_editor.execute(POPULATE_FTS_TABLE.format(
+        complaint_table=Complaint._meta.db_table, asset_table=Asset._meta.db_table,
+    ))
+    schema_editor.execute("INSERT INTO citizen_portal_complaint_fts (citizen_portal_complaint_fts) VALUES ('optimize')")
+
+
+def restore_phone_column(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(DROP_FTS_TABLE)
+    importlib.import_module('citizen_portal.migrations.0003_complaint_fts').create_fts_index(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citizen_portal', '0010_photo_upload_reporter_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_without_phone, restore_phone_column),
+    ]
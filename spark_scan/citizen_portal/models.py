@@ -1,6 +1,10 @@
-from django.db import models
+import uuid
+
+from django.db import models, transaction
 from asset.models import Asset
 
+from .storage import media_store
+
 class ComplaintStatus(models.TextChoices):
     SUBMITTED = 'SUBMITTED', 'Submitted'
     INSPECTING = 'INSPECTING', 'Inspecting'
@@ -13,6 +17,51 @@ class SeverityLevel(models.TextChoices):
     HIGH = 'HIGH', 'High'
     CRITICAL = 'CRITICAL', 'Critical'
 
+# Statuses counted as open on Asset.open_complaints
+OPEN_STATUSES = [
+    ComplaintStatus.SUBMITTED,
+    ComplaintStatus.INSPECTING,
+    ComplaintStatus.REPAIRING,
+]
+
+# Photo fields of a complaint (see citizen_portal.images)
+IMAGE_FIELDS = ['image1', 'image2']
+
+class Incident(models.Model):
+    """
+    Complaints about the same fault: same or nearby asset, similar
+    description, reported within INCIDENT_WINDOW_MINUTES of each other.
+    New complaints are attached as they are saved (see
+    citizen_portal.incidents); resolving the incident resolves them all.
+    """
+    # Asset of the first complaint; later ones may be on nearby assets
+    asset = models.ForeignKey(Asset, on_delete=models.CASCADE, related_name='incidents')
+    status = models.CharField(max_length=20, choices=ComplaintStatus.choices, default='SUBMITTED')
+    
+    # MinHash of the first complaint's description, matched against new ones
+    signature = models.JSONField(default=list)
+    complaint_count = models.PositiveIntegerField(default=0)
+    first_complaint_at = models.DateTimeField()
+    last_complaint_at = models.DateTimeField()
+    
+    resolved_at = models.DateTimeField(null=True, blank=True)
+    resolution_notes = models.TextField(null=True, blank=True)
+    resolved_by = models.CharField(max_length=100, null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-last_complaint_at']
+        indexes = [
+            # Open incidents of a few assets, recent first (grouping a new complaint)
+            models.Index(fields=['asset', 'status', 'last_complaint_at'], name='incident_asset_open_idx'),
+            # Incident list, optionally by status
+            models.Index(fields=['last_complaint_at'], name='incident_last_complaint_idx'),
+            models.Index(fields=['status', 'last_complaint_at'], name='incident_status_last_idx'),
+        ]
+    
+    def __str__(self):
+        return f"INC-{self.pk}"
+
+
 class Complaint(models.Model):
     # Complaint ID (auto-generated)
     complaint_id = models.CharField(max_length=20, unique=True, editable=False)
@@ -20,6 +69,9 @@ class Complaint(models.Model):
     # Linked Asset
     asset = models.ForeignKey(Asset, on_delete=models.CASCADE, related_name='complaints')
     
+    # Duplicate reports of one fault share an incident
+    incident = models.ForeignKey(Incident, on_delete=models.SET_NULL, null=True, blank=True, related_name='complaints')
+    
     # Reporter Information
     reporter_name = models.CharField(max_length=100, null=True, blank=True)
     reporter_phone = models.CharField(max_length=15)
@@ -29,8 +81,11 @@ class Complaint(models.Model):
     severity = models.CharField(max_length=20, choices=SeverityLevel.choices, default='MEDIUM')
     
     # Images
-    image1 = models.ImageField(upload_to='complaint_images/', null=True, blank=True)
-    image2 = models.ImageField(upload_to='complaint_images/', null=True, blank=True)
+    # Deduplicated by content, see citizen_portal.storage
+    image1 = models.ImageField(upload_to='complaint_images/', storage=media_store, null=True, blank=True)
+    image2 = models.ImageField(upload_to='complaint_images/', storage=media_store, null=True, blank=True)
+    # Renditions written and EXIF stripped (see citizen_portal/images.py)
+    images_processed = models.BooleanField(default=False)
     
     # Status
     status = models.CharField(max_length=20, choices=ComplaintStatus.choices, default='SUBMITTED')
@@ -48,20 +103,182 @@ class Complaint(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Complaint'
         verbose_name_plural = 'Complaints'
+        indexes = [
+            # Complaint list, newest first, optionally by status
+            models.Index(fields=['created_at'], name='complaint_created_idx'),
+            models.Index(fields=['status', 'created_at'], name='complaint_status_created_idx'),
+            # Complaints of one asset by status (counters, open issues)
+            models.Index(fields=['asset', 'status'], name='complaint_asset_status_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.complaint_id} - {self.asset.asset_number}"
+        # The asset number only when the asset is already loaded: printing a
+        # list of complaints must not cost a query per row
+        if Complaint.asset.is_cached(self):
+            return f"{self.complaint_id} - {self.asset.asset_number}"
+        return self.complaint_id
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored status/severity for the delete signals
+        instance._loaded_state = (instance.__dict__.get('status'), instance.__dict__.get('severity'))
+        # and the stored photos, to release those replaced (signals.release_replaced_images)
+        instance._loaded_images = instance._image_names()
+        return instance
+    
+    def _image_names(self):
+        """{field: stored name} of the loaded (not deferred) photo fields"""
+        return {
+            field: getattr(self.__dict__[field], 'name', self.__dict__[field]) or ''
+            for field in IMAGE_FIELDS if field in self.__dict__
+        }
     
     def save(self, *args, **kwargs):
-        if not self.complaint_id:
+        from .complaint_ids import reserves_blocks
+        assigned_id = not self.complaint_id
+        if assigned_id and reserves_blocks():
+            # From this process's block, reserved outside any transaction
             self.complaint_id = self.generate_complaint_id()
-        super().save(*args, **kwargs)
+        
+        is_new = self._state.adding
+        
+        # Counters on the asset change in the same transaction as the complaint
+        try:
+            with transaction.atomic():
+                previous_status = previous_severity = None
+                if not is_new:
+                    # The stored row under a lock, not the state this instance
+                    # was loaded with: two stale copies saving the same
+                    # transition would both apply its counter delta
+                    previous_status, previous_severity = Complaint.objects.select_for_update().filter(
+                        pk=self.pk
+                    ).values_list('status', 'severity').first() or (None, None)
+                # Read by the post_save handlers (rollups) as the state being replaced
+                self._previous_state = (previous_status, previous_severity)
+                if not self.complaint_id:
+                    # Taken in the insert's transaction: given back if it rolls back
+                    self.complaint_id = self.generate_complaint_id()
+                if is_new and self.incident_id is None:
+                    from .incidents import attach
+                    attach(self)
+                super().save(*args, **kwargs)
+                was_open = previous_status in OPEN_STATUSES
+                is_open = self.status in OPEN_STATUSES
+                Asset.adjust_complaint_counters(
+                    self.asset_id,
+                    open_delta=int(is_open) - int(was_open),
+                    total_delta=1 if is_new else 0,
+                )
+        except Exception:
+            if assigned_id and not reserves_blocks():
+                # The number went back to the sequence, a retry takes a fresh one
+                self.complaint_id = ''
+            raise
+        self._loaded_state = (self.status, self.severity)
+        self._loaded_images = self._image_names()
     
     def generate_complaint_id(self):
-        import random
-        from datetime import datetime
-        year = datetime.now().year
-        while True:
-            complaint_id = f"CPN-{year}-{random.randint(1000, 9999)}"
-            if not Complaint.objects.filter(complaint_id=complaint_id).exists():
-                return complaint_id
\ No newline at end of file
+        # Next number of this year's sequence, see citizen_portal.complaint_ids
+        from .complaint_ids import next_complaint_id
+        return next_complaint_id()
+
+
+class ComplaintIdSequence(models.Model):
+    """
+    Last complaint number handed out in a year (CPN-<year>-<number>).
+    Advanced by citizen_portal.complaint_ids with one atomic write.
+    """
+    year = models.PositiveIntegerField(primary_key=True)
+    last_value = models.PositiveBigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.year}: {self.last_value}"
+
+
+class RollupGranularity(models.TextChoices):
+    HOUR = 'HOUR', 'Hour'
+    DAY = 'DAY', 'Day'
+
+
+class ComplaintRollup(models.Model):
+    """
+    Number of complaints created in a time bucket, split by their current
+    status, severity and the asset type/group. Kept up to date on every
+    complaint write (see citizen_portal.rollups) so dashboard statistics
+    read a few rollup rows instead of counting the complaints table.
+    """
+    granularity = models.CharField(max_length=4, choices=RollupGranularity.choices)
+    bucket_start = models.DateTimeField()
+    
+    status = models.CharField(max_length=20, choices=ComplaintStatus.choices)
+    severity = models.CharField(max_length=20, choices=SeverityLevel.choices)
+    asset_type = models.CharField(max_length=20)
+    asset_group = models.CharField(max_length=10)
+    
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        ordering = ['granularity', 'bucket_start']
+        constraints = [
+            # Also serves the (granularity, bucket_start) range scans
+            models.UniqueConstraint(
+                fields=['granularity', 'bucket_start', 'status', 'severity', 'asset_type', 'asset_group'],
+                name='complaint_rollup_bucket_unique',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.granularity} {self.bucket_start:%Y-%m-%d %H:%M} {self.status}/{self.severity}: {self.count}"
+
+
+class MediaBlob(models.Model):
+    """
+    One stored file per content digest (see citizen_portal.storage).
+    refcount is the number of field values pointing at it; blobs at 0 are
+    removed by collect_media_garbage.
+    """
+    digest = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=100, unique=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.IntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Last refcount change, the GC grace period counts from here
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['refcount', 'updated_at'], name='media_blob_refcount_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} ({self.refcount} reference(s))"
+
+
+class PhotoUpload(models.Model):
+    """
+    A complaint photo uploaded in chunks (see citizen_portal.uploads). The
+    id is what the client resumes with and what the complaint form refers
+    to once the upload is complete.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # Verified number of the report the photo belongs to
+    reporter_phone = models.CharField(max_length=15)
+    filename = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField()
+    # Bytes received from the start: where the next chunk has to begin
+    received = models.PositiveBigIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Pushed back by every chunk, see cleanup_photo_uploads
+    expires_at = models.DateTimeField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], name='photo_upload_expires_idx'),
+            # Open uploads of a reporter (the per-session cap)
+            models.Index(fields=['reporter_phone', 'expires_at'], name='photo_upload_reporter_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size} bytes)"
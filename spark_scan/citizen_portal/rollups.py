@@ -0,0 +1,216 @@
+"""
+Hourly/daily complaint rollups.
+
+ComplaintRollup rows count complaints by creation bucket, current status,
+severity and asset type/group. Complaint writes shift the matching rows
+incrementally, and so does editing an asset's type or group (see
+move_asset). rebuild() recomputes everything from the complaints table.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from asset.models import Asset
+from .models import Complaint, ComplaintRollup, ComplaintStatus, RollupGranularity
+
+# Dimensions a trend can be split by
+GROUP_BY_FIELDS = ['status', 'severity', 'asset_type', 'asset_group']
+
+# Backends with INSERT .. ON CONFLICT DO UPDATE (one statement per shift)
+UPSERT_VENDORS = ('sqlite', 'postgresql')
+
+KEY_FIELDS = ['granularity', 'bucket_start', 'status', 'severity', 'asset_type', 'asset_group']
+
+
+def bucket_start(moment, granularity):
+    """Start of the hour/day bucket containing moment (in the current time zone)"""
+    moment = timezone.localtime(moment).replace(minute=0, second=0, microsecond=0)
+    if granularity == RollupGranularity.DAY:
+        moment = moment.replace(hour=0)
+    return moment
+
+
+def _upsert(keys, delta):
+    """Add delta to the rows of keys, creating the missing ones, in one statement"""
+    quote = connection.ops.quote_name
+    table = quote(ComplaintRollup._meta.db_table)
+    fields = [ComplaintRollup._meta.get_field(name) for name in KEY_FIELDS]
+    columns = ', '.join(quote(field.column) for field in fields)
+    values = ', '.join(['(' + ', '.join(['%s'] * (len(fields) + 1)) + ')'] * len(keys))
+    params = []
+    for key in keys:
+        params.extend(field.get_db_prep_value(key[field.name], connection) for field in fields)
+        params.append(delta)
+    count = quote('count')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}, {count}) VALUES {values} '
+            f'ON CONFLICT ({columns}) DO UPDATE SET {count} = {table}.{count} + excluded.{count}',
+            params,
+        )
+
+
+def _shift(created_at, status, severity, asset_type, asset_group, delta):
+    """Add delta to the hour and day rows of one combination"""
+    keys = [
+        {
+            'granularity': granularity,
+            'bucket_start': bucket_start(created_at, granularity),
+            'status': status,
+            'severity': severity,
+            'asset_type': asset_type,
+            'asset_group': asset_group,
+        }
+        for granularity in RollupGranularity.values
+    ]
+    if connection.vendor in UPSERT_VENDORS:
+        _upsert(keys, delta)
+        return
+
+    for key in keys:
+        if ComplaintRollup.objects.filter(**key).update(count=F('count') + delta):
+            continue
+        try:
+            with transaction.atomic():
+                ComplaintRollup.objects.create(count=delta, **key)
+        except IntegrityError:
+            # Created concurrently, fall back to the update
+            ComplaintRollup.objects.filter(**key).update(count=F('count') + delta)
+
+
+def _asset_dimensions(complaint):
+    if Complaint.asset.is_cached(complaint):
+        # Loaded by the caller already, no query
+        return complaint.asset.asset_type, complaint.asset.asset_group
+    return Asset.objects.filter(pk=complaint.asset_id).values_list('asset_type', 'asset_group').first() or ('', '')
+
+
+def record_save(complaint, created, previous_status, previous_severity):
+    """Apply a complaint create or status/severity change to the rollups"""
+    if not created and (previous_status, previous_severity) == (complaint.status, complaint.severity):
+        return
+
+    asset_type, asset_group = _asset_dimensions(complaint)
+    if not created:
+        _shift(complaint.created_at, previous_status, previous_severity, asset_type, asset_group, -1)
+    _shift(complaint.created_at, complaint.status, complaint.severity, asset_type, asset_group, 1)
+
+
+def record_status_change(complaints, status):
+    """
+    Apply a bulk status change of complaints (as loaded, before the change)
+    to the rollups: one shift per affected row rather than per complaint.
+    """
+    shifts = Counter()
+    for complaint in complaints:
+        if complaint.status == status:
+            continue
+        asset_type, asset_group = _asset_dimensions(complaint)
+        hour = bucket_start(complaint.created_at, RollupGranularity.HOUR)
+        shifts[(hour, complaint.status, complaint.severity, asset_type, asset_group)] -= 1
+        shifts[(hour, status, complaint.severity, asset_type, asset_group)] += 1
+    for (hour, shift_status, severity, asset_type, asset_group), delta in shifts.items():
+        if delta:
+            _shift(hour, shift_status, severity, asset_type, asset_group, delta)
+
+
+def record_delete(complaint, status, severity):
+    asset_type, asset_group = _asset_dimensions(complaint)
+    _shift(complaint.created_at, status, severity, asset_type, asset_group, -1)
+
+
+def move_asset(asset_id, previous, current):
+    """
+    Move the complaints of an asset whose (asset_type, asset_group) changed
+    from previous to current: one shift pair per hour/status/severity.
+    """
+    buckets = Complaint.objects.filter(asset_id=asset_id).annotate(
+        hour=TruncHour('created_at'),
+    ).values('hour', 'status', 'severity').annotate(total=Count('pk')).order_by()
+    with transaction.atomic():
+        for bucket in buckets:
+            _shift(bucket['hour'], bucket['status'], bucket['severity'], *previous, -bucket['total'])
+            _shift(bucket['hour'], bucket['status'], bucket['severity'], *current, bucket['total'])
+
+
+def rebuild():
+    """Recompute all rollup rows from the complaints table, returns the row count"""
+    truncs = {
+        RollupGranularity.HOUR: TruncHour('created_at'),
+        RollupGranularity.DAY: TruncDay('created_at'),
+    }
+
+    with transaction.atomic():
+        ComplaintRollup.objects.all().delete()
+        rows = []
+        for granularity, trunc in truncs.items():
+            buckets = Complaint.objects.annotate(
+                bucket=trunc,
+                asset_type=F('asset__asset_type'),
+                asset_group=F('asset__asset_group'),
+            ).values('bucket', 'status', 'severity', 'asset_type', 'asset_group').annotate(
+                total=Count('pk')
+            ).order_by()
+
+            for bucket in buckets.iterator():
+                rows.append(ComplaintRollup(
+                    granularity=granularity,
+                    bucket_start=bucket['bucket'],
+                    status=bucket['status'],
+                    severity=bucket['severity'],
+                    asset_type=bucket['asset_type'],
+                    asset_group=bucket['asset_group'],
+                    count=bucket['total'],
+                ))
+        ComplaintRollup.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def rollup_rows(start=None, end=None, granularity=RollupGranularity.DAY):
+    """Rollup rows of a granularity with bucket_start in [start, end)"""
+    rows = ComplaintRollup.objects.filter(granularity=granularity)
+    if start is not None:
+        rows = rows.filter(bucket_start__gte=bucket_start(start, granularity))
+    if end is not None:
+        rows = rows.filter(bucket_start__lt=end)
+    return rows
+
+
+def status_totals(start=None, end=None):
+    """{status: count} of complaints created in [start, end), all time by default"""
+    totals = {status: 0 for status in ComplaintStatus.values}
+    for row in rollup_rows(start, end).values('status').annotate(total=Sum('count')).order_by():
+        totals[row['status']] = row['total']
+    return totals
+
+
+def trend(start, end, granularity=RollupGranularity.DAY, group_by='status'):
+    """
+    Complaint counts per bucket between start and end, split by group_by.
+
+    Returns {'buckets': [iso datetimes], 'series': {group value: [counts]}}.
+    """
+    if group_by not in GROUP_BY_FIELDS:
+        raise ValueError(f'group_by must be one of {", ".join(GROUP_BY_FIELDS)}.')
+
+    rows = rollup_rows(start, end, granularity).values('bucket_start', group_by).annotate(
+        total=Sum('count')
+    ).order_by('bucket_start')
+
+    buckets, series = [], {}
+    for row in rows:
+        label = timezone.localtime(row['bucket_start']).isoformat()
+        if not buckets or buckets[-1] != label:
+            buckets.append(label)
+        series.setdefault(row[group_by], {})[label] = row['total']
+
+    return {
+        'buckets': buckets,
+        'series': {
+            key: [counts.get(label, 0) for label in buckets]
+            for key, counts in series.items()
+        },
+    }
@@ -0,0 +1,226 @@
+"""
+Full-text search over complaints and their assets.
+
+The backend is chosen by COMPLAINT_SEARCH_BACKEND. FTS5Backend keeps an
+SQLite FTS5 index (one row per complaint, rowid = complaint pk) that the
+signals in citizen_portal.signals update on every complaint/asset write;
+BasicSearchBackend is the plain icontains scan for other databases.
+"""
+import re
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, FloatField, Q
+from django.db.models.expressions import ExpressionWrapper, RawSQL
+from django.utils.module_loading import import_string
+
+from asset.models import Asset
+from .models import Complaint
+
+FTS_TABLE = 'citizen_portal_complaint_fts'
+
+# Indexed columns, in table order (the rowid is the complaint pk)
+# Reporter phone numbers are personal data and deliberately not indexed
+FTS_COLUMNS = ['complaint_id', 'description', 'reporter_name', 'asset_number', 'location']
+
+# bm25 weights per column: ids and asset numbers outrank free text
+FTS_WEIGHTS = [10.0, 1.0, 3.0, 8.0, 2.0]
+
+# Most results a search returns
+SEARCH_LIMIT = 500
+
+CREATE_FTS_TABLE = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+    f'{", ".join(FTS_COLUMNS)}, '
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+DROP_FTS_TABLE = f'DROP TABLE IF EXISTS {FTS_TABLE}'
+
+
+def populate_sql(complaint_table, asset_table):
+    """Index every complaint in one INSERT ... SELECT"""
+    return (
+        f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(FTS_COLUMNS)}) '
+        f'SELECT c.id, c.complaint_id, c.complaint_description, '
+        f"COALESCE(c.reporter_name, ''), a.asset_number, "
+        f"TRIM(COALESCE(a.actual_location, '') || ' ' || COALESCE(a.planned_location, '')) "
+        f'FROM {complaint_table} c JOIN {asset_table} a ON a.id = c.asset_id'
+    )
+
+
+class SearchBackend(ABC):
+    """Interface of a complaint search backend, index upkeep is optional"""
+
+    def index(self, complaints):
+        """Add or refresh the entries of the given complaints"""
+
+    def remove(self, complaint_pks):
+        """Drop the entries of deleted complaints"""
+
+    def reindex_asset(self, asset):
+        """Refresh the asset columns of all complaints of one asset"""
+
+    def rebuild(self):
+        """Re-create the whole index, returns the number of complaints indexed"""
+        return 0
+
+    @abstractmethod
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Complaint pks matching query, best match first"""
+
+    @abstractmethod
+    def filter_queryset(self, queryset, query):
+        """Restrict a complaint queryset to all matches of query (unranked, unlimited)"""
+
+    @abstractmethod
+    def rank_queryset(self, queryset, query):
+        """
+        Restrict a complaint queryset to all matches of query, annotated
+        with ``search_rank`` (ascending: best match first), so it can be
+        paged in SQL like any other ordering.
+        """
+
+
+class BasicSearchBackend(SearchBackend):
+    """No index: substring match across the complaint and asset columns"""
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        matches = self.filter_queryset(Complaint.objects.all(), query)
+        return list(matches.order_by('-created_at').values_list('pk', flat=True)[:limit])
+
+    def filter_queryset(self, queryset, query):
+        return queryset.filter(
+            Q(complaint_id__icontains=query) |
+            Q(complaint_description__icontains=query) |
+            Q(reporter_name__icontains=query) |
+            Q(asset__asset_number__icontains=query) |
+            Q(asset__actual_location__icontains=query) |
+            Q(asset__planned_location__icontains=query)
+        )
+
+    def rank_queryset(self, queryset, query):
+        # No relevance without an index: newest first
+        return self.filter_queryset(queryset, query).annotate(
+            search_rank=ExpressionWrapper(-F('pk'), output_field=FloatField())
+        )
+
+
+def _fts_query(query):
+    """
+    FTS5 MATCH expression for free user input: every word must match,
+    as a prefix. Words are quoted so FTS5 operators and punctuation in
+    the input are taken literally.
+    """
+    terms = [term.replace('"', '') for term in re.split(r'\s+', query.strip())]
+    return ' '.join(f'"{term}"*' for term in terms if term)
+
+
+class FTS5Backend(SearchBackend):
+    """SQLite FTS5 index with bm25 ranking"""
+
+    def _rows(self, complaints):
+        return (
+            (
+                complaint.pk,
+                complaint.complaint_id,
+                complaint.complaint_description,
+                complaint.reporter_name or '',
+                complaint.asset.asset_number,
+                ' '.join(filter(None, [complaint.asset.actual_location, complaint.asset.planned_location])),
+            )
+            for complaint in complaints
+        )
+
+    def _write(self, cursor, rows):
+        rows = list(rows)
+        if not rows:
+            return
+        # FTS5 has no upsert: delete then insert
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+        placeholders = ', '.join(['%s'] * (len(FTS_COLUMNS) + 1))
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(FTS_COLUMNS)}) VALUES ({placeholders})', rows
+        )
+
+    def index(self, complaints):
+        with connection.cursor() as cursor:
+            self._write(cursor, self._rows(complaints))
+
+    def remove(self, complaint_pks):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in complaint_pks])
+
+    def reindex_asset(self, asset):
+        location = ' '.join(filter(None, [asset.actual_location, asset.planned_location]))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {FTS_TABLE} SET asset_number = %s, location = %s '
+                f'WHERE rowid IN (SELECT id FROM {Complaint._meta.db_table} WHERE asset_id = %s)',
+                [asset.asset_number, location, asset.pk],
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(DROP_FTS_TABLE)
+            cursor.execute(CREATE_FTS_TABLE)
+            cursor.execute(populate_sql(Complaint._meta.db_table, Asset._meta.db_table))
+            # Merge the index segments into one b-tree
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        return Complaint.objects.count()
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        expression = _fts_query(query)
+        if not expression:
+            return []
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s',
+                [expression, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def filter_queryset(self, queryset, query):
+        expression = _fts_query(query)
+        if not expression:
+            return queryset.none()
+        # Subquery, not a list of pks: any number of matches
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [expression]
+        ))
+
+    def rank_queryset(self, queryset, query):
+        expression = _fts_query(query)
+        if not expression:
+            return queryset.none()
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        # bm25 of the complaint's own index row, looked up by rowid for the
+        # rows left by the queryset's filters only
+        rank = RawSQL(
+            f'SELECT bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = {Complaint._meta.db_table}.id',
+            [expression],
+            output_field=FloatField(),
+        )
+        return self.filter_queryset(queryset, query).annotate(search_rank=rank)
+
+
+_backend = None
+
+
+def get_backend():
+    """The configured backend (FTS5 only on SQLite)"""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'COMPLAINT_SEARCH_BACKEND', 'citizen_portal.search.FTS5Backend')
+        backend_class = import_string(path)
+        if issubclass(backend_class, FTS5Backend) and connection.vendor != 'sqlite':
+            backend_class = BasicSearchBackend
+        _backend = backend_class()
+    return _backend
+
+
+def search(query, limit=SEARCH_LIMIT):
+    return get_backend().search(query, limit=limit)
@@ -0,0 +1,148 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from asset.models import Asset
+from spark_scan import live
+from .models import Complaint, Incident, OPEN_STATUSES
+from . import images, incidents, rollups, search
+
+
+def _stored_state(instance):
+    """(status, severity) as last loaded from / written to the database"""
+    return getattr(instance, '_loaded_state', (instance.status, instance.severity))
+
+
+@receiver(post_save, sender=Complaint)
+def update_rollups_on_save(sender, instance, created, **kwargs):
+    """Runs inside Complaint.save's transaction"""
+    previous_status, previous_severity = getattr(instance, '_previous_state', (None, None))
+    rollups.record_save(instance, created, previous_status, previous_severity)
+
+
+@receiver(post_delete, sender=Complaint)
+def decrement_asset_counters(sender, instance, **kwargs):
+    """Runs inside the delete transaction, also for queryset deletes"""
+    stored_status, _ = _stored_state(instance)
+    Asset.adjust_complaint_counters(
+        instance.asset_id,
+        open_delta=-1 if stored_status in OPEN_STATUSES else 0,
+        total_delta=-1,
+    )
+
+
+@receiver(post_delete, sender=Complaint)
+def decrement_incident_count(sender, instance, **kwargs):
+    if instance.incident_id:
+        Incident.objects.filter(pk=instance.incident_id).update(complaint_count=F('complaint_count') - 1)
+
+
+@receiver(post_delete, sender=Complaint)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    rollups.record_delete(instance, *_stored_state(instance))
+
+
+@receiver(post_save, sender=Complaint)
+def push_complaint_event(sender, instance, created, **kwargs):
+    """Tell open dashboards about new complaints and status transitions"""
+    previous_status, _ = getattr(instance, '_previous_state', (None, None))
+    event = {
+        'complaint_id': instance.complaint_id,
+        'asset_id': instance.asset_id,
+        'status': instance.status,
+        'severity': instance.severity,
+    }
+    if created:
+        transaction.on_commit(lambda: live.publish('complaint.created', **event))
+    elif previous_status != instance.status:
+        event['previous_status'] = previous_status
+        transaction.on_commit(lambda: live.publish('complaint.status', **event))
+
+
+@receiver(post_save, sender=Complaint)
+def move_incident_along(sender, instance, created, **kwargs):
+    """A complaint resolved (or reopened) on its own, see incidents.follow_complaint"""
+    previous_status, _ = getattr(instance, '_previous_state', (None, None))
+    if not created and previous_status != instance.status:
+        incidents.follow_complaint(instance)
+
+
+@receiver(post_save, sender=Complaint)
+def index_complaint(sender, instance, **kwargs):
+    """Same transaction as the write, the index never sees uncommitted rows"""
+    search.get_backend().index([instance])
+
+
+@receiver(post_delete, sender=Complaint)
+def unindex_complaint(sender, instance, **kwargs):
+    search.get_backend().remove([instance.pk])
+
+
+@receiver(post_save, sender=Asset)
+def reindex_asset_complaints(sender, instance, created, **kwargs):
+    """Asset number and locations are indexed with each complaint"""
+    if not created:
+        search.get_backend().reindex_asset(instance)
+
+
+@receiver(post_save, sender=Asset)
+def move_asset_rollups(sender, instance, created, **kwargs):
+    """Rollup rows are keyed by asset type and group, follow an edit of either"""
+    previous = getattr(instance, '_previous_dimensions', None)
+    if not created and previous and tuple(previous) != (instance.asset_type, instance.asset_group):
+        rollups.move_asset(instance.pk, previous, (instance.asset_type, instance.asset_group))
+
+
+@receiver(post_save, sender=Complaint)
+def process_complaint_images(sender, instance, created, **kwargs):
+    """Renditions are made in the worker pool once the complaint is committed"""
+    if created:
+        if instance.image1 or instance.image2:
+            images.schedule(instance.pk)
+        return
+    if getattr(instance, '_changed_images', None):
+        # The renditions are of the previous photo: show the new original
+        # until it is processed
+        instance._changed_images = []
+        Complaint.objects.filter(pk=instance.pk).update(images_processed=False)
+        instance.images_processed = False
+        images.schedule(instance.pk)
+
+
+@receiver(post_delete, sender=Complaint)
+def release_complaint_images(sender, instance, **kwargs):
+    """Drop the photo references once the delete commits (see citizen_portal.storage)"""
+    for field in images.IMAGE_FIELDS:
+        field_file = getattr(instance, field)
+        if field_file:
+            transaction.on_commit(
+                lambda storage=field_file.storage, name=field_file.name: storage.delete(name)
+            )
+
+
+@receiver(pre_save, sender=Complaint)
+def release_replaced_images(sender, instance, update_fields=None, **kwargs):
+    """
+    A photo replaced or cleared (e.g. through a form) loses its reference
+    once the save commits; the new one is referenced as it is stored.
+    Fields given a new photo are noted for process_complaint_images.
+    """
+    instance._changed_images = []
+    if instance._state.adding:
+        return
+    stored = getattr(instance, '_loaded_images', None)
+    if stored is None:
+        fields = [field for field in images.IMAGE_FIELDS if field in instance.__dict__]
+        names = Complaint.objects.filter(pk=instance.pk).values_list(*fields).first() if fields else None
+        stored = dict(zip(fields, names or ()))
+    for field, name in stored.items():
+        if update_fields is not None and field not in update_fields:
+            continue
+        field_file = getattr(instance, field)
+        if (field_file.name or '') == (name or ''):
+            continue
+        if field_file:
+            instance._changed_images.append(field)
+        if name:
+            transaction.on_commit(lambda storage=field_file.storage, name=name: storage.delete(name))
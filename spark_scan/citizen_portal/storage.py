@@ -0,0 +1,171 @@
+"""
+Content-addressed, deduplicating storage for complaint photos.
+
+save() streams an upload into MEDIA_ROOT/.incoming/ while hashing it
+(SHA-256) and files it as <upload_to>/<aa>/<digest><ext>. When a blob with
+that digest already exists the new copy is dropped and the existing name
+is returned, so however many times a citizen uploads the same photo it is
+stored once and every complaint points at the same file.
+
+Each blob has a MediaBlob row counting the field values that reference
+it: save() adds a reference, delete() drops one and leaves the file. The
+collect_media_garbage command removes blobs without references once they
+have been unreferenced for a grace period (an upload is referenced before
+the complaint pointing at it commits). Names that are not blobs, i.e.
+files stored before this storage, are deleted as usual.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import uuid
+from datetime import timedelta
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+# Uploads being hashed, renamed into place once their digest is known
+INCOMING_DIRECTORY = '.incoming'
+
+BLOB_NAME = re.compile(r'(?:^|/)[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})(?:\.[a-z0-9]+)?$')
+
+
+def blob_name(directory, digest, extension):
+    return posixpath.join(directory, digest[:2], digest + extension)
+
+
+def blob_digest(name):
+    """Digest of a blob name, None for any other name"""
+    match = BLOB_NAME.search(name or '')
+    return match['digest'] if match else None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # Stored under its digest, which different content never takes
+        return name
+
+    def _save(self, name, content):
+        incoming = self.path(INCOMING_DIRECTORY)
+        os.makedirs(incoming, exist_ok=True)
+        temporary = os.path.join(incoming, uuid.uuid4().hex)
+
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with open(temporary, 'xb') as destination:
+                for chunk in content.chunks():
+                    hasher.update(chunk)
+                    destination.write(chunk)
+                    size += len(chunk)
+            digest = hasher.hexdigest()
+            directory, filename = posixpath.split(name)
+            if blob_digest(name):
+                # Saving over a blob (e.g. a processed photo), same upload_to
+                directory = posixpath.dirname(directory)
+            extension = posixpath.splitext(filename)[1].lower()
+            stored = self.add_reference(digest, blob_name(directory, digest, extension), size)
+
+            path = self.path(stored)
+            if not os.path.exists(path):
+                # First copy (or its file went missing), put it in place
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(temporary, self.file_permissions_mode)
+                os.replace(temporary, path)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+        return stored
+
+    def add_reference(self, digest, name, size):
+        """Count one more reference to digest, creating its row as name. Returns the blob's name."""
+        from .models import MediaBlob
+
+        while True:
+            with transaction.atomic():
+                blobs = MediaBlob.objects.filter(digest=digest)
+                if blobs.update(refcount=F('refcount') + 1, updated_at=timezone.now()):
+                    return blobs.values_list('name', flat=True).get()
+            try:
+                with transaction.atomic():
+                    MediaBlob.objects.create(digest=digest, name=name, size=size)
+                return name
+            except IntegrityError:
+                # Created concurrently, count the reference on that row
+                continue
+
+    def delete(self, name):
+        digest = blob_digest(name)
+        if digest is None:
+            return super().delete(name)
+        from .models import MediaBlob
+
+        # The file stays until collect_garbage(), another upload may reuse it
+        MediaBlob.objects.filter(digest=digest, refcount__gt=0).update(
+            refcount=F('refcount') - 1, updated_at=timezone.now(),
+        )
+
+    def adopt(self, name):
+        """Store a file saved before this storage as a blob, returns the blob's name"""
+        with self.open(name, 'rb') as existing:
+            return self.save(name, existing)
+
+    def collect_garbage(self, grace=timedelta(hours=24), dry_run=False):
+        """
+        Delete the blobs (and their renditions) unreferenced for longer than
+        grace, and blob or incoming files without a MediaBlob row older
+        than that. Returns the deleted names.
+        """
+        from .images import rendition_names
+        from .models import MediaBlob
+
+        cutoff = timezone.now() - grace
+        deleted = []
+        candidates = MediaBlob.objects.filter(refcount__lte=0, updated_at__lt=cutoff)
+        for digest, name in list(candidates.values_list('digest', 'name')):
+            if dry_run:
+                deleted.append(name)
+                continue
+            with transaction.atomic():
+                # The conditional delete re-checks the count and holds the
+                # row until the files are gone: a save() reusing the blob
+                # meanwhile either keeps it or waits and stores a new copy
+                if not candidates.filter(digest=digest).delete()[0]:
+                    continue
+                for stored in [name, *rendition_names(name)]:
+                    super().delete(stored)
+            deleted.append(name)
+
+        known = set(MediaBlob.objects.values_list('digest', flat=True))
+        for name, modified in self._stored_files():
+            if modified >= cutoff:
+                continue
+            digest = blob_digest(name)
+            if name.startswith(INCOMING_DIRECTORY + '/'):
+                orphans = [name]
+            elif digest not in known:
+                orphans = [name, *rendition_names(name)]
+            else:
+                continue
+            deleted.append(name)
+            if not dry_run:
+                for orphan in orphans:
+                    super().delete(orphan)
+        return deleted
+
+    def _stored_files(self):
+        """(name, modified time) of the blob and incoming files"""
+        for root, directories, files in os.walk(self.location):
+            for filename in files:
+                name = os.path.relpath(os.path.join(root, filename), self.location).replace(os.sep, '/')
+                if name.startswith(INCOMING_DIRECTORY + '/') or BLOB_NAME.search(name):
+                    yield name, self.get_modified_time(name)
+
+
+media_store = ContentAddressedStorage()
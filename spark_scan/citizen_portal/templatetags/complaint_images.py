@@ -0,0 +1,44 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from citizen_portal.images import rendition_name
+
+register = template.Library()
+
+
+@register.filter
+def rendition(image, spec):
+    """
+    URL of a rendition of a complaint photo: ``{{ complaint.image1|rendition:"thumb" }}``
+    (JPEG) or ``"thumb.webp"``. The original until the photos are processed.
+    """
+    if not image:
+        return ''
+    if not getattr(image.instance, 'images_processed', False):
+        return image.url
+    name, _, extension = spec.partition('.')
+    return default_storage.url(rendition_name(image.name, name, extension or 'jpg'))
+
+
+@register.simple_tag
+def rendition_picture(image, spec, alt='', **attributes):
+    """
+    ``<picture>`` of a rendition, WebP with a JPEG fallback once processed:
+    ``{% rendition_picture complaint.image1 "thumb" "Complaint Image 1" %}``.
+    Extra keyword arguments become attributes of the ``<img>`` (``data_full``
+    is written ``data-full``).
+    """
+    if not image:
+        return ''
+    extra = format_html_join('', ' {}="{}"', (
+        (name.replace('_', '-'), value) for name, value in attributes.items()
+    ))
+    img = format_html('<img src="{}" alt="{}" loading="lazy"{}>', rendition(image, spec), alt, extra)
+    if not getattr(image.instance, 'images_processed', False):
+        return img
+    # display: contents keeps the <img> the styled/laid out element
+    return format_html(
+        '<picture style="display: contents"><source srcset="{}" type="image/webp">{}</picture>',
+        rendition(image, f'{spec}.webp'), img,
+    )
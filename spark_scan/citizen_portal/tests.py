@@ -1,3 +1,669 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection, transaction
+from django.template import Context, Template
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from asset.tests import LOCAL_CACHE, seed_assets
+from asset import map_cache
+from asset.models import Asset, AssetChange
+from authentication.models import OTP, Profile
+from spark_scan.testing import QueryBudgetMixin, QueryPlanMixin
+from .models import Complaint, ComplaintIdSequence, ComplaintRollup, Incident, MediaBlob, OPEN_STATUSES, PhotoUpload
+from .storage import media_store
+from . import complaint_ids, images, rollups, search, uploads
+
+
+def seed_complaints(count=300):
+    assets = list(Asset.objects.filter(status='COMMISSIONED').values_list('pk', flat=True))
+    statuses = ['SUBMITTED', 'INSPECTING', 'REPAIRING', 'COMPLETED']
+    severities = ['LOW', 'MEDIUM', 'HIGH']
+    Complaint.objects.bulk_create([
+        Complaint(
+            complaint_id=f'CPN-2025-{number:04d}',
+            asset_id=assets[number % len(assets)],
+            reporter_phone='08000000000',
+            complaint_description=f'Seeded complaint {number}',
+            severity=severities[number % len(severities)],
+            status=statuses[number % len(statuses)],
+        )
+        for number in range(count)
+    ])
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ComplaintQueryPlanTests(QueryPlanMixin, TestCase):
+    """The complaint views must not read the complaint table whole"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_assets()
+        seed_complaints()
+        cls.officer = Profile.objects.create_user('officer', password='x', role='Officer', phone_num='100')
+        cls.complaint = Complaint.objects.create(
+            asset=Asset.objects.filter(status='COMMISSIONED').first(),
+            reporter_phone='08000000001',
+            complaint_description='Sparking pole near the market',
+        )
+
+    def setUp(self):
+        self.client.force_login(self.officer)
+
+    def test_complaint_list(self):
+        for params in [
+            {},
+            {'status': 'SUBMITTED'},
+            {'status': 'COMPLETED', 'severity': 'HIGH'},
+            {'search': 'sparking'},
+        ]:
+            with self.subTest(params=params):
+                self.assertViewNoFullScan(self.client, '/complaint/complaints/', params)
+
+    def test_complaint_list_pages(self):
+        response = self.client.get('/complaint/complaints/', {'status': 'SUBMITTED'})
+        self.assertEqual(len(response.context['complaints']), 50)
+        response = self.assertViewNoFullScan(self.client, '/complaint/complaints/', {
+            'status': 'SUBMITTED', 'after': response.context['next_cursor'],
+        })
+        self.assertViewNoFullScan(self.client, '/complaint/complaints/', {
+            'status': 'SUBMITTED', 'before': response.context['previous_cursor'],
+        })
+
+    def test_status_filter_uses_status_index(self):
+        complaints = Complaint.objects.filter(status='SUBMITTED').order_by('-created_at')
+        self.assertUsesIndex(complaints, 'complaint_status_created_idx')
+
+    def test_newest_first_uses_created_index(self):
+        self.assertUsesIndex(Complaint.objects.order_by('-created_at')[:50], 'complaint_created_idx')
+
+    def test_open_complaints_of_asset_use_asset_status_index(self):
+        complaints = Complaint.objects.filter(asset_id=self.complaint.asset_id, status__in=OPEN_STATUSES)
+        self.assertUsesIndex(complaints.order_by(), 'complaint_asset_status_idx')
+
+    def test_complaint_pages(self):
+        complaint_id = self.complaint.complaint_id
+        for url in [
+            f'/complaint/complaints/{complaint_id}/',
+            f'/complaint/track/{complaint_id}/',
+            f'/complaint/success/{complaint_id}/',
+            f'/complaint/report/{self.complaint.asset_id}/',
+            '/complaint/complaints/trends/',
+        ]:
+            with self.subTest(url=url):
+                self.assertViewNoFullScan(self.client, url)
+
+    def test_incident_pages(self):
+        self.assertViewNoFullScan(self.client, '/complaint/incidents/')
+        self.assertViewNoFullScan(self.client, '/complaint/incidents/', {'status': 'SUBMITTED'})
+        self.assertViewNoFullScan(self.client, f'/complaint/incidents/{self.complaint.incident_id}/')
+
+    def test_filtered_export(self):
+        self.assertViewNoFullScan(self.client, '/complaint/complaints/export/', {'status': 'INSPECTING'})
+        self.assertViewNoFullScan(self.client, '/complaint/complaints/export/', {'search': 'sparking'})
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ComplaintSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_assets(20)
+        cls.officer = Profile.objects.create_user('officer', password='x', role='Officer', phone_num='100')
+        cls.assets = list(Asset.objects.filter(status='COMMISSIONED').order_by('pk'))
+
+    def complaint(self, description, asset=None, **fields):
+        return Complaint.objects.create(
+            asset=asset or self.assets[0], reporter_phone='08000000001', complaint_description=description, **fields,
+        )
+
+    def search(self, query):
+        return search.get_backend().search(query)
+
+    def test_asset_numbers_outrank_free_text(self):
+        target = self.assets[1]
+        mention = self.complaint(f'Same fault as {target.asset_number} last week')
+        on_asset = self.complaint('Cable hanging low', asset=target)
+        self.assertEqual(self.search(target.asset_number), [on_asset.pk, mention.pk])
+        # Every word must match, as a prefix
+        self.assertEqual(self.search('cab hang'), [on_asset.pk])
+        self.assertEqual(self.search('cable sparking'), [])
+
+    def test_reporter_phone_numbers_are_not_indexed(self):
+        self.complaint('Meter tampered', reporter_name='Ada Obi')
+        self.assertEqual(len(self.search('08000000001')), 0)
+        self.assertEqual(len(self.search('Ada')), 1)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT * FROM {search.FTS_TABLE} LIMIT 0')
+            self.assertNotIn('reporter_phone', [column[0] for column in cursor.description])
+
+    def test_the_index_follows_complaint_and_asset_writes(self):
+        complaint = self.complaint('Transformer humming loudly')
+        complaint.complaint_description = 'Transformer smoking'
+        complaint.save()
+        self.assertEqual(self.search('smoking'), [complaint.pk])
+        self.assertEqual(self.search('humming'), [])
+
+        asset = Asset.objects.get(pk=complaint.asset_id)
+        asset.asset_number = 'RENUMBERED-1'
+        asset.save()
+        self.assertEqual(self.search('renumbered'), [complaint.pk])
+
+        complaint.delete()
+        self.assertEqual(self.search('smoking'), [])
+
+    def test_filtered_search_is_ranked_and_paged_in_sql(self):
+        statuses = ['SUBMITTED', 'COMPLETED']
+        Complaint.objects.bulk_create([
+            Complaint(
+                complaint_id=f'CPN-2025-{number:04d}', asset=self.assets[number % len(self.assets)],
+                reporter_phone='08000000000', complaint_description=f'Sparking wire {number}',
+                status=statuses[number % 2],
+            )
+            for number in range(130)
+        ])
+        search.get_backend().rebuild()
+        self.client.force_login(self.officer)
+
+        seen = []
+        params = {'search': 'sparking', 'status': 'COMPLETED'}
+        response = self.client.get('/complaint/complaints/', params)
+        while True:
+            seen.extend(complaint.pk for complaint in response.context['complaints'])
+            if not response.context['next_cursor']:
+                break
+            response = self.client.get('/complaint/complaints/', {**params, 'after': response.context['next_cursor']})
+        # All 65 matches of the status, not those among a global top N
+        expected = Complaint.objects.filter(status='COMPLETED', complaint_description__startswith='Sparking')
+        self.assertEqual(sorted(seen), sorted(expected.values_list('pk', flat=True)))
+
+        previous = self.client.get('/complaint/complaints/', {**params, 'before': response.context['previous_cursor']})
+        self.assertEqual([complaint.pk for complaint in previous.context['complaints']], seen[:50])
+        # A tampered cursor starts over instead of failing
+        response = self.client.get('/complaint/complaints/', {**params, 'after': 'bm90LWpzb24'})
+        self.assertEqual([complaint.pk for complaint in response.context['complaints']], seen[:50])
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ComplaintQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Queries per page stay constant however many complaints there are"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_assets()
+        seed_complaints()
+        cls.officer = Profile.objects.create_user('officer', password='x', role='Officer', phone_num='100')
+        cls.asset = Asset.objects.filter(status='COMMISSIONED').first()
+
+    def test_complaint_list(self):
+        self.client.force_login(self.officer)
+        # Session, user, one page (asset joined), status totals
+        response = self.assertQueryBudget(self.client, '/complaint/complaints/', 4)
+        # The totals are cached until a complaint changes
+        self.assertQueryBudget(self.client, '/complaint/complaints/', 3, {'after': response.context['next_cursor']})
+        self.assertQueryBudget(self.client, '/complaint/complaints/', 3, {'status': 'SUBMITTED', 'severity': 'HIGH'})
+
+    @mock.patch('citizen_portal.views.send_complaint_confirmation_whatsapp')
+    @mock.patch('citizen_portal.views.send_phone_sms')
+    def test_citizen_flow(self, send_phone_sms, send_whatsapp):
+        phone_number = '08012345678'
+        self.assertQueryBudget(self.client, f'/complaint/report/{self.asset.pk}/', 1)
+        self.assertQueryBudget(self.client, f'/complaint/report/{self.asset.pk}/', 5, {'phone_number': phone_number}, 'post')
+        self.assertQueryBudget(self.client, '/complaint/verify-otp/', 1)
+        otp = OTP.objects.get(phone_number=phone_number)
+        self.assertQueryBudget(self.client, '/complaint/verify-otp/', 4, {'otp': otp.phone_otp}, 'post')
+        self.assertQueryBudget(self.client, '/complaint/submit-complaint/', 2)
+        # Includes grouping into an incident: nearby assets, candidate incidents, one write
+        response = self.assertQueryBudget(self.client, '/complaint/submit-complaint/', 13, {
+            'complaint_description': 'Pole leaning after the storm',
+            'severity': 'HIGH',
+        }, 'post')
+        self.assertEqual(response.status_code, 302)
+
+        complaint = Complaint.objects.get(reporter_phone=phone_number)
+        self.assertQueryBudget(self.client, f'/complaint/success/{complaint.complaint_id}/', 1)
+        self.assertQueryBudget(self.client, f'/complaint/track/{complaint.complaint_id}/', 1)
+
+    def test_complaint_str_does_not_load_the_asset(self):
+        complaints = list(Complaint.objects.all()[:20])
+        with self.assertNumQueries(0):
+            [str(complaint) for complaint in complaints]
+
+
+class RollupTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_assets(10)
+        cls.asset = Asset.objects.filter(status='COMMISSIONED', asset_type='POLE').first()
+
+    def rollup_rows(self):
+        return set(ComplaintRollup.objects.filter(count__gt=0).values_list(*rollups.KEY_FIELDS, 'count'))
+
+    def test_editing_the_asset_type_moves_its_rollups(self):
+        for severity in ('LOW', 'HIGH', 'HIGH'):
+            Complaint.objects.create(
+                asset=self.asset, reporter_phone='08000000001', complaint_description='Leaning pole', severity=severity,
+            )
+        self.asset.asset_type = 'TRANSFORMER'
+        self.asset.save()
+
+        moved = self.rollup_rows()
+        self.assertEqual({row[4] for row in moved}, {'TRANSFORMER'})
+        rollups.rebuild()
+        self.assertEqual(moved, self.rollup_rows())
+
+    def test_stale_copies_apply_a_transition_once(self):
+        complaint = Complaint.objects.create(
+            asset=self.asset, reporter_phone='08000000001', complaint_description='Leaning pole', severity='HIGH',
+        )
+        first, second = Complaint.objects.get(pk=complaint.pk), Complaint.objects.get(pk=complaint.pk)
+        for copy in (first, second):
+            copy.status = 'COMPLETED'
+            copy.save()
+
+        self.assertEqual(Asset.objects.get(pk=self.asset.pk).open_complaints, 0)
+        rows = self.rollup_rows()
+        rollups.rebuild()
+        self.assertEqual(rows, self.rollup_rows())
+
+
+class MediaStoreTests(TestCase):
+    """Identical photos are stored once and collected when unreferenced"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_assets(10)
+        cls.asset = Asset.objects.filter(status='COMMISSIONED').first()
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        # Placeholder bytes, not photos: processing is ComplaintImageTests'
+        schedule = mock.patch.object(images, 'schedule')
+        schedule.start()
+        self.addCleanup(schedule.stop)
+        self.addCleanup(media.disable)
+
+    def complaint(self, filename, content=b'same photo'):
+        return Complaint.objects.create(
+            asset=self.asset,
+            reporter_phone='08000000001',
+            complaint_description='Broken meter',
+            image1=SimpleUploadedFile(filename, content, 'image/jpeg'),
+        )
+
+    def test_identical_uploads_share_one_blob(self):
+        first, second = self.complaint('botman.jpg'), self.complaint('botman.jpg')
+        other = self.complaint('cake_tile.jpg', b'another photo')
+        self.assertEqual(first.image1.name, second.image1.name)
+        self.assertNotEqual(first.image1.name, other.image1.name)
+        self.assertTrue(media_store.exists(first.image1.name))
+        self.assertEqual(MediaBlob.objects.get(name=first.image1.name).refcount, 2)
+
+    def test_garbage_collection(self):
+        kept, released = self.complaint('kept.jpg'), self.complaint('released.jpg', b'released photo')
+        media_store.delete(released.image1.name)
+        # Still within the grace period
+        self.assertEqual(media_store.collect_garbage(), [])
+        self.assertEqual(media_store.collect_garbage(grace=timedelta(0)), [released.image1.name])
+        self.assertFalse(media_store.exists(released.image1.name))
+        self.assertTrue(media_store.exists(kept.image1.name))
+        self.assertFalse(MediaBlob.objects.filter(name=released.image1.name).exists())
+
+    def test_replacing_a_photo_releases_the_old_blob(self):
+        shared = self.complaint('shared.jpg').image1.name
+        complaint = self.complaint('shared.jpg')
+        complaint.image1 = SimpleUploadedFile('new.jpg', b'new photo', 'image/jpeg')
+        with self.captureOnCommitCallbacks(execute=True):
+            complaint.save()
+        self.assertEqual(MediaBlob.objects.get(name=shared).refcount, 1)
+        self.assertEqual(MediaBlob.objects.get(name=complaint.image1.name).refcount, 1)
+
+        # Saving again releases nothing more; clearing a loaded complaint's photo releases it
+        with self.captureOnCommitCallbacks(execute=True):
+            complaint.save()
+        loaded = Complaint.objects.get(pk=complaint.pk)
+        loaded.image1 = None
+        with self.captureOnCommitCallbacks(execute=True):
+            loaded.save()
+        self.assertEqual(MediaBlob.objects.get(name=shared).refcount, 1)
+        self.assertEqual(MediaBlob.objects.get(name=complaint.image1.name).refcount, 0)
+
+
+@override_settings(COMPLAINT_IMAGE_WORKERS=0)
+class ComplaintImageTests(TestCase):
+    """Photos are cleaned and rendered once the complaint commits (inline here, no worker pool)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_assets(10)
+        cls.asset = Asset.objects.filter(status='COMMISSIONED').first()
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def photo(self):
+        """A landscape camera JPEG that EXIF says to show rotated"""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        buffer = BytesIO()
+        Image.new('RGB', (3000, 1500), 'orange').save(buffer, 'JPEG', exif=exif)
+        return SimpleUploadedFile('camera.jpg', buffer.getvalue(), 'image/jpeg')
+
+    def test_renditions_are_written_and_served_by_the_filter(self):
+        template = Template('{% load complaint_images %}{{ complaint.image1|rendition:"thumb.webp" }}')
+        with self.captureOnCommitCallbacks(execute=True):
+            complaint = Complaint.objects.create(
+                asset=self.asset, reporter_phone='08000000001',
+                complaint_description='Meter box hanging open', image1=self.photo(),
+            )
+            # Not processed yet: the original
+            self.assertEqual(template.render(Context({'complaint': complaint})), complaint.image1.url)
+
+        complaint.refresh_from_db()
+        self.assertTrue(complaint.images_processed)
+        with media_store.open(complaint.image1.name) as original:
+            image = Image.open(original)
+            self.assertEqual(image.size, (1024, 2048))
+            self.assertNotIn(0x0112, image.getexif())
+        for name in images.rendition_names(complaint.image1.name):
+            self.assertTrue(default_storage.exists(name), name)
+
+        url = template.render(Context({'complaint': complaint}))
+        self.assertEqual(url, default_storage.url(images.rendition_name(complaint.image1.name, 'thumb', 'webp')))
+        with default_storage.open(images.rendition_name(complaint.image1.name, 'thumb', 'webp')) as thumb:
+            self.assertEqual(Image.open(thumb).size, (160, 320))
+
+    def test_a_webp_upload_is_stored_as_the_jpeg_it_becomes(self):
+        buffer = BytesIO()
+        Image.new('RGB', (400, 300), 'blue').save(buffer, 'WEBP')
+        with self.captureOnCommitCallbacks(execute=True):
+            complaint = Complaint.objects.create(
+                asset=self.asset, reporter_phone='08000000001', complaint_description='Cable down on road',
+                image1=SimpleUploadedFile('phone.webp', buffer.getvalue(), 'image/webp'),
+            )
+        complaint.refresh_from_db()
+        self.assertTrue(complaint.image1.name.endswith('.jpg'), complaint.image1.name)
+        with media_store.open(complaint.image1.name) as original:
+            self.assertEqual(Image.open(original).format, 'JPEG')
+
+    def test_a_replaced_photo_is_processed_again(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            complaint = Complaint.objects.create(
+                asset=self.asset, reporter_phone='08000000001',
+                complaint_description='Meter box hanging open', image1=self.photo(),
+            )
+        complaint = Complaint.objects.get(pk=complaint.pk)
+        self.assertTrue(complaint.images_processed)
+
+        buffer = BytesIO()
+        Image.new('RGB', (600, 400), 'green').save(buffer, 'JPEG')
+        complaint.image2 = SimpleUploadedFile('second.jpg', buffer.getvalue(), 'image/jpeg')
+        with mock.patch.object(images, 'process_complaint') as process:
+            with self.captureOnCommitCallbacks(execute=True):
+                complaint.save()
+        process.assert_called_once_with(complaint.pk)
+        self.assertFalse(Complaint.objects.get(pk=complaint.pk).images_processed)
+
+        # Any other edit leaves the photos alone
+        complaint = Complaint.objects.get(pk=complaint.pk)
+        complaint.complaint_description = 'Meter box hanging open, door missing'
+        with mock.patch.object(images, 'schedule') as schedule:
+            complaint.save()
+        schedule.assert_not_called()
+
+
+@override_settings(CACHES=LOCAL_CACHE, COMPLAINT_ID_BLOCK_SIZE=1)
+class ComplaintIdTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_assets(5)
+        cls.asset = Asset.objects.filter(status='COMMISSIONED').first()
+
+    def complaint(self):
+        return Complaint.objects.create(
+            asset=self.asset, reporter_phone='08000000001', complaint_description='Leaning pole',
+        )
+
+    def test_the_first_complaint_of_a_year_seeds_its_sequence(self):
+        self.assertEqual(complaint_ids.next_complaint_id(2031), 'CPN-2031-0001')
+        self.assertEqual(ComplaintIdSequence.objects.get(year=2031).last_value, 1)
+
+    def test_each_year_has_its_own_numbers(self):
+        ComplaintIdSequence.objects.create(year=2030, last_value=57)
+        self.assertEqual(complaint_ids.next_complaint_id(2031), 'CPN-2031-0001')
+        self.assertEqual(complaint_ids.next_complaint_id(2030), 'CPN-2030-0058')
+        self.assertEqual(complaint_ids.next_complaint_id(2031), 'CPN-2031-0002')
+
+    def test_a_failed_submission_gives_its_number_back(self):
+        first = self.complaint()
+        complaint = Complaint(asset=self.asset, reporter_phone='08000000001', complaint_description='Leaning pole')
+        with mock.patch.object(Asset, 'adjust_complaint_counters', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                complaint.save()
+        self.assertEqual(complaint.complaint_id, '')
+
+        number = int(first.complaint_id.rsplit('-', 1)[1])
+        self.assertEqual(self.complaint().complaint_id.rsplit('-', 1)[1], f'{number + 1:04d}')
+
+
+@override_settings(COMPLAINT_ID_BLOCK_SIZE=10)
+class ComplaintIdBlockTests(TransactionTestCase):
+    """Blocks are reserved outside transactions, so this needs real commits"""
+
+    def setUp(self):
+        blocks = mock.patch.dict(complaint_ids._blocks, clear=True)
+        blocks.start()
+        self.addCleanup(blocks.stop)
+
+    def test_numbers_come_from_a_reserved_block(self):
+        numbers = [complaint_ids.next_complaint_id(2031) for _ in range(11)]
+        self.assertEqual(numbers[0], 'CPN-2031-0001')
+        self.assertEqual(numbers[-1], 'CPN-2031-0011')
+        # Two counter writes for eleven numbers
+        self.assertEqual(ComplaintIdSequence.objects.get(year=2031).last_value, 20)
+
+    def test_no_block_is_reserved_inside_a_transaction(self):
+        with transaction.atomic():
+            self.assertEqual(complaint_ids.next_complaint_id(2031), 'CPN-2031-0001')
+        self.assertEqual(ComplaintIdSequence.objects.get(year=2031).last_value, 1)
+        self.assertEqual(complaint_ids._blocks, {})
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class IncidentTests(TestCase):
+    """Duplicate reports are grouped as they are saved and resolved together"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_assets()
+        cls.asset = Asset.objects.filter(status='COMMISSIONED', latitude__isnull=False).first()
+        cls.operator = Profile.objects.create_user('operator', password='x', role='Operator', phone_num='200')
+
+    def complaint(self, description, asset=None):
+        return Complaint.objects.create(
+            asset=asset or self.asset, reporter_phone='08000000001', complaint_description=description,
+        )
+
+    def test_similar_reports_share_an_incident(self):
+        first = self.complaint('The pole is sparking and smoking')
+        second = self.complaint('sparking pole, smoke everywhere')
+        unrelated = self.complaint('Street light not working at night')
+        self.assertEqual(first.incident_id, second.incident_id)
+        self.assertNotEqual(first.incident_id, unrelated.incident_id)
+        self.assertEqual(Incident.objects.get(pk=first.incident_id).complaint_count, 2)
+
+    def test_grouping_cost_does_not_grow_with_the_incident(self):
+        self.complaint('The pole is sparking and smoking')
+        with CaptureQueriesContext(connection) as small:
+            self.complaint('The pole is sparking and smoking again')
+        for _ in range(20):
+            self.complaint('The pole is sparking and smoking')
+        with CaptureQueriesContext(connection) as large:
+            self.complaint('The pole is sparking and smoking again')
+        self.assertEqual(len(small), len(large))
+
+    def test_resolve_fans_out(self):
+        complaints = [self.complaint('The pole is sparking and smoking') for _ in range(3)]
+        incident = Incident.objects.get(pk=complaints[0].incident_id)
+        open_before = Asset.objects.get(pk=self.asset.pk).open_complaints
+
+        version = map_cache.get_version()
+        changes = AssetChange.objects.filter(asset_id=self.asset.pk).count()
+
+        self.client.force_login(self.operator)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/complaint/incidents/{incident.pk}/', {
+                'status': 'COMPLETED',
+                'resolution_notes': 'Replaced the burnt cable and retested the pole.',
+            })
+        self.assertEqual(response.status_code, 302)
+        # The bulk update still moves the map and the delta sync feed on
+        self.assertNotEqual(map_cache.get_version(), version)
+        self.assertEqual(AssetChange.objects.filter(asset_id=self.asset.pk).count(), changes + 1)
+        self.assertEqual(
+            set(Complaint.objects.filter(incident=incident).values_list('status', 'resolved_by')),
+            {('COMPLETED', 'operator')},
+        )
+        self.assertEqual(Asset.objects.get(pk=self.asset.pk).open_complaints, open_before - 3)
+        self.assertEqual(rollups.status_totals()['COMPLETED'], 3)
+
+    def test_resolving_the_last_open_complaint_resolves_the_incident(self):
+        first, second = [self.complaint('The pole is sparking and smoking') for _ in range(2)]
+        self.client.force_login(self.operator)
+
+        def resolve(complaint, status):
+            return self.client.post(f'/complaint/complaints/{complaint.complaint_id}/resolve/', {
+                'status': status, 'resolution_notes': 'Replaced the burnt cable and retested the pole.',
+            })
+
+        resolve(first, 'COMPLETED')
+        self.assertEqual(Incident.objects.get(pk=first.incident_id).status, 'SUBMITTED')
+        resolve(second, 'COMPLETED')
+        incident = Incident.objects.get(pk=first.incident_id)
+        self.assertEqual((incident.status, incident.resolved_by), ('COMPLETED', 'operator'))
+
+        # Reopened when one of its complaints is
+        second.status = 'REPAIRING'
+        second.save()
+        incident.refresh_from_db()
+        self.assertEqual((incident.status, incident.resolved_at), ('REPAIRING', None))
+
+
+class PhotoUploadTests(TestCase):
+    """A photo sent in chunks survives a dropped chunk and is used by the complaint form"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_assets(10)
+        cls.asset = Asset.objects.filter(status='COMMISSIONED').first()
+        photo = BytesIO()
+        Image.effect_noise((400, 300), 60).convert('RGB').save(photo, 'JPEG')
+        cls.photo = photo.getvalue()
+
+    def setUp(self):
+        for setting in ('MEDIA_ROOT', 'COMPLAINT_UPLOAD_DIR'):
+            directory = tempfile.mkdtemp()
+            self.addCleanup(shutil.rmtree, directory)
+            override = override_settings(**{setting: directory})
+            override.enable()
+            self.addCleanup(override.disable)
+        override = override_settings(COMPLAINT_UPLOAD_CHUNK_BYTES=16 * 1024)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        session = self.client.session
+        session.update({'complaint_phone': '08012345678', 'complaint_asset_id': self.asset.pk, 'otp_verified': True})
+        session.save()
+
+    def put_chunk(self, url, start, end):
+        return self.client.put(
+            url, self.photo[start:end + 1], content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{len(self.photo)}',
+        )
+
+    def test_resume_and_submit(self):
+        response = self.client.post('/complaint/uploads/', {'filename': 'IMG_1.jpg', 'size': len(self.photo)})
+        self.assertEqual(response.status_code, 201)
+        upload = response.json()
+        url = f"/complaint/uploads/{upload['upload_id']}/"
+        chunk_size = upload['chunk_size']
+
+        self.put_chunk(url, 0, chunk_size - 1)
+        # The second chunk was lost, the third is refused with where to resume
+        response = self.put_chunk(url, 2 * chunk_size, 3 * chunk_size - 1)
+        self.assertEqual(response.status_code, 409)
+        received = self.client.get(url).json()['received']
+        self.assertEqual(received, chunk_size)
+
+        while received < len(self.photo):
+            received = self.put_chunk(url, received, min(received + chunk_size, len(self.photo)) - 1).json()['received']
+        self.assertTrue(self.client.post(f'{url}complete/').json()['complete'])
+
+        with mock.patch('citizen_portal.views.send_complaint_confirmation_whatsapp'):
+            response = self.client.post('/complaint/submit-complaint/', {
+                'complaint_description': 'Pole sparking near the market',
+                'severity': 'HIGH',
+                'image1_upload': upload['upload_id'],
+            })
+        self.assertEqual(response.status_code, 302)
+        complaint = Complaint.objects.get(reporter_phone='08012345678')
+        with complaint.image1.open('rb') as stored:
+            self.assertEqual(stored.read(), self.photo)
+        self.assertFalse(PhotoUpload.objects.exists())
+
+    def test_uploads_belong_to_the_session(self):
+        upload_id = self.client.post('/complaint/uploads/', {'filename': 'IMG_1.jpg', 'size': 10}).json()['upload_id']
+        other = self.client_class()
+        self.assertEqual(other.get(f'/complaint/uploads/{upload_id}/').status_code, 403)
+        session = other.session
+        session.update({'complaint_phone': '08099999999', 'otp_verified': True})
+        session.save()
+        self.assertEqual(other.get(f'/complaint/uploads/{upload_id}/').status_code, 404)
+
+    @override_settings(COMPLAINT_UPLOAD_MAX_OPEN=2)
+    def test_open_uploads_are_capped_per_reporter(self):
+        def start():
+            return self.client.post('/complaint/uploads/', {'filename': 'IMG_1.jpg', 'size': 10})
+
+        expiring = start().json()['upload_id']
+        self.assertEqual(start().status_code, 201)
+        self.assertEqual(start().status_code, 400)
+
+        # An expired upload no longer counts, and is gone once a new one starts
+        PhotoUpload.objects.filter(pk=expiring).update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(self.client.get(f'/complaint/uploads/{expiring}/').status_code, 404)
+        self.assertEqual(start().status_code, 201)
+        self.assertFalse(PhotoUpload.objects.filter(pk=expiring).exists())
+        self.assertFalse(os.path.exists(uploads.upload_directory(expiring)))
+
+    def test_an_invalid_report_opens_no_upload(self):
+        upload = self.client.post('/complaint/uploads/', {'filename': 'IMG_1.jpg', 'size': len(self.photo)}).json()
+        url = f"/complaint/uploads/{upload['upload_id']}/"
+        for start in range(0, len(self.photo), upload['chunk_size']):
+            self.put_chunk(url, start, min(start + upload['chunk_size'], len(self.photo)) - 1)
+        self.client.post(f'{url}complete/')
+
+        with mock.patch.object(uploads, 'open_upload', wraps=uploads.open_upload) as opened:
+            response = self.client.post('/complaint/submit-complaint/', {
+                'complaint_description': '', 'severity': 'HIGH', 'image1_upload': upload['upload_id'],
+            })
+        self.assertEqual(response.status_code, 200)
+        opened.assert_not_called()
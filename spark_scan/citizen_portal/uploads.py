@@ -0,0 +1,238 @@
+"""
+Resumable, chunked upload of complaint photos.
+
+Instead of sending a multi-megabyte photo with the complaint form, the
+report page uploads it in steps, each a short request:
+
+1. create: declared filename and size, returns an upload id,
+2. chunks: PUTs with ``Content-Range: bytes <start>-<end>/<size>``, each
+   starting at ``received``, the number of bytes stored so far,
+3. complete: the chunks are assembled into one file, checked to be an
+   image, and the upload can be referenced by the complaint form.
+
+A dropped connection loses only the chunk in flight: the client asks for
+the upload's status and continues at ``received``. Chunks wait on disk
+under COMPLAINT_UPLOAD_DIR/<upload id>/, named by their start offset.
+Uploads expire COMPLAINT_UPLOAD_EXPIRY_HOURS after their last chunk and
+are removed by cleanup_photo_uploads; used ones are removed as soon as
+their complaint is saved. A reporter has at most COMPLAINT_UPLOAD_MAX_OPEN
+unexpired uploads at a time, so a session cannot fill the chunk directory.
+"""
+import os
+import re
+import shutil
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+from PIL import Image, UnidentifiedImageError
+
+from .models import PhotoUpload
+
+ALLOWED_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+ASSEMBLED_NAME = 'assembled'
+
+# Read size when streaming a chunk to disk
+COPY_BUFFER_BYTES = 64 * 1024
+
+
+class ChunkOffsetError(ValueError):
+    """A chunk that does not start where the upload stands"""
+
+    def __init__(self, received):
+        super().__init__(f'Chunk must start at byte {received}.')
+        self.received = received
+
+
+def upload_directory(upload_id):
+    return os.path.join(settings.COMPLAINT_UPLOAD_DIR, str(upload_id))
+
+
+def assembled_path(upload_id):
+    return os.path.join(upload_directory(upload_id), ASSEMBLED_NAME)
+
+
+def _expiry():
+    return timezone.now() + timedelta(hours=settings.COMPLAINT_UPLOAD_EXPIRY_HOURS)
+
+
+def describe(upload):
+    """JSON status of an upload, what the client resumes from"""
+    return {
+        'success': True,
+        'upload_id': str(upload.pk),
+        'size': upload.size,
+        'received': upload.received,
+        'complete': upload.completed,
+        'chunk_size': settings.COMPLAINT_UPLOAD_CHUNK_BYTES,
+    }
+
+
+def live_uploads(reporter_phone, now=None):
+    """Unexpired uploads of a reporter"""
+    return PhotoUpload.objects.filter(reporter_phone=reporter_phone, expires_at__gte=now or timezone.now())
+
+
+def create(reporter_phone, filename, size):
+    """Start an upload of a photo of size bytes"""
+    filename = os.path.basename(filename or '')[:100]
+    if not filename.lower().endswith(ALLOWED_EXTENSIONS):
+        raise ValueError('Only JPEG and PNG photos can be uploaded.')
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise ValueError('size must be the number of bytes of the photo.')
+    if not 0 < size <= settings.COMPLAINT_UPLOAD_MAX_BYTES:
+        raise ValueError(f'Photos must be at most {settings.COMPLAINT_UPLOAD_MAX_BYTES // (1024 * 1024)} MB.')
+
+    now = timezone.now()
+    for expired in PhotoUpload.objects.filter(reporter_phone=reporter_phone, expires_at__lt=now).only('pk'):
+        discard(expired)
+    if live_uploads(reporter_phone, now).count() >= settings.COMPLAINT_UPLOAD_MAX_OPEN:
+        raise ValueError('Too many photo uploads in progress, please finish or restart the report.')
+
+    upload = PhotoUpload.objects.create(
+        reporter_phone=reporter_phone, filename=filename, size=size, expires_at=_expiry(),
+    )
+    os.makedirs(upload_directory(upload.pk), exist_ok=True)
+    return upload
+
+
+def parse_content_range(header):
+    """(start, end, total) of a ``bytes start-end/total`` header, end inclusive"""
+    match = CONTENT_RANGE.match((header or '').strip())
+    if not match:
+        raise ValueError('Content-Range must be "bytes <start>-<end>/<size>".')
+    start, end, total = map(int, match.groups())
+    if end < start:
+        raise ValueError('Content-Range end is before its start.')
+    return start, end, total
+
+
+def write_chunk(upload, content_range, stream):
+    """
+    Store the chunk read from stream (e.g. the request) at its range.
+    Returns the new ``received``. A chunk already stored is accepted again
+    without being written; one that does not start at ``received`` raises
+    ChunkOffsetError.
+    """
+    start, end, total = parse_content_range(content_range)
+    length = end - start + 1
+    if upload.completed:
+        raise ValueError('This upload is already complete.')
+    if total != upload.size or end >= upload.size:
+        raise ValueError(f'Content-Range is outside the {upload.size} byte upload.')
+    if length > settings.COMPLAINT_UPLOAD_CHUNK_BYTES:
+        raise ValueError(f'Chunks must be at most {settings.COMPLAINT_UPLOAD_CHUNK_BYTES} bytes.')
+    if end < upload.received:
+        # Resent after its response was lost
+        return upload.received
+    if start != upload.received:
+        raise ChunkOffsetError(upload.received)
+
+    directory = upload_directory(upload.pk)
+    os.makedirs(directory, exist_ok=True)
+    temporary = os.path.join(directory, f'.{uuid.uuid4().hex}')
+    try:
+        with open(temporary, 'wb') as destination:
+            remaining = length
+            while remaining:
+                data = stream.read(min(remaining, COPY_BUFFER_BYTES))
+                if not data:
+                    raise ValueError(f'Chunk is shorter than its Content-Range ({length} bytes).')
+                destination.write(data)
+                remaining -= len(data)
+        os.replace(temporary, os.path.join(directory, f'{start:012d}'))
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+    # Only from the offset this chunk was checked against: of two clients
+    # racing with the same chunk, one moves the upload on
+    advanced = PhotoUpload.objects.filter(pk=upload.pk, received=start, completed=False).update(
+        received=end + 1, expires_at=_expiry(),
+    )
+    if not advanced:
+        upload.refresh_from_db(fields=['received'])
+        if upload.received > end:
+            return upload.received
+        raise ChunkOffsetError(upload.received)
+    upload.received = end + 1
+    return upload.received
+
+
+def _chunk_names(directory):
+    return sorted(name for name in os.listdir(directory) if name.isdigit())
+
+
+def complete(upload):
+    """Assemble the chunks of a fully received upload into one checked image"""
+    if upload.completed:
+        return upload
+    if upload.received != upload.size:
+        raise ValueError(f'Only {upload.received} of {upload.size} bytes were received.')
+
+    directory = upload_directory(upload.pk)
+    path = assembled_path(upload.pk)
+    with open(path, 'wb') as destination:
+        for name in _chunk_names(directory):
+            with open(os.path.join(directory, name), 'rb') as chunk:
+                shutil.copyfileobj(chunk, destination, COPY_BUFFER_BYTES)
+    if os.path.getsize(path) != upload.size:
+        discard(upload)
+        raise ValueError('The uploaded chunks do not add up to the photo, please upload it again.')
+
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        discard(upload)
+        raise ValueError('The uploaded file is not a valid image.')
+
+    for name in _chunk_names(directory):
+        os.remove(os.path.join(directory, name))
+    PhotoUpload.objects.filter(pk=upload.pk).update(completed=True, expires_at=_expiry())
+    upload.completed = True
+    return upload
+
+
+def completed_upload(upload_id, reporter_phone):
+    """The complete upload with this id of this reporter, or None"""
+    upload = live_uploads(reporter_phone).filter(pk=upload_id, completed=True).first()
+    if upload is None or not os.path.exists(assembled_path(upload.pk)):
+        return None
+    return upload
+
+
+def open_upload(upload):
+    """The assembled photo as a File to assign to an ImageField"""
+    return File(open(assembled_path(upload.pk), 'rb'), name=upload.filename)
+
+
+def discard(upload):
+    shutil.rmtree(upload_directory(upload.pk), ignore_errors=True)
+    PhotoUpload.objects.filter(pk=upload.pk).delete()
+
+
+def cleanup_expired(now=None):
+    """Remove expired uploads and upload directories without a row, returns the count"""
+    now = now or timezone.now()
+    removed = 0
+    for upload in PhotoUpload.objects.filter(expires_at__lt=now).only('pk').iterator():
+        discard(upload)
+        removed += 1
+
+    if os.path.isdir(settings.COMPLAINT_UPLOAD_DIR):
+        cutoff = (now - timedelta(hours=settings.COMPLAINT_UPLOAD_EXPIRY_HOURS)).timestamp()
+        known = {str(pk) for pk in PhotoUpload.objects.values_list('pk', flat=True)}
+        for name in os.listdir(settings.COMPLAINT_UPLOAD_DIR):
+            path = os.path.join(settings.COMPLAINT_UPLOAD_DIR, name)
+            if name not in known and os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+    return removed
@@ -14,6 +14,11 @@ urlpatterns = [
     # Step 3: Complaint Form
     path('submit-complaint/', views.SubmitComplaintView.as_view(), name='submit_complaint'),
     
+    # Resumable chunked photo upload used by the complaint form
+    path('uploads/', views.PhotoUploadView.as_view(), name='photo_upload'),
+    path('uploads/<uuid:upload_id>/', views.PhotoUploadChunkView.as_view(), name='photo_upload_chunk'),
+    path('uploads/<uuid:upload_id>/complete/', views.PhotoUploadCompleteView.as_view(), name='photo_upload_complete'),
+    
     # Success Page
     path('success/<str:complaint_id>/', views.ComplaintSuccessView.as_view(), name='complaint_success'),
     
@@ -24,6 +29,18 @@ urlpatterns = [
     # Complaint List (Officers & Operators)
     path('complaints/', views.ComplaintListView.as_view(), name='complaint_list'),
     
+    # Streaming CSV/NDJSON export with the list filters (Officers & Operators)
+    path('complaints/export/', views.ComplaintExportView.as_view(), name='complaint_export'),
+    
+    # Duplicate complaints grouped into incidents (Officers & Operators)
+    path('incidents/', views.IncidentListView.as_view(), name='incident_list'),
+    
+    # Incident with its complaints, resolved at once (Operators)
+    path('incidents/<int:incident_id>/', views.IncidentDetailView.as_view(), name='incident_detail'),
+    
+    # Complaint trends over a date range (JSON, from rollups)
+    path('complaints/trends/', views.ComplaintTrendView.as_view(), name='complaint_trends'),
+    
     # View Complaint Details (All authenticated users)
     path('complaints/<str:complaint_id>/', views.ComplaintDetailView.as_view(), name='complaint_detail'),
     
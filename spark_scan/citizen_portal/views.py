@@ -5,13 +5,19 @@ from django.utils import timezone
 from django.urls import reverse
 from django.http import JsonResponse
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db import models
+from django.utils.decorators import method_decorator
+from django.utils.dateparse import parse_date
+from datetime import datetime, time, timedelta
 import threading
 
-from .models import Complaint
-from .forms import PhoneNumberForm, OTPVerificationForm, ComplaintForm, ComplaintResolutionForm
+from .models import Complaint, Incident, RollupGranularity
+from . import incidents, listing, rollups, search, uploads
+from .forms import PhoneNumberForm, OTPVerificationForm, ComplaintForm, ComplaintResolutionForm, IncidentResolutionForm
 from asset.models import Asset
+from asset.map_data import status_totals
+from spark_scan import exports
 from authentication.models import OTP
+from authentication.permissions import permission_roles
 from authentication.utility import generate_otp, send_phone_sms, send_complaint_confirmation_whatsapp
 
 
@@ -173,7 +179,7 @@ class SubmitComplaintView(View):
         asset_id = request.session.get('complaint_asset_id')
         asset = get_object_or_404(Asset, id=asset_id)
         
-        form = self.form_class(request.POST, request.FILES)
+        form = self.form_class(request.POST, request.FILES, reporter_phone=phone_number)
         
         if form.is_valid():
             complaint = form.save(commit=False)
@@ -181,6 +187,9 @@ class SubmitComplaintView(View):
             complaint.reporter_phone = phone_number
             complaint.save()
             
+            # Photos sent through the chunked upload are stored with the complaint now
+            form.release_uploads()
+            
             # Generate tracking URL
             tracking_url = request.build_absolute_uri(
                 reverse('citizen_portal:track_complaint', args=[complaint.complaint_id])
@@ -209,12 +218,90 @@ class SubmitComplaintView(View):
         return render(request, self.template_name, context)
 
 
+def _verified_phone(request):
+    """Reporter number of a report whose OTP is verified (step 3), else None"""
+    if request.session.get('complaint_phone') and request.session.get('otp_verified'):
+        return request.session['complaint_phone']
+    return None
+
+
+class PhotoUploadView(View):
+    """Start a resumable chunked photo upload (JSON), see citizen_portal.uploads"""
+    
+    def post(self, request):
+        phone_number = _verified_phone(request)
+        if phone_number is None:
+            return JsonResponse({
+                'success': False,
+                'message': 'Session expired. Please start again.'
+            }, status=403)
+        
+        try:
+            upload = uploads.create(phone_number, request.POST.get('filename'), request.POST.get('size'))
+        except ValueError as e:
+            return JsonResponse({
+                'success': False,
+                'message': str(e)
+            }, status=400)
+        return JsonResponse(uploads.describe(upload), status=201)
+
+
+class PhotoUploadChunkView(View):
+    """Status of an upload (GET, to resume) and its chunks (PUT with Content-Range)"""
+    
+    def dispatch(self, request, *args, **kwargs):
+        phone_number = _verified_phone(request)
+        if phone_number is None:
+            return JsonResponse({
+                'success': False,
+                'message': 'Session expired. Please start again.'
+            }, status=403)
+        self.upload = get_object_or_404(uploads.live_uploads(phone_number), pk=kwargs['upload_id'])
+        return super().dispatch(request, *args, **kwargs)
+    
+    def get(self, request, upload_id):
+        return JsonResponse(uploads.describe(self.upload))
+    
+    def put(self, request, upload_id):
+        try:
+            uploads.write_chunk(self.upload, request.headers.get('Content-Range'), request)
+        except uploads.ChunkOffsetError as e:
+            # The client resumes from the received offset in the answer
+            return JsonResponse({
+                **uploads.describe(self.upload),
+                'success': False,
+                'message': str(e),
+                'received': e.received,
+            }, status=409)
+        except ValueError as e:
+            return JsonResponse({
+                'success': False,
+                'message': str(e)
+            }, status=400)
+        return JsonResponse(uploads.describe(self.upload))
+
+
+class PhotoUploadCompleteView(PhotoUploadChunkView):
+    """Assemble a fully received upload into the photo (POST)"""
+    http_method_names = ['post']
+    
+    def post(self, request, upload_id):
+        try:
+            uploads.complete(self.upload)
+        except ValueError as e:
+            return JsonResponse({
+                'success': False,
+                'message': str(e)
+            }, status=400)
+        return JsonResponse(uploads.describe(self.upload))
+
+
 class ComplaintSuccessView(View):
     """Success page after complaint submission"""
     template_name = 'citizen_portal/complaint_success.html'
     
     def get(self, request, complaint_id):
-        complaint = get_object_or_404(Complaint, complaint_id=complaint_id)
+        complaint = get_object_or_404(Complaint.objects.select_related('asset'), complaint_id=complaint_id)
         
         tracking_url = request.build_absolute_uri(
             reverse('citizen_portal:track_complaint', args=[complaint.complaint_id])
@@ -232,7 +319,7 @@ class TrackComplaintView(View):
     template_name = 'citizen_portal/track_complaint.html'
     
     def get(self, request, complaint_id):
-        complaint = get_object_or_404(Complaint, complaint_id=complaint_id)
+        complaint = get_object_or_404(Complaint.objects.select_related('asset'), complaint_id=complaint_id)
         
         # Calculate progress percentage
         status_progress = {
@@ -258,33 +345,40 @@ class ComplaintListView(LoginRequiredMixin, View):
     template_name = 'citizen_portal/complaint_list.html'
     
     def get(self, request):
-        complaints = Complaint.objects.select_related('asset').all()
+        complaints = Complaint.objects.select_related('asset', 'incident').all()
         
         # Filter options
-        status_filter = request.GET.get('status', '')
-        severity_filter = request.GET.get('severity', '')
-        search_query = request.GET.get('search', '')
-        
-        if status_filter:
-            complaints = complaints.filter(status=status_filter)
+        filters = listing.filters_from_request(request.GET)
+        status_filter = filters['status']
+        severity_filter = filters['severity']
+        search_query = filters['search']
         
-        if severity_filter:
-            complaints = complaints.filter(severity=severity_filter)
+        complaints = listing.filter_complaints(complaints, status_filter, severity_filter)
         
+        after, before = request.GET.get('after'), request.GET.get('before')
         if search_query:
-            complaints = complaints.filter(
-                models.Q(complaint_id__icontains=search_query) |
-                models.Q(asset__asset_number__icontains=search_query) |
-                models.Q(reporter_phone__icontains=search_query)
-            )
-        
-        # Get statistics
+            # Full-text matches among the filtered complaints, best first,
+            # ranked and paged in SQL
+            ranked = search.get_backend().rank_queryset(complaints, search_query)
+            page = listing.paginate_search(ranked, after=after, before=before)
+        else:
+            page = listing.paginate(complaints, after=after, before=before)
+        complaints = page['complaints']
+        next_cursor, previous_cursor = page['next_cursor'], page['previous_cursor']
+        
+        # Filters carried over to the page links
+        query = request.GET.copy()
+        for key in ('after', 'before'):
+            query.pop(key, None)
+        
+        # Get statistics (rollup totals, cached until a complaint changes)
+        totals = status_totals()
         stats = {
-            'total': Complaint.objects.count(),
-            'submitted': Complaint.objects.filter(status='SUBMITTED').count(),
-            'inspecting': Complaint.objects.filter(status='INSPECTING').count(),
-            'repairing': Complaint.objects.filter(status='REPAIRING').count(),
-            'completed': Complaint.objects.filter(status='COMPLETED').count(),
+            'total': sum(totals.values()),
+            'submitted': totals['SUBMITTED'],
+            'inspecting': totals['INSPECTING'],
+            'repairing': totals['REPAIRING'],
+            'completed': totals['COMPLETED'],
         }
         
         context = {
@@ -294,16 +388,79 @@ class ComplaintListView(LoginRequiredMixin, View):
             'status_filter': status_filter,
             'severity_filter': severity_filter,
             'search_query': search_query,
+            'next_cursor': next_cursor,
+            'previous_cursor': previous_cursor,
+            'page_query': query.urlencode(),
         }
         return render(request, self.template_name, context)
 
 
+@method_decorator(permission_roles(roles=['Officer', 'Operator']), name='dispatch')
+class ComplaintExportView(View):
+    """Stream the filtered complaints (with their asset) as CSV or NDJSON"""
+    
+    def get(self, request):
+        try:
+            export_format = exports.parse_format(request.GET.get('format'))
+        except ValueError as e:
+            return JsonResponse({
+                'success': False,
+                'message': str(e)
+            }, status=400)
+        
+        filters = listing.filters_from_request(request.GET)
+        complaints = listing.filter_complaints(
+            Complaint.objects.all(), filters['status'], filters['severity'], filters['search']
+        ).order_by('pk')
+        return exports.export_response(listing.COMPLAINT_EXPORT_COLUMNS, complaints, export_format, 'complaints')
+
+
+class ComplaintTrendView(LoginRequiredMixin, View):
+    """Complaint counts over a date range (JSON), read from the rollup tables"""
+    
+    default_days = 30
+    
+    def get(self, request):
+        today = timezone.localdate()
+        start_date = parse_date(request.GET.get('start', '')) or today - timedelta(days=self.default_days - 1)
+        end_date = parse_date(request.GET.get('end', '')) or today
+        granularity = request.GET.get('granularity', RollupGranularity.DAY)
+        group_by = request.GET.get('by', 'status')
+        
+        if granularity not in RollupGranularity.values:
+            return JsonResponse({
+                'success': False,
+                'message': 'granularity must be HOUR or DAY.'
+            }, status=400)
+        
+        # Whole days, end date included
+        start = timezone.make_aware(datetime.combine(start_date, time.min))
+        end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min))
+        
+        try:
+            data = rollups.trend(start, end, granularity=granularity, group_by=group_by)
+        except ValueError as e:
+            return JsonResponse({
+                'success': False,
+                'message': str(e)
+            }, status=400)
+        
+        return JsonResponse({
+            'success': True,
+            'start': start_date.isoformat(),
+            'end': end_date.isoformat(),
+            'granularity': granularity,
+            'by': group_by,
+            **data,
+        })
+
+
 class ComplaintDetailView(LoginRequiredMixin, View):
     """View complaint details - accessible to all authenticated users"""
     template_name = 'citizen_portal/complaint_detail.html'
     
     def get(self, request, complaint_id):
-        complaint = get_object_or_404(Complaint, complaint_id=complaint_id)
+        complaint = get_object_or_404(Complaint.objects.select_related('asset', 'incident'), complaint_id=complaint_id)
         
         # Calculate progress
         status_progress = {
@@ -334,7 +491,7 @@ class ComplaintResolveView(LoginRequiredMixin, View):
         return super().dispatch(request, *args, **kwargs)
     
     def get(self, request, complaint_id):
-        complaint = get_object_or_404(Complaint, complaint_id=complaint_id)
+        complaint = get_object_or_404(Complaint.objects.select_related('asset'), complaint_id=complaint_id)
         
         # Don't allow resolving already completed complaints
         if complaint.status == 'COMPLETED':
@@ -350,7 +507,7 @@ class ComplaintResolveView(LoginRequiredMixin, View):
         return render(request, self.template_name, context)
     
     def post(self, request, complaint_id):
-        complaint = get_object_or_404(Complaint, complaint_id=complaint_id)
+        complaint = get_object_or_404(Complaint.objects.select_related('asset'), complaint_id=complaint_id)
         form = ComplaintResolutionForm(request.POST, instance=complaint)
         
         if form.is_valid():
@@ -370,4 +527,72 @@ class ComplaintResolveView(LoginRequiredMixin, View):
             'complaint': complaint,
             'form': form,
         }
-        return render(request, self.template_name, context)
\ No newline at end of file
+        return render(request, self.template_name, context)
+
+class IncidentListView(LoginRequiredMixin, View):
+    """Incidents (grouped duplicate complaints), most recently reported first"""
+    template_name = 'citizen_portal/incident_list.html'
+    
+    def get(self, request):
+        status_filter = listing.filters_from_request(request.GET)['status']
+        queryset = Incident.objects.select_related('asset')
+        if status_filter:
+            queryset = queryset.filter(status=status_filter)
+        page = listing.paginate_incidents(queryset, after=request.GET.get('after'), before=request.GET.get('before'))
+        
+        # Filters carried over to the page links
+        query = request.GET.copy()
+        for key in ('after', 'before'):
+            query.pop(key, None)
+        
+        context = {
+            'incidents': page['incidents'],
+            'user_role': request.user.role,
+            'status_filter': status_filter,
+            'next_cursor': page['next_cursor'],
+            'previous_cursor': page['previous_cursor'],
+            'page_query': query.urlencode(),
+        }
+        return render(request, self.template_name, context)
+
+
+class IncidentDetailView(LoginRequiredMixin, View):
+    """An incident and its complaints; operators resolve them all at once"""
+    template_name = 'citizen_portal/incident_detail.html'
+    
+    def render_incident(self, request, incident, form=None):
+        if form is None and request.user.role == 'Operator' and incident.status != 'COMPLETED':
+            form = IncidentResolutionForm(instance=incident)
+        context = {
+            'incident': incident,
+            'complaints': incident.complaints.select_related('asset').order_by('created_at'),
+            'form': form,
+            'user_role': request.user.role,
+        }
+        return render(request, self.template_name, context)
+    
+    def get(self, request, incident_id):
+        incident = get_object_or_404(Incident.objects.select_related('asset'), pk=incident_id)
+        return self.render_incident(request, incident)
+    
+    def post(self, request, incident_id):
+        if request.user.role != 'Operator':
+            messages.error(request, 'Only operators can resolve complaints.')
+            return redirect('citizen_portal:incident_detail', incident_id=incident_id)
+        
+        incident = get_object_or_404(Incident.objects.select_related('asset'), pk=incident_id)
+        if incident.status == 'COMPLETED':
+            messages.warning(request, 'This incident is already resolved.')
+            return redirect('citizen_portal:incident_detail', incident_id=incident_id)
+        
+        form = IncidentResolutionForm(request.POST, instance=incident)
+        if form.is_valid():
+            updated = incidents.resolve(
+                incident,
+                form.cleaned_data['status'],
+                form.cleaned_data['resolution_notes'],
+                request.user.username,
+            )
+            messages.success(request, f'{incident} and {updated} complaint(s) updated to {incident.get_status_display()}.')
+            return redirect('citizen_portal:incident_detail', incident_id=incident_id)
+        return self.render_incident(request, incident, form)
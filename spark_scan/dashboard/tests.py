@@ -1,3 +1,38 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from spark_scan import live
+
+
+class SpoolBrokerTests(SimpleTestCase):
+    """Events reach the tailing workers across spool file rotations"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'live.spool')
+        self.received = []
+        self.publisher = live.SpoolBroker(live.LiveHub(), self.path)
+        self.tailer = live.SpoolBroker(SimpleNamespace(dispatch=self.received.append), self.path)
+
+    def publish(self, numbers):
+        for number in numbers:
+            self.publisher.publish({'number': number, 'padding': 'x' * 40})
+
+    @mock.patch.object(live, 'SPOOL_MAX_BYTES', 300)
+    def test_rotation_keeps_unread_events(self):
+        self.publish(range(2))
+        self.tailer._current = self.tailer._open(at_end=True)
+        self.publish(range(2, 6))
+        self.tailer.poll()
+        # The file is rotated with events the tailer has not read yet
+        self.publish(range(6, 12))
+        self.assertTrue(os.path.exists(self.path + '.1'))
+        self.tailer.poll()
+        self.tailer.poll()
+        self.assertEqual([event['number'] for event in self.received], list(range(2, 12)))
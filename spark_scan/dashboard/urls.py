@@ -1,8 +1,20 @@
 from django.urls import path
-from .views import MapView
+from .views import MapView, MapDataView, MapSyncView, AssetTileView, live_events
 
 app_name = "dashboard"
 
 urlpatterns = [
     path('', MapView.as_view(), name='leaflet-map'),
+
+    # Viewport (bbox) GeoJSON for the map
+    path('data/', MapDataView.as_view(), name='map-data'),
+
+    # Delta sync (changes since a sync token) for open dashboards
+    path('sync/', MapSyncView.as_view(), name='map-sync'),
+
+    # Live push (Server-Sent Events, served by the ASGI app)
+    path('live/', live_events, name='live-events'),
+
+    # Mapbox Vector Tiles of commissioned assets
+    path('tiles/<int:z>/<int:x>/<int:y>', AssetTileView.as_view(), name='asset-tile'),
 ]
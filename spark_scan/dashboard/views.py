@@ -1,78 +1,154 @@
 from django.shortcuts import render
 from django.views import View
-from django.db.models import Count, Q
-from asset.models import Asset
-from citizen_portal.models import Complaint
+from django.http import JsonResponse, HttpResponse, Http404, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+from asset.map_data import parse_bbox, parse_zoom, parse_format, map_data, map_bounds, complaint_stats
+from asset import map_cache, sync, vector_tiles
+from spark_scan import live
+import asyncio
 import json
 
 from django.utils.decorators import method_decorator
 from authentication.permissions import permission_roles
 
-@method_decorator(permission_roles(roles=['Officer', 'Operator']),name='dispatch')    
+
+def map_page_etag(request, *args, **kwargs):
+    # The navbar shows the logged in user, so the page differs per user
+    return map_cache.etag('dashboard-map', request.user.pk)
+
+
+def map_data_etag(request, *args, **kwargs):
+    return map_cache.etag('dashboard-data', request.GET.urlencode())
+
+
+def map_tile_etag(request, z, x, y, *args, **kwargs):
+    # Per tile: a change elsewhere on the map keeps this tile's ETag
+    return vector_tiles.tile_etag(z, x, y, 'full')
+
+
+def map_tile_last_modified(request, z, x, y, *args, **kwargs):
+    return vector_tiles.tile_last_modified(z, x, y)
+
+
+def map_last_modified(request, *args, **kwargs):
+    return map_cache.last_modified()
+
+
+@method_decorator(permission_roles(roles=['Officer', 'Operator']),name='dispatch')
+@method_decorator(condition(etag_func=map_page_etag, last_modified_func=map_last_modified), name='get')
 class MapView(View):
     template_name = 'dashboard/map.html'
-    
+
     def get(self, request, *args, **kwargs):
-        # Get COMMISSIONED assets with GPS coordinates and annotate with complaint counts
-        commissioned_assets = Asset.objects.filter(
-            status='COMMISSIONED',
-            latitude__isnull=False,
-            longitude__isnull=False
-        ).annotate(
-            open_complaints=Count(
-                'complaints',
-                filter=Q(complaints__status__in=['SUBMITTED', 'INSPECTING', 'REPAIRING'])
-            ),
-            total_complaints=Count('complaints')
-        )
-        
-        # Separate poles and transformers
-        poles = commissioned_assets.filter(asset_type='POLE')
-        transformers = commissioned_assets.filter(asset_type='TRANSFORMER')
-        
-        # Prepare poles data for JavaScript
-        poles_data = []
-        for pole in poles:
-            poles_data.append({
-                'id': pole.id,
-                'lat': float(pole.latitude),
-                'lng': float(pole.longitude),
-                'asset_number': pole.asset_number,
-                'location': pole.actual_location or pole.planned_location or 'Unknown',
-                'commissioning_date': pole.commissioning_date.strftime('%Y-%m-%d') if pole.commissioning_date else 'N/A',
-                'status': pole.get_status_display(),
-                'has_complaints': pole.open_complaints > 0,
-                'open_complaints': pole.open_complaints,
-                'total_complaints': pole.total_complaints,
-            })
-        
-        # Prepare transformers data for JavaScript
-        transformers_data = []
-        for transformer in transformers:
-            transformers_data.append({
-                'id': transformer.id,
-                'lat': float(transformer.latitude),
-                'lng': float(transformer.longitude),
-                'asset_number': transformer.asset_number,
-                'location': transformer.actual_location or transformer.planned_location or 'Unknown',
-                'commissioning_date': transformer.commissioning_date.strftime('%Y-%m-%d') if transformer.commissioning_date else 'N/A',
-                'actual_cost': str(transformer.actual_cost) if transformer.actual_cost else 'N/A',
-                'has_complaints': transformer.open_complaints > 0,
-                'open_complaints': transformer.open_complaints,
-                'total_complaints': transformer.total_complaints,
-            })
-        
-        # Calculate complaint statistics
-        all_complaints = Complaint.objects.all()
-        opened_count = all_complaints.filter(status='SUBMITTED').count()
-        active_count = all_complaints.filter(status__in=['INSPECTING', 'REPAIRING']).count()
-        closed_count = all_complaints.filter(status='COMPLETED').count()
-        
+        # Markers are loaded per viewport from MapDataView, only the
+        # overall extent is needed to position the map initially
         context = {
-            'poles': json.dumps(poles_data),
-            'transformers': json.dumps(transformers_data),
-            'opened_count': opened_count,
-            'active_count': active_count,
-            'closed_count': closed_count,
+            'map_data_url': reverse('dashboard:map-data'),
+            'tile_url': vector_tiles.tile_url_template('dashboard:asset-tile'),
+            'tile_min_zoom': vector_tiles.TILE_MIN_ZOOM,
+            'bounds': json.dumps(map_bounds()),
+            'sync_url': reverse('dashboard:map-sync'),
+            'sync_token': sync.latest_token(),
+            'live_url': reverse('dashboard:live-events'),
+            **complaint_stats(),
         }
-        return render(request, self.template_name, context)
\ No newline at end of file
+        response = render(request, self.template_name, context)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+@method_decorator(permission_roles(roles=['Officer', 'Operator']),name='dispatch')
+@method_decorator(condition(etag_func=map_data_etag, last_modified_func=map_last_modified), name='get')
+class MapDataView(View):
+    """GeoJSON of commissioned assets inside the requested map viewport"""
+
+    def get(self, request, *args, **kwargs):
+        try:
+            bbox = parse_bbox(request.GET.get('bbox'))
+            zoom = parse_zoom(request.GET.get('zoom'))
+            payload_format = parse_format(request.GET.get('format'))
+        except ValueError as e:
+            return JsonResponse({
+                'success': False,
+                'message': str(e)
+            }, status=400)
+
+        response = JsonResponse(map_data(bbox, zoom, payload_format=payload_format))
+        # Let the browser revalidate with the ETag instead of refetching
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+@method_decorator(permission_roles(roles=['Officer', 'Operator']),name='dispatch')
+class MapSyncView(View):
+    """Assets and complaint counts changed since the client's sync token"""
+
+    def get(self, request, *args, **kwargs):
+        try:
+            since = sync.parse_token(request.GET.get('since'))
+        except ValueError:
+            return JsonResponse({
+                'success': False,
+                'message': 'since must be a sync token returned by this endpoint.'
+            }, status=400)
+
+        changes = sync.changes_since(since)
+        if changes['assets'] or changes['deleted'] or changes['reset']:
+            changes['stats'] = complaint_stats()
+        return JsonResponse(changes)
+
+
+@method_decorator(permission_roles(roles=['Officer', 'Operator']),name='dispatch')
+@method_decorator(condition(etag_func=map_tile_etag, last_modified_func=map_tile_last_modified), name='get')
+class AssetTileView(View):
+    """Commissioned assets with their dashboard details as a cached Mapbox Vector Tile"""
+
+    def get(self, request, z, x, y, *args, **kwargs):
+        if not vector_tiles.is_valid_tile(z, x, y):
+            raise Http404('Tile out of range')
+
+        response = HttpResponse(
+            vector_tiles.get_tile(z, x, y),
+            content_type='application/vnd.mapbox-vector-tile'
+        )
+        # Full details: browser only, revalidated with the ETag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+# Comment line sent when idle so proxies keep the stream open
+LIVE_KEEPALIVE_SECONDS = 15
+
+
+async def live_events(request):
+    """Server-Sent Events stream of complaint and asset changes (ASGI only)"""
+    user = await request.auser()
+    if not (user.is_authenticated and user.role in ['Officer', 'Operator']):
+        return HttpResponse(status=403)
+
+    # A WSGI worker would be blocked for the lifetime of the stream;
+    # 204 tells EventSource not to reconnect, the page keeps polling
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    async def stream():
+        subscription = live.subscribe()
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), LIVE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            live.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -5,4 +5,10 @@ app_name = 'public_dashboard'
 
 urlpatterns = [
     path('', views.PublicMapView.as_view(), name='public_map'),
-]
\ No newline at end of file
+
+    # Viewport (bbox) GeoJSON for the public map
+    path('map-data/', views.PublicMapDataView.as_view(), name='public_map_data'),
+
+    # Mapbox Vector Tiles of commissioned assets for the public map
+    path('tiles/<int:z>/<int:x>/<int:y>', views.PublicAssetTileView.as_view(), name='public_map_tile'),
+]
@@ -1,68 +1,88 @@
 from django.shortcuts import render
 from django.views import View
-from django.db.models import Count, Q
-from asset.models import Asset
-from citizen_portal.models import Complaint
+from django.http import JsonResponse, HttpResponse, Http404
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from asset.map_data import parse_bbox, parse_zoom, parse_format, map_data, map_bounds, complaint_stats
+from asset import map_cache, vector_tiles
 import json
 
+
+def public_map_etag(request, *args, **kwargs):
+    return map_cache.etag('public-map')
+
+
+def public_map_data_etag(request, *args, **kwargs):
+    return map_cache.etag('public-data', request.GET.urlencode())
+
+
+def public_map_tile_etag(request, z, x, y, *args, **kwargs):
+    # Per tile: a change elsewhere on the map keeps this tile's ETag
+    return vector_tiles.tile_etag(z, x, y, 'public')
+
+
+def map_tile_last_modified(request, z, x, y, *args, **kwargs):
+    return vector_tiles.tile_last_modified(z, x, y)
+
+
+def map_last_modified(request, *args, **kwargs):
+    return map_cache.last_modified()
+
+
+@method_decorator(condition(etag_func=public_map_etag, last_modified_func=map_last_modified), name='get')
 class PublicMapView(View):
     template_name = 'public_dashboard/public_map.html'
-    
+
     def get(self, request, *args, **kwargs):
-        # Get COMMISSIONED assets with GPS coordinates and complaint counts
-        commissioned_assets = Asset.objects.filter(
-            status='COMMISSIONED',
-            latitude__isnull=False,
-            longitude__isnull=False
-        ).annotate(
-            open_complaints=Count(
-                'complaints',
-                filter=Q(complaints__status__in=['SUBMITTED', 'INSPECTING', 'REPAIRING'])
-            ),
-            total_complaints=Count('complaints')
-        )
-        
-        # Separate poles and transformers
-        poles = commissioned_assets.filter(asset_type='POLE')
-        transformers = commissioned_assets.filter(asset_type='TRANSFORMER')
-        
-        # Prepare poles data (public view - minimal info)
-        poles_data = []
-        for pole in poles:
-            poles_data.append({
-                'id': pole.id,
-                'lat': float(pole.latitude),
-                'lng': float(pole.longitude),
-                'asset_number': pole.asset_number,
-                'location': pole.actual_location or pole.planned_location or 'Unknown',
-                'has_complaints': pole.open_complaints > 0,
-                'open_complaints': pole.open_complaints,
-            })
-        
-        # Prepare transformers data (public view - minimal info)
-        transformers_data = []
-        for transformer in transformers:
-            transformers_data.append({
-                'id': transformer.id,
-                'lat': float(transformer.latitude),
-                'lng': float(transformer.longitude),
-                'asset_number': transformer.asset_number,
-                'location': transformer.actual_location or transformer.planned_location or 'Unknown',
-                'has_complaints': transformer.open_complaints > 0,
-                'open_complaints': transformer.open_complaints,
-            })
-        
-        # Calculate complaint statistics for chart
-        all_complaints = Complaint.objects.all()
-        opened_count = all_complaints.filter(status='SUBMITTED').count()
-        active_count = all_complaints.filter(status__in=['INSPECTING', 'REPAIRING']).count()
-        closed_count = all_complaints.filter(status='COMPLETED').count()
-        
+        # Markers are loaded per viewport from PublicMapDataView
         context = {
-            'poles': json.dumps(poles_data),
-            'transformers': json.dumps(transformers_data),
-            'opened_count': opened_count,
-            'active_count': active_count,
-            'closed_count': closed_count,
+            'map_data_url': reverse('public_dashboard:public_map_data'),
+            'tile_url': vector_tiles.tile_url_template('public_dashboard:public_map_tile'),
+            'tile_min_zoom': vector_tiles.TILE_MIN_ZOOM,
+            'bounds': json.dumps(map_bounds()),
+            **complaint_stats(),
         }
-        return render(request, self.template_name, context)
\ No newline at end of file
+        response = render(request, self.template_name, context)
+        patch_cache_control(response, public=True, no_cache=True)
+        return response
+
+
+@method_decorator(condition(etag_func=public_map_data_etag, last_modified_func=map_last_modified), name='get')
+class PublicMapDataView(View):
+    """GeoJSON of commissioned assets inside the viewport (public view - minimal info)"""
+
+    def get(self, request, *args, **kwargs):
+        try:
+            bbox = parse_bbox(request.GET.get('bbox'))
+            zoom = parse_zoom(request.GET.get('zoom'))
+            payload_format = parse_format(request.GET.get('format'))
+            if zoom is None:
+                # Without it any viewport would be answered with single assets
+                raise ValueError('zoom parameter is required.')
+        except ValueError as e:
+            return JsonResponse({
+                'success': False,
+                'message': str(e)
+            }, status=400)
+
+        response = JsonResponse(map_data(bbox, zoom, public=True, payload_format=payload_format))
+        patch_cache_control(response, public=True, no_cache=True)
+        return response
+
+
+@method_decorator(condition(etag_func=public_map_tile_etag, last_modified_func=map_tile_last_modified), name='get')
+class PublicAssetTileView(View):
+    """Commissioned assets as a cached Mapbox Vector Tile (public view - minimal info)"""
+
+    def get(self, request, z, x, y, *args, **kwargs):
+        if not vector_tiles.is_valid_tile(z, x, y):
+            raise Http404('Tile out of range')
+
+        response = HttpResponse(
+            vector_tiles.get_tile(z, x, y, public=True),
+            content_type='application/vnd.mapbox-vector-tile'
+        )
+        patch_cache_control(response, public=True, no_cache=True)
+        return response
@@ -0,0 +1,204 @@
+"""
+Live push of complaint and asset events to open dashboards.
+
+Events are published from ordinary (sync) request code and fanned out to
+the Server-Sent Events streams served by the ASGI application.
+
+LIVE_BROKER selects how events travel between processes:
+
+- ``inprocess`` (default): straight to this process's hub. Enough for a
+  single ASGI worker.
+- ``spool``: appended as JSON lines to LIVE_SPOOL_FILE, which every worker
+  tails into its own hub. A local stand-in for a real broker (Redis etc.)
+  when several workers run on one host.
+
+A full spool file is rotated, not truncated: it is renamed to
+LIVE_SPOOL_FILE.1 and the next event starts a new file. Tailers read
+through an open handle, so they finish the renamed file (and any write
+that raced with the rename) before moving on to the new one. Only a
+tailer that misses a whole file, more than SPOOL_MAX_BYTES published and
+rotated again between two of its polls, loses events.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+
+# Events buffered per subscriber before the oldest are dropped
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# Spool file is rotated once it grows past this size
+SPOOL_MAX_BYTES = 1024 * 1024
+
+SPOOL_POLL_INTERVAL = 0.5
+
+
+class Subscription:
+    """One open event stream: an asyncio queue bound to its event loop"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def deliver(self, event):
+        # Called on the subscriber's loop; slow consumers lose old events
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+
+class LiveHub:
+    """In-process fan-out of events to every subscription"""
+
+    def __init__(self):
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        subscription = Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def dispatch(self, event):
+        """Thread-safe: hand the event to each subscriber's own loop"""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # Loop already closed, the stream is going away
+                self.unsubscribe(subscription)
+
+
+class InProcessBroker:
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def publish(self, event):
+        self.hub.dispatch(event)
+
+    def start(self):
+        pass
+
+
+class SpoolBroker:
+    """Shares events between worker processes through an append-only file"""
+
+    def __init__(self, hub, path):
+        self.hub = hub
+        self.path = path
+        self._started = False
+        self._lock = threading.Lock()
+        # Tailer state: [handle, partial line] of the file being read and
+        # of the rotated one still drained once
+        self._current = None
+        self._rotated = None
+
+    def publish(self, event):
+        line = (json.dumps(event) + '\n').encode('utf-8')
+        # O_APPEND keeps concurrent single-line writes from interleaving
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, line)
+            if os.fstat(fd).st_size > SPOOL_MAX_BYTES:
+                self._rotate(fd)
+        finally:
+            os.close(fd)
+
+    def _rotate(self, fd):
+        try:
+            # Only the file just written to, not one a concurrent publisher
+            # has already started after rotating it
+            if os.stat(self.path).st_ino == os.fstat(fd).st_ino:
+                os.replace(self.path, self.path + '.1')
+        except FileNotFoundError:
+            pass
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._tail, name='live-spool-tail', daemon=True).start()
+
+    def _open(self, at_end=False):
+        """(handle, partial line) of the current spool file, None while there is none"""
+        try:
+            spool = open(self.path, 'rb')
+        except FileNotFoundError:
+            return None
+        if at_end:
+            spool.seek(0, os.SEEK_END)
+        return [spool, b'']
+
+    def _is_rotated(self, segment):
+        try:
+            return os.stat(self.path).st_ino != os.fstat(segment[0].fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _drain(self, segment):
+        """Dispatch the complete lines written since the last read"""
+        data = segment[0].read()
+        if data:
+            *lines, segment[1] = (segment[1] + data).split(b'\n')
+            for line in lines:
+                if line:
+                    self.hub.dispatch(json.loads(line))
+
+    def poll(self):
+        """Dispatch what was appended since the last poll, following rotations"""
+        if self._rotated:
+            # Once more for a publisher that wrote while it was renamed
+            self._drain(self._rotated)
+            self._rotated[0].close()
+            self._rotated = None
+        if self._current is None:
+            self._current = self._open()
+        if self._current is not None:
+            self._drain(self._current)
+            if self._is_rotated(self._current):
+                # Finish it first, the new file is read from its start
+                self._drain(self._current)
+                self._rotated, self._current = self._current, self._open()
+                if self._current is not None:
+                    self._drain(self._current)
+
+    def _tail(self):
+        # Only events published from now on
+        self._current = self._open(at_end=True)
+        while True:
+            self.poll()
+            time.sleep(SPOOL_POLL_INTERVAL)
+
+
+hub = LiveHub()
+
+if getattr(settings, 'LIVE_BROKER', 'inprocess') == 'spool':
+    broker = SpoolBroker(hub, settings.LIVE_SPOOL_FILE)
+else:
+    broker = InProcessBroker(hub)
+
+
+def publish(event_type, **payload):
+    """Send an event to every open dashboard stream"""
+    broker.publish({'type': event_type, 'time': time.time(), **payload})
+
+
+def subscribe():
+    broker.start()
+    return hub.subscribe()
+
+
+def unsubscribe(subscription):
+    hub.unsubscribe(subscription)
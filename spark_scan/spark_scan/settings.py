@@ -46,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so it also counts the queries of the middleware below
+    'spark_scan.sql_budget.SQLBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -86,6 +88,20 @@ DATABASES = {
 }
 
 
+# Cache
+# File based so every worker process sees the same map data version
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'django_cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -143,3 +159,69 @@ EMAIL_HOST_PASSWORD = config("EMAIL_HOST_PASSWORD")
 MEDIA_ROOT = os.path.join(BASE_DIR,"media")
 
 MEDIA_URL = "/media/"
+
+# Site root printed into asset QR codes; empty means the host of the request
+QR_BASE_URL = config("QR_BASE_URL", default="")
+
+# Processes rendering bulk QR labels (see asset/labels.py), default one per CPU
+LABEL_RENDER_WORKERS = config("LABEL_RENDER_WORKERS", default=0, cast=int) or None
+
+# Disk cache for the asset vector tiles (dashboard/tiles/ and tiles/<z>/<x>/<y>)
+MAP_TILE_CACHE_DIR = os.path.join(BASE_DIR, "tile_cache")
+
+# Live dashboard events (see spark_scan/live.py)
+# "inprocess" for a single ASGI worker, "spool" to share events between
+# several workers on one host through LIVE_SPOOL_FILE
+LIVE_BROKER = config("LIVE_BROKER", default="inprocess")
+LIVE_SPOOL_FILE = os.path.join(BASE_DIR, "live_events.spool")
+
+# Complaint full-text search (see citizen_portal/search.py)
+COMPLAINT_SEARCH_BACKEND = config("COMPLAINT_SEARCH_BACKEND", default="citizen_portal.search.FTS5Backend")
+
+# Complaint numbers reserved per counter write and process (see
+# citizen_portal/complaint_ids.py); 1 takes each number in the complaint's
+# own transaction, which keeps the numbers gapless
+COMPLAINT_ID_BLOCK_SIZE = config("COMPLAINT_ID_BLOCK_SIZE", default=1, cast=int)
+
+# Duplicate complaints are grouped into incidents (see
+# citizen_portal/incidents.py): same or nearby asset, similar description,
+# less than this long after the incident's last complaint
+INCIDENT_WINDOW_MINUTES = config("INCIDENT_WINDOW_MINUTES", default=180, cast=int)
+INCIDENT_RADIUS_M = config("INCIDENT_RADIUS_M", default=100, cast=float)
+
+# Resumable chunked complaint photo uploads (see citizen_portal/uploads.py).
+# Chunks wait in COMPLAINT_UPLOAD_DIR until the photo is complete, uploads
+# untouched for COMPLAINT_UPLOAD_EXPIRY_HOURS are removed by
+# cleanup_photo_uploads. A reporter has at most COMPLAINT_UPLOAD_MAX_OPEN
+# unexpired uploads.
+COMPLAINT_UPLOAD_DIR = os.path.join(BASE_DIR, "upload_chunks")
+COMPLAINT_UPLOAD_CHUNK_BYTES = config("COMPLAINT_UPLOAD_CHUNK_BYTES", default=512 * 1024, cast=int)
+COMPLAINT_UPLOAD_MAX_BYTES = config("COMPLAINT_UPLOAD_MAX_BYTES", default=20 * 1024 * 1024, cast=int)
+COMPLAINT_UPLOAD_EXPIRY_HOURS = config("COMPLAINT_UPLOAD_EXPIRY_HOURS", default=24, cast=int)
+COMPLAINT_UPLOAD_MAX_OPEN = config("COMPLAINT_UPLOAD_MAX_OPEN", default=10, cast=int)
+
+# Threads resizing complaint photos after the request (see
+# citizen_portal/images.py); 0 processes them in the request on commit
+COMPLAINT_IMAGE_WORKERS = config("COMPLAINT_IMAGE_WORKERS", default=2, cast=int)
+
+# Per-request SQL accounting (see spark_scan/sql_budget.py): X-SQL-* headers
+# with DEBUG, otherwise logged. Requests above this many queries or with
+# repeated statements log a warning; SQL_BUDGET_LOG_LEVEL=INFO logs them all
+SQL_BUDGET_WARN_QUERIES = config("SQL_BUDGET_WARN_QUERIES", default=30, cast=int)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'spark_scan.sql': {
+            'handlers': ['console'],
+            'level': config("SQL_BUDGET_LOG_LEVEL", default="WARNING"),
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,150 @@
+"""
+Per-request SQL accounting.
+
+SQLBudgetMiddleware counts the queries of every request, their total
+time and the statements run more than once with the same SQL (the
+signature of an N+1 loop). With DEBUG the figures are returned in
+response headers, otherwise they are logged to the ``spark_scan.sql``
+logger: one INFO line per request, WARNING when a request goes over
+SQL_BUDGET_WARN_QUERIES queries or repeats a statement.
+
+Queries are recorded by a database execute wrapper installed on every
+connection, into the collectors of the current context, so the same code
+works for sync and async requests and in tests (see collect()).
+"""
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger('spark_scan.sql')
+
+# Transaction control, repeated by design (not an N+1)
+TRANSACTION_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+
+# Collectors active in this context (nested collect() blocks all record)
+_current = ContextVar('sql_budget_stats', default=())
+
+
+class QueryStats:
+    """Queries seen while collecting: count, total seconds and SQL signatures"""
+
+    def __init__(self):
+        self.count = 0
+        self.transactions = 0
+        self.seconds = 0.0
+        self.signatures = Counter()
+
+    def record(self, sql, seconds):
+        self.seconds += seconds
+        if sql.lstrip().upper().startswith(TRANSACTION_STATEMENTS):
+            # Not counted: how many there are depends on the transaction
+            # nesting (BEGIN or SAVEPOINT), not on the view
+            self.transactions += 1
+            return
+        self.count += 1
+        # Parameters are separate from the SQL, so one signature per statement shape
+        self.signatures[sql] += 1
+
+    @property
+    def duplicates(self):
+        """{sql: times run} for the statements run more than once"""
+        return {sql: times for sql, times in self.signatures.items() if times > 1}
+
+    @property
+    def duplicate_count(self):
+        """Queries that repeated an earlier statement"""
+        return sum(times - 1 for times in self.duplicates.values())
+
+    def summary(self):
+        return f'{self.count} queries in {self.seconds * 1000:.1f} ms, {self.duplicate_count} duplicated'
+
+
+def _record(execute, sql, params, many, context):
+    collectors = _current.get()
+    if not collectors:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        seconds = time.perf_counter() - start
+        for stats in collectors:
+            stats.record(sql, seconds)
+
+
+def _install(connection):
+    if _record not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record)
+
+
+def _install_on_created(sender, connection, **kwargs):
+    _install(connection)
+
+
+def install():
+    """Record on every connection: the ones open in this thread and all new ones"""
+    connection_created.connect(_install_on_created, dispatch_uid='sql_budget')
+    for connection in connections.all(initialized_only=True):
+        _install(connection)
+
+
+@contextmanager
+def collect():
+    """Collect the queries run in this context: ``with collect() as stats: ...``"""
+    install()
+    stats = QueryStats()
+    token = _current.set(_current.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+class SQLBudgetMiddleware:
+    """
+    Query count, SQL time and duplicates of each request, in X-SQL-* headers
+    (DEBUG) or in the log. Streamed bodies run their queries after the
+    response leaves the middleware and are not counted.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with collect() as stats:
+            response = self.get_response(request)
+        return self.report(request, response, stats)
+
+    async def __acall__(self, request):
+        with collect() as stats:
+            response = await self.get_response(request)
+        return self.report(request, response, stats)
+
+    def report(self, request, response, stats):
+        if settings.DEBUG:
+            response['X-SQL-Queries'] = str(stats.count)
+            response['X-SQL-Time-Ms'] = f'{stats.seconds * 1000:.1f}'
+            response['X-SQL-Duplicates'] = str(stats.duplicate_count)
+            return response
+
+        level = logging.INFO
+        if stats.count > settings.SQL_BUDGET_WARN_QUERIES or stats.duplicate_count:
+            level = logging.WARNING
+        logger.log(level, '%s %s: %s', request.method, request.path, stats.summary())
+        for sql, times in stats.duplicates.items():
+            logger.log(level, '  %dx %s', times, sql)
+        return response
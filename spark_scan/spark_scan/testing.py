@@ -0,0 +1,91 @@
+"""
+Helpers shared by the app test suites.
+"""
+import re
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from . import sql_budget
+
+# Tables big enough that reading them whole is a regression
+HOT_TABLES = ('asset_asset', 'citizen_portal_complaint', 'authentication_otp')
+
+# "SCAN <table>", bare or walking an index in order: every row is visited
+# unless a LIMIT stops the walk early (keyset pages)
+_SCAN = re.compile(r'^SCAN (\w+)(?: USING (?:COVERING )?INDEX \w+)?$')
+_LIMIT = re.compile(r'\bLIMIT \d+')
+
+
+def query_plan(sql, params=()):
+    """SQLite EXPLAIN QUERY PLAN of a statement, one detail line per step"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def queryset_plan(queryset):
+    sql, params = queryset.query.sql_with_params()
+    return query_plan(sql, params)
+
+
+def full_scans(plan, tables=HOT_TABLES, limited=False):
+    """Tables the plan reads whole; with limited (a LIMIT query) ordered index walks are fine"""
+    scans = []
+    for line in plan:
+        match = _SCAN.match(line)
+        if match and match.group(1) in tables and not (limited and 'INDEX' in line):
+            scans.append(match.group(1))
+    return scans
+
+
+class QueryPlanMixin:
+    """
+    TestCase mixin checking the SQLite query plans of the queries a view
+    or a queryset runs: reading a hot table whole fails the test.
+    """
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset_plan(queryset)
+        self.assertTrue(any(index in line for line in plan), f'{index} not used:\n' + '\n'.join(plan))
+
+    def assertNoFullScan(self, queryset):
+        plan = queryset_plan(queryset)
+        limited = queryset.query.high_mark is not None
+        self.assertEqual(full_scans(plan, limited=limited), [], '\n'.join(plan))
+
+    def assertViewNoFullScan(self, client, url, data=None, allowed=()):
+        """GET url and check the plan of every SELECT it ran; allowed lists tables it may scan whole"""
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url, data)
+            if response.streaming:
+                # Streamed bodies run their queries while being read
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 400, url)
+
+        tables = [table for table in HOT_TABLES if table not in allowed]
+        for query in context.captured_queries:
+            if not query['sql'].startswith('SELECT'):
+                continue
+            plan = query_plan(query['sql'])
+            limited = bool(_LIMIT.search(query['sql']))
+            self.assertEqual(full_scans(plan, tables, limited), [], f"{url}: {query['sql']}\n" + '\n'.join(plan))
+        return response
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin for per-view query budgets: the request must stay within
+    a number of queries and must not run any statement twice (N+1).
+    """
+
+    def assertQueryBudget(self, client, url, budget, data=None, method='get', duplicates=0, **extra):
+        """Request url, check the budget and return the response"""
+        with sql_budget.collect() as stats:
+            response = getattr(client, method)(url, data, **extra)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        repeated = '\n'.join(f'{times}x {sql}' for sql, times in stats.duplicates.items())
+        self.assertLessEqual(stats.count, budget, f'{method.upper()} {url}: {stats.summary()}\n{repeated}')
+        self.assertLessEqual(stats.duplicate_count, duplicates, f'{method.upper()} {url}: repeated queries\n{repeated}')
+        return response